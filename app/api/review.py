@@ -0,0 +1,87 @@
+import os
+from functools import partial
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import BaseModel
+
+from app.core.jobs import QueueFullError
+from app.core.worktree import autofix_in_worktree
+from scripts.ai_review import run_review
+
+router = APIRouter()
+
+
+class ReviewRequest(BaseModel):
+    base_sha: str = ""
+    head_sha: str = ""
+    diff: Optional[str] = None
+    pr_number: Optional[str] = None
+
+
+class AutofixRequest(BaseModel):
+    base_sha: str = ""
+    head_sha: str = ""
+    diff: Optional[str] = None
+    review: Optional[dict] = None
+    review_job_id: Optional[str] = None
+    pr_number: Optional[str] = None
+    run_id: Optional[str] = None
+
+
+def require_token(authorization: str = Header(default="")) -> None:
+    token = os.environ.get("AI_SERVICE_TOKEN", "").strip()
+    if token and authorization != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="invalid token")
+
+
+def _submit(request: Request, kind: str, func) -> dict:
+    try:
+        job = request.app.state.jobs.submit(kind, func)
+    except QueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+
+@router.post("/review", status_code=202, dependencies=[Depends(require_token)])
+async def submit_review(body: ReviewRequest, request: Request) -> dict:
+    if body.diff is None and not (body.base_sha and body.head_sha):
+        raise HTTPException(status_code=422, detail="base_sha and head_sha, or diff, is required")
+    config = request.app.state.config.get()
+    # Review state is kept per PR; jobs without one must not read or overwrite a shared "local" state.
+    func = partial(
+        run_review, body.base_sha, body.head_sha, body.diff, body.pr_number, config, keep_state=bool(body.pr_number)
+    )
+    return _submit(request, "review", func)
+
+
+@router.post("/autofix", status_code=202, dependencies=[Depends(require_token)])
+async def submit_autofix(body: AutofixRequest, request: Request) -> dict:
+    review = body.review
+    base_sha, head_sha = body.base_sha, body.head_sha
+    if review is None and body.review_job_id:
+        job = request.app.state.jobs.get(body.review_job_id)
+        if job is None or job.kind != "review" or job.status != "done":
+            raise HTTPException(status_code=409, detail="review job is not finished")
+        review = job.result
+        base_sha = base_sha or review.get("base_sha", "")
+        head_sha = head_sha or review.get("head_sha", "")
+    if not base_sha or (body.diff is None and not head_sha):
+        raise HTTPException(status_code=422, detail="base_sha and head_sha, or base_sha and diff, is required")
+    policy = request.app.state.config.get()[0]
+    # Jobs run in their own worktree at the PR head and return the fix as a patch.
+    func = partial(autofix_in_worktree, base_sha, head_sha, body.diff, review, body.pr_number, body.run_id, policy)
+    return _submit(request, "autofix", func)
+
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(require_token)])
+async def get_job(job_id: str, request: Request) -> dict:
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.to_dict()
+
+
+@router.get("/jobs", dependencies=[Depends(require_token)])
+async def job_stats(request: Request) -> dict:
+    return request.app.state.jobs.stats()
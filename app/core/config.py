@@ -1,2 +1,29 @@
-# Placeholder for future config
+from pathlib import Path
+from typing import Any, Callable, Optional
+
 APP_NAME = "AutoReview-AI"
+
+
+class WarmConfig:
+    def __init__(self, loader: Callable[[], Any], paths: list[Path]) -> None:
+        self.loader = loader
+        self.paths = paths
+        self._stamp: Optional[tuple] = None
+        self._value: Any = None
+
+    def _current_stamp(self) -> tuple:
+        stamp = []
+        for path in self.paths:
+            try:
+                stamp.append(path.stat().st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def get(self) -> Any:
+        # Parsed once and reused; a config edit on disk is picked up by the next job.
+        stamp = self._current_stamp()
+        if stamp != self._stamp:
+            self._value = self.loader()
+            self._stamp = stamp
+        return self._value
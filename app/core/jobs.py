@@ -0,0 +1,109 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from scripts.ai_common import RequestLimiter, use_request_limiter
+from scripts.ai_metrics import Metrics, use_metrics
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = "queued"
+    created_at: str = field(default_factory=_now)
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobPool:
+    def __init__(
+        self,
+        workers: int = 2,
+        queue_size: int = 32,
+        max_retained: int = 500,
+        limiter: Optional[RequestLimiter] = None,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.max_retained = max(1, max_retained)
+        # Built once for the service; every job's API calls share its limits.
+        self.limiter = limiter
+        self.jobs: dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, kind: str, func: Callable[[], dict]) -> Job:
+        job = Job(id=uuid.uuid4().hex, kind=kind)
+        try:
+            self._queue.put_nowait((job, func))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"job queue is full ({self.queue_size})") from None
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> dict:
+        counts: dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0, "jobs": counts}
+
+    def _prune(self) -> None:
+        finished = [j for j in self.jobs.values() if j.status in ("done", "failed")]
+        for job in finished[: max(0, len(self.jobs) - self.max_retained)]:
+            del self.jobs[job.id]
+
+    async def _run(self, job: Job, func: Callable[[], dict]) -> None:
+        job.status = "running"
+        job.started_at = _now()
+        try:
+            # Each job gets its own metrics collector (and run deadline) so concurrent jobs do not mix numbers.
+            job.result = await asyncio.to_thread(_run_job, func, self.limiter)
+            job.status = "done"
+        except Exception as exc:
+            job.status = "failed"
+            job.error = f"{exc.__class__.__name__}: {exc}"
+        finally:
+            job.finished_at = _now()
+
+    async def _worker(self) -> None:
+        while True:
+            job, func = await self._queue.get()
+            try:
+                await self._run(job, func)
+            finally:
+                self._queue.task_done()
+
+
+def _run_job(func: Callable[[], Any], limiter: Optional[RequestLimiter]) -> Any:
+    with use_metrics(Metrics()), use_request_limiter(limiter):
+        return func()
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from scripts.ai_cache import cache_dir
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+EXCLUDED_FROM_PATCH = (":(exclude).ai_cache",)
+# -P keeps the worktree (the PR's code) off sys.path: only the service's own scripts ever run.
+CHILD_COMMAND = [
+    sys.executable,
+    "-P",
+    "-c",
+    f"import sys; sys.path.insert(0, {str(ROOT_DIR)!r}); from app.core.worktree import child_main; child_main()",
+]
+
+
+def _git(args: list[str], cwd: Optional[Path] = None, input_text: Optional[str] = None) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, input=input_text, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {args[0]} failed: {result.stderr.strip()[:500]}")
+    return result.stdout
+
+
+def autofix_in_worktree(
+    base_sha: str,
+    head_sha: str,
+    diff: Optional[str],
+    review: Optional[dict],
+    pr_number: Optional[str],
+    run_id: Optional[str],
+    policy: dict,
+) -> dict:
+    # Each job gets a throwaway checkout of the PR head; the service's own tree is never touched and
+    # the fix comes back as a patch instead of staying applied.
+    with tempfile.TemporaryDirectory(prefix="autofix-") as tmp:
+        tree = Path(tmp) / "tree"
+        _git(["worktree", "add", "--detach", "--quiet", str(tree), head_sha if diff is None else base_sha])
+        try:
+            if diff is not None:
+                _git(["apply", "--index", "--whitespace=nowarn", "-"], cwd=tree, input_text=diff)
+                _git(
+                    ["-c", "user.name=autofix", "-c", "user.email=autofix@localhost", "commit", "-q", "--no-verify", "-m", "input diff"],
+                    cwd=tree,
+                )
+            payload = Path(tmp) / "job.json"
+            output = Path(tmp) / "result.json"
+            payload.write_text(
+                json.dumps(
+                    {
+                        "base_sha": base_sha,
+                        "review": review,
+                        "pr_number": pr_number,
+                        "run_id": run_id,
+                        "policy": policy,
+                        "output": str(output),
+                    },
+                    ensure_ascii=False,
+                ),
+                encoding="utf-8",
+            )
+            env = {**os.environ, "AI_CACHE_DIR": str(cache_dir(policy).resolve())}
+            child = subprocess.run([*CHILD_COMMAND, str(payload)], cwd=tree, env=env, capture_output=True, text=True)
+            if child.returncode != 0:
+                raise RuntimeError(f"autofix exited with {child.returncode}: {child.stderr.strip()[-1000:]}")
+            result = json.loads(output.read_text(encoding="utf-8"))
+            _git(["add", "-A", "--", ".", *EXCLUDED_FROM_PATCH], cwd=tree)
+            result["patch"] = _git(["diff", "--cached", "--binary", "HEAD"], cwd=tree)
+            result["base_sha"] = base_sha
+            result["head_sha"] = head_sha
+            return result
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", str(tree)], capture_output=True)
+
+
+def child_main() -> None:
+    from scripts.ai_autofix import run_autofix
+
+    job = json.loads(Path(sys.argv[1]).read_text(encoding="utf-8"))
+    result = run_autofix(job["base_sha"], job["review"], job["pr_number"], job["run_id"], job["policy"])
+    Path(job["output"]).write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
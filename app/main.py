@@ -1,6 +1,38 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from app.api.health import router as health_router
+from app.api.review import router as review_router
+from app.core.config import WarmConfig
+from app.core.jobs import JobPool
+from scripts.ai_common import RequestLimiter, get_http_session
+from scripts.ai_config import config_sources
+from scripts.ai_review import load_review_config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    config = WarmConfig(load_review_config, config_sources())
+    policy = config.get()[0]
+    service_cfg = policy.get("service", {})
+    get_http_session(int(policy.get("ai", {}).get("retry", {}).get("pool_maxsize", 8)))
+    jobs = JobPool(
+        workers=int(service_cfg.get("workers", 2)),
+        queue_size=int(service_cfg.get("queue_size", 32)),
+        max_retained=int(service_cfg.get("max_retained_jobs", 500)),
+        limiter=RequestLimiter(
+            int(service_cfg.get("max_in_flight_requests", 0) or 0),
+            float(service_cfg.get("requests_per_minute", 0) or 0),
+        ),
+    )
+    await jobs.start()
+    app.state.config = config
+    app.state.jobs = jobs
+    yield
+    await jobs.stop()
+
 
-app = FastAPI(title="AutoReview-AI", version="0.1.0")
+app = FastAPI(title="AutoReview-AI", version="0.1.0", lifespan=lifespan)
 
 app.include_router(health_router, tags=["health"])
+app.include_router(review_router, tags=["review"])
@@ -0,0 +1,129 @@
+﻿from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts.ai_diff import (
+    ShardPacker,
+    compact_diff,
+    compact_file_diff,
+    compaction_stats,
+    iter_file_diffs,
+    parse_unified_diff,
+    shard_diff,
+)
+
+MODES = ("text", "stream", "ranges")
+HUNKS_PER_FILE = 40
+SHARD_MAX_TOKENS = 24_000
+MAX_SHARDS = 50
+EXCLUDE_GLOBS = ["*.lock", "vendor/*"]
+
+
+def generate_diff(path: Path, size_mb: int) -> int:
+    target = size_mb * 1024 * 1024
+    written = files = 0
+    with path.open("w", encoding="utf-8") as out:
+        while written < target:
+            name = f"src/pkg{files % 50}/mod_{files}.py"
+            parts = [f"diff --git a/{name} b/{name}\nindex 1111111..2222222 100644\n--- a/{name}\n+++ b/{name}\n"]
+            for h in range(HUNKS_PER_FILE):
+                start = h * 20 + 1
+                parts.append(f"@@ -{start},8 +{start},8 @@ def handler_{h}(request):\n")
+                parts.extend(f"     context_{files}_{h}_{n} = load(request, {n})\n" for n in range(3))
+                parts.extend(f"-    value_{files}_{h}_{n} = compute(request, {n})\n" for n in range(2))
+                parts.extend(f"+    value_{files}_{h}_{n} = compute(request, {n}) + 1\n" for n in range(2))
+                parts.extend(f"     tail_{files}_{h}_{n} = store(request, {n})\n" for n in range(3))
+            chunk = "".join(parts)
+            out.write(chunk)
+            written += len(chunk)
+            files += 1
+    return files
+
+
+def run_mode(mode: str, diff_path: Path) -> int:
+    # Mirrors what the review did before and after streaming: capture, parse, compact, shard.
+    if mode == "text":
+        diff_text = diff_path.read_text(encoding="utf-8")
+        files = len(parse_unified_diff(diff_text))
+        compacted, _ = compact_diff(diff_text, EXCLUDE_GLOBS, 1)
+        shards = shard_diff(compacted, SHARD_MAX_TOKENS)[:MAX_SHARDS]
+        print(f"files={files} shards={len(shards)}")
+        return 0
+    with diff_path.open(encoding="utf-8", errors="replace") as handle:
+        lines = (line[:-1] if line.endswith("\n") else line for line in handle)
+        if mode == "ranges":
+            file_diffs = list(iter_file_diffs(lines, keep_lines=False))
+            print(f"files={len(file_diffs)} hunks={sum(len(fd.hunks) for fd in file_diffs)}")
+            return 0
+        stats = compaction_stats()
+        packer = ShardPacker(SHARD_MAX_TOKENS, MAX_SHARDS)
+        files = 0
+        for file_diff in iter_file_diffs(lines):
+            files += 1
+            compacted = compact_file_diff(file_diff, EXCLUDE_GLOBS, 1, stats)
+            if compacted is not None:
+                packer.add(compacted)
+        shards = packer.finish()
+    print(f"files={files} shards={len(shards)} (+{packer.skipped} counted)")
+    return 0
+
+
+def measure(mode: str, diff_path: Path) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, __file__, "--run-mode", mode, "--diff", str(diff_path)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    # wait4 reports the child's own peak RSS rather than the max over every child so far.
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    output = proc.stdout.read().strip()
+    proc.stdout.close()
+    peak_kb = usage.ru_maxrss if sys.platform != "darwin" else usage.ru_maxrss // 1024
+    return {
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "wall_sec": round(wall, 2),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "output": output,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Peak memory of whole-text vs streamed diff parsing")
+    parser.add_argument("--size-mb", type=int, default=500)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--diff", type=Path, help="existing diff file; generated when omitted")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        return run_mode(args.run_mode, args.diff)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        diff_path = args.diff
+        if diff_path is None:
+            diff_path = Path(tmp) / "bench.diff"
+            start = time.perf_counter()
+            files = generate_diff(diff_path, args.size_mb)
+            print(f"generated {diff_path.stat().st_size / 1024 / 1024:.0f} MB diff, {files} files "
+                  f"in {time.perf_counter() - start:.1f}s")
+        for mode in (m.strip() for m in args.modes.split(",") if m.strip()):
+            result = measure(mode, diff_path)
+            status = "ok" if result["exit_code"] == 0 else f"exit {result['exit_code']}"
+            print(f"{mode:>7}: {result['wall_sec']:.2f}s  peak {result['peak_rss_mb']:.0f}MB  {status}  {result['output']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
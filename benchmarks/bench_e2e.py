@@ -0,0 +1,200 @@
+﻿from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.fake_responses import FakeResponses
+
+BASELINE_PATH = ROOT_DIR / "benchmarks" / "baseline_e2e.json"
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+LINES_PER_FILE = 200
+CHANGES_PER_FILE = 100
+
+
+def git(repo: Path, *args: str) -> str:
+    result = subprocess.run(["git", *args], cwd=repo, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def bench_policy() -> dict:
+    policy = yaml.safe_load((ROOT_DIR / "config" / "review-policy.yaml").read_text(encoding="utf-8-sig")) or {}
+    # Measure the pipelines, not their sleeps: no autofix backoff and short network backoff.
+    policy.setdefault("autofix", {})["retry_backoff_sec"] = 0
+    policy.setdefault("ai", {}).setdefault("retry", {}).update({"backoff_base_sec": 0.05, "backoff_max_sec": 0.5})
+    return policy
+
+
+def generate_repo(root: Path, changed_lines: int) -> tuple[str, str]:
+    root.mkdir(parents=True)
+    git(root, "init", "-q")
+    git(root, "config", "user.email", "bench@example.com")
+    git(root, "config", "user.name", "bench")
+    shutil.copytree(ROOT_DIR / "config", root / "config")
+    (root / "config" / "review-policy.yaml").write_text(
+        yaml.safe_dump(bench_policy(), allow_unicode=True, sort_keys=False), encoding="utf-8"
+    )
+
+    per_file = min(changed_lines, CHANGES_PER_FILE)
+    files = max(1, -(-changed_lines // CHANGES_PER_FILE))
+    for i in range(files):
+        path = root / "src" / f"pkg{i % 20}" / f"mod_{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(f"value_{n} = compute({n})\n" for n in range(LINES_PER_FILE)), encoding="utf-8")
+    git(root, "add", "-A")
+    git(root, "commit", "-q", "-m", "base")
+    base_sha = git(root, "rev-parse", "HEAD")
+
+    remaining = changed_lines
+    for i in range(files):
+        path = root / "src" / f"pkg{i % 20}" / f"mod_{i}.py"
+        count = min(per_file, remaining)
+        remaining -= count
+        # Every other line changes so hunks stay separate and context is realistic.
+        step = max(1, LINES_PER_FILE // max(1, count))
+        changed = set(range(0, step * count, step))
+        lines = [
+            f"value_{n} = compute({n}) + {n % 7}\n" if n in changed else f"value_{n} = compute({n})\n"
+            for n in range(LINES_PER_FILE)
+        ]
+        path.write_text("".join(lines), encoding="utf-8")
+    git(root, "commit", "-q", "-am", "head")
+    return base_sha, git(root, "rev-parse", "HEAD")
+
+
+def run_pipeline(script: str, repo: Path, env: dict) -> dict:
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, str(ROOT_DIR / "scripts" / script)],
+            cwd=repo,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+        )
+        # wait4 reports the child's own peak RSS rather than the max over every child so far.
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code != 0:
+            stderr.seek(0)
+            tail = stderr.read().decode("utf-8", errors="replace")[-2000:]
+            raise RuntimeError(f"{script} exited with {exit_code}:\n{tail}")
+    peak_kb = usage.ru_maxrss if sys.platform != "darwin" else usage.ru_maxrss // 1024
+    return {"wall_sec": round(wall, 3), "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def bench_size(changed_lines: int, fake: FakeResponses, base_url: str, workdir: Path) -> dict:
+    repo = workdir / f"repo-{changed_lines}"
+    base_sha, head_sha = generate_repo(repo, changed_lines)
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": base_url,
+        "AI_CACHE_DISABLE": "1",
+        "AI_REVIEW_FULL": "1",
+        "BASE_SHA": base_sha,
+        "HEAD_SHA": head_sha,
+        "AI_REVIEW_OUTPUT": str(workdir / f"review-{changed_lines}.json"),
+        "AI_REVIEW_INPUT": str(workdir / f"review-{changed_lines}.json"),
+        "AI_AUTOFIX_OUTPUT": str(workdir / f"autofix-{changed_lines}.json"),
+    }
+    env.pop("OPENAI_MODEL", None)
+
+    result: dict = {}
+    for name, script in (("review", "ai_review.py"), ("autofix", "ai_autofix.py")):
+        fake.reset()
+        measured = run_pipeline(script, repo, env)
+        measured["api_calls"] = fake.stats["requests"]
+        result[name] = measured
+    shutil.rmtree(repo, ignore_errors=True)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    for size, pipelines in results.items():
+        for name, measured in pipelines.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            for metric in ("wall_sec", "peak_rss_mb"):
+                if base[metric] > 0 and measured[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{size} lines {name}: {metric} {measured[metric]} > baseline {base[metric]} (+{tolerance:.0%})"
+                    )
+            if measured["api_calls"] > base["api_calls"]:
+                regressions.append(f"{size} lines {name}: api_calls {measured['api_calls']} > baseline {base['api_calls']}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end review/autofix benchmark against a fake Responses API")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated changed-line counts")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    fake = FakeResponses(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_every=args.rate_limit_every,
+    )
+    base_url = fake.start()
+    results: dict[str, dict] = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for size in sizes:
+                results[str(size)] = bench_size(size, fake, base_url, Path(tmp))
+                row = results[str(size)]
+                print(
+                    f"{size:>7} lines  "
+                    + "  ".join(
+                        f"{name}: {m['wall_sec']:.2f}s {m['peak_rss_mb']:.0f}MB {m['api_calls']} calls"
+                        for name, m in row.items()
+                    )
+                )
+    finally:
+        fake.stop()
+
+    if args.update_baseline:
+        baseline = {
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "settings": {"latency_ms": args.latency_ms, "error_rate": args.error_rate},
+            "results": results,
+        }
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+        print(f"Wrote baseline to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("no baseline; run with --update-baseline to record one")
+        return 0
+    regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
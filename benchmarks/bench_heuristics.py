@@ -0,0 +1,69 @@
+﻿from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts.ai_review import RULES_DIR, detect_issues
+from scripts.ai_rules import load_heuristic_rules
+
+TOKENS = ["value", "result", "items", "TODO_SECURITY", "NPLUS1", "auth", "return", "for", "x" * 40]
+
+
+def generate_files(root: Path, count: int, lines: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    files: list[str] = []
+    for i in range(count):
+        path = root / f"pkg{i % 50}" / f"mod_{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        body = "\n".join(" ".join(rng.choice(TOKENS) for _ in range(rng.randint(1, 8))) for _ in range(lines))
+        path.write_text(body + "\n", encoding="utf-8")
+        files.append(str(path))
+    return files
+
+
+def measure(files: list[str], rules: list, workers: int, chunk_size: int, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    hits = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = len(detect_issues(files, rules, workers=workers, chunk_size=chunk_size))
+        best = min(best, time.perf_counter() - start)
+    return best, hits
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serial vs process-pool heuristic scan throughput")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rules = load_heuristic_rules(ROOT_DIR / RULES_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = generate_files(Path(tmp), args.files, args.lines, seed=1)
+        serial_sec, serial_hits = measure(files, rules, 1, args.chunk_size, args.repeat)
+        parallel_sec, parallel_hits = measure(files, rules, args.workers, args.chunk_size, args.repeat)
+
+    if serial_hits != parallel_hits:
+        print(f"hit count mismatch: serial={serial_hits} parallel={parallel_hits}")
+        return 1
+    print(f"files={args.files} lines/file={args.lines} hits={serial_hits}")
+    print(f"serial:   {serial_sec:.3f}s  {args.files / serial_sec:,.0f} files/s")
+    print(f"parallel: {parallel_sec:.3f}s  {args.files / parallel_sec:,.0f} files/s  (workers={args.workers})")
+    print(f"speedup:  {serial_sec / parallel_sec:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+﻿from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ("requests", "yaml", "urllib3", "concurrent.futures.process")
+DEFAULT_TARGET_MS = 200.0
+
+
+def git(repo: Path, *args: str) -> str:
+    result = subprocess.run(["git", *args], cwd=repo, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def import_profile(module: str) -> dict[str, int]:
+    # -X importtime writes "import time: self | cumulative | name" per module to stderr.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        cumulative[parts[2].strip()] = int(parts[1])
+    return cumulative
+
+
+def make_repo(root: Path, files: int) -> tuple[str, str]:
+    root.mkdir(parents=True)
+    git(root, "init", "-q")
+    git(root, "config", "user.email", "bench@example.com")
+    git(root, "config", "user.name", "bench")
+    shutil.copytree(ROOT_DIR / "config", root / "config")
+    for i in range(files):
+        path = root / "src" / f"mod_{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(f"value_{n} = compute({n})\n" for n in range(200)), encoding="utf-8")
+    git(root, "add", "-A")
+    git(root, "commit", "-q", "-m", "base")
+    base_sha = git(root, "rev-parse", "HEAD")
+    for i in range(files):
+        path = root / "src" / f"mod_{i}.py"
+        path.write_text(path.read_text(encoding="utf-8").replace("value_7 ", "value_7 = 1  # TODO_SECURITY\nv "), encoding="utf-8")
+    git(root, "commit", "-q", "-am", "head")
+    return base_sha, git(root, "rev-parse", "HEAD")
+
+
+def time_run(command: list[str], cwd: Path, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import time and no-API wall time of ai_review.py/ai_autofix.py")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--files", type=int, default=5, help="changed files in the synthetic PR")
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS, help="median warm no-API review wall time")
+    args = parser.parse_args()
+
+    for module in ("scripts.ai_review", "scripts.ai_autofix"):
+        profile = import_profile(module)
+        heavy = [name for name in HEAVY_MODULES if name in profile]
+        print(f"{module}: import {profile.get(module, 0) / 1000:.1f}ms  heavy modules loaded: {', '.join(heavy) or 'none'}")
+        if module == "scripts.ai_review":
+            ranked = sorted(((us, name) for name, us in profile.items() if name != module), reverse=True)
+            for us, name in ranked[: args.top]:
+                print(f"  {us / 1000:8.1f}ms  {name}")
+
+    env = {**os.environ, "AI_HEURISTIC_WORKERS": "1"}
+    env.pop("OPENAI_API_KEY", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp) / "repo"
+        base_sha, head_sha = make_repo(repo, args.files)
+        env.update({"BASE_SHA": base_sha, "HEAD_SHA": head_sha, "AI_REVIEW_OUTPUT": str(Path(tmp) / "review.json")})
+        floor = [time_run([sys.executable, "-c", "pass"], repo, env) for _ in range(args.repeat)]
+        review = [sys.executable, str(ROOT_DIR / "scripts" / "ai_review.py")]
+        cold: list[float] = []
+        for _ in range(max(1, args.repeat // 3)):
+            shutil.rmtree(repo / ".ai_cache" / "config", ignore_errors=True)
+            cold.append(time_run(review, repo, env))
+        warm = [time_run(review, repo, env) for _ in range(args.repeat)]
+
+    print(f"interpreter floor:          median {statistics.median(floor):7.1f}ms")
+    print(f"review, config compiled:    median {statistics.median(cold):7.1f}ms")
+    print(f"review, cached bundle:      median {statistics.median(warm):7.1f}ms  (target {args.target_ms:.0f}ms)")
+    if statistics.median(warm) > args.target_ms:
+        print("REGRESSION no-API review startup over target")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,254 @@
+﻿from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+BLOCKING_AGENTS = {"SecurityAgent", "BugRiskAgent"}
+CACHE_BLOCK_TOKENS = 128
+
+
+def _split_review_prompt(prompt: str) -> tuple[dict, dict]:
+    shared_text, _, task_text = prompt.partition("\n\n[AGENT TASK]\n")
+    try:
+        shared = json.loads(shared_text.removeprefix("[SHARED CONTEXT]\n"))
+        task = json.loads(task_text) if task_text else {}
+    except ValueError:
+        return {}, {}
+    return shared, task
+
+
+def auto_reply(request: dict) -> dict:
+    prompt = str(request.get("input", ""))
+    if prompt.startswith("[SHARED CONTEXT]"):
+        shared, task = _split_review_prompt(prompt)
+        agent = task.get("agent", "")
+        if agent == "SummaryAgent":
+            count = len(task.get("aggregated", {}).get("comments", []))
+            return {"summary": f"fake summary ({count} comments)", "blocking": False}
+        files = shared.get("changed_files", [])
+        comments = []
+        if files and agent in BLOCKING_AGENTS:
+            level = "blocking" if agent == "SecurityAgent" else "warn"
+            comments.append({"path": files[0], "line": 1, "agent": agent, "level": level, "body": "fake finding"})
+        blocking = any(c["level"] == "blocking" for c in comments)
+        return {"summary": f"{agent} ok", "comments": comments, "blocking": blocking}
+
+    try:
+        task = json.loads(prompt)
+    except ValueError:
+        task = {}
+    windows = task.get("source_windows") or []
+    if windows and windows[0].get("text"):
+        start = int(windows[0]["start_line"])
+        first = windows[0]["text"].split("\n")[0]
+        path = task.get("path", "")
+        patch = f"--- a/{path}\n+++ b/{path}\n@@ -{start},1 +{start},1 @@\n-{first}\n+{first}  # fixed\n"
+        return {"apply_patch": patch, "change_summary": f"fix {path}", "files_changed": [path]}
+    return {"apply_patch": "", "change_summary": "no changes", "files_changed": []}
+
+
+class FakeResponses:
+    def __init__(
+        self,
+        reply: dict | Callable[[dict], dict] | None = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_every: int = 0,
+        retry_after_sec: float = 0.0,
+        seed: int = 0,
+        stream_chunk_chars: int = 16,
+        stream_chunk_ms: float = 0.0,
+    ) -> None:
+        self.reply = reply or auto_reply
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_every = rate_limit_every
+        self.retry_after_sec = retry_after_sec
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self.stream_chunk_ms = stream_chunk_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefixes: set[int] = set()
+        self._server: ThreadingHTTPServer | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "client_aborts": 0}
+            self._prefixes.clear()
+
+    def _decide(self, prompt: str) -> tuple[int, float, int]:
+        with self._lock:
+            self.stats["requests"] += 1
+            number = self.stats["requests"]
+            delay = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+            if self.rate_limit_every and number % self.rate_limit_every == 0:
+                self.stats["rate_limited"] += 1
+                return 429, delay, 0
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, delay, 0
+            self.stats["ok"] += 1
+            # Mimic provider prompt caching: a repeated shared prefix is billed as cached input.
+            shared = prompt.partition("\n\n[AGENT TASK]\n")[0] if prompt.startswith("[SHARED CONTEXT]") else ""
+            cached = 0
+            if shared:
+                key = hash(shared)
+                if key in self._prefixes:
+                    cached = len(shared) // 4 // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+                self._prefixes.add(key)
+            return 200, delay, cached
+
+    def respond(self, request: dict) -> tuple[int, dict, dict]:
+        prompt = str(request.get("input", ""))
+        status, delay, cached = self._decide(prompt)
+        if delay > 0:
+            time.sleep(delay)
+        if status == 429:
+            return status, {"Retry-After": str(self.retry_after_sec)}, {"error": {"message": "rate limited"}}
+        if status != 200:
+            return status, {}, {"error": {"message": "injected failure"}}
+        reply = self.reply(request) if callable(self.reply) else self.reply
+        text = json.dumps(reply, ensure_ascii=False)
+        body = {
+            "object": "response",
+            "model": request.get("model", ""),
+            "output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}],
+            "usage": {
+                "input_tokens": len(prompt) // 4,
+                "input_tokens_details": {"cached_tokens": cached},
+                "output_tokens": len(text) // 4,
+            },
+        }
+        return status, {}, body
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_port}/v1"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _handler(fake: FakeResponses) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Any, headers: dict | None = None) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _event(self, payload: dict) -> None:
+            data = f"event: {payload['type']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _stream(self, body: dict) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            # Chunked like the real API, so clients see every event as it is sent and can hang up mid-stream.
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.close_connection = True
+            text = body["output"][0]["content"][0]["text"]
+            step = fake.stream_chunk_chars
+            try:
+                self._event({"type": "response.created", "response": {"status": "in_progress"}})
+                for i in range(0, len(text), step):
+                    if fake.stream_chunk_ms:
+                        time.sleep(fake.stream_chunk_ms / 1000)
+                    self._event({"type": "response.output_text.delta", "delta": text[i : i + step]})
+                self._event({"type": "response.output_text.done", "text": text})
+                self._event({"type": "response.completed", "response": body})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                with fake._lock:
+                    fake.stats["client_aborts"] += 1
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            if self.path.rstrip("/") != "/v1/responses":
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            try:
+                request = json.loads(raw)
+            except ValueError:
+                self._send(400, {"error": {"message": "invalid json"}})
+                return
+            status, headers, body = fake.respond(request)
+            if status == 200 and request.get("stream"):
+                self._stream(body)
+            else:
+                self._send(status, body, headers)
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") == "/stats":
+                self._send(200, fake.stats)
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI /v1/responses endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--retry-after-sec", type=float, default=0.0)
+    parser.add_argument("--stream-chunk-chars", type=int, default=16)
+    parser.add_argument("--stream-chunk-ms", type=float, default=0.0)
+    parser.add_argument("--reply-file", help="JSON file returned verbatim as the model output")
+    args = parser.parse_args()
+
+    reply = None
+    if args.reply_file:
+        with open(args.reply_file, encoding="utf-8-sig") as f:
+            reply = json.load(f)
+    fake = FakeResponses(
+        reply,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_every=args.rate_limit_every,
+        retry_after_sec=args.retry_after_sec,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_chunk_ms=args.stream_chunk_ms,
+    )
+    base_url = fake.start(args.host, args.port)
+    print(f"export OPENAI_BASE_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
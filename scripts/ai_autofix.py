@@ -3,20 +3,45 @@
 import json
 import os
 import subprocess
+import threading
 import time
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Iterable
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
-from scripts.ai_common import call_openai, load_yaml, read_file_lines, run_git, write_file_lines, write_json
+from scripts.ai_common import (
+    call_openai,
+    run_git,
+    stream_git,
+    write_json,
+)
+from scripts.ai_config import load_config_bundle
+from scripts.ai_diff import FileDiff, iter_file_diffs, shard_file_diffs
+from scripts.ai_files import list_changed_files, list_repo_files
+from scripts.ai_metrics import METRICS, bind_metrics, export_metrics
+from scripts.ai_output import iter_review_records
+from scripts.ai_parallel import DEFAULT_CHUNK_SIZE, map_chunks, resolve_workers
+from scripts.ai_patch import DEFAULT_FUZZ, PatchOutcome, apply_patch, is_safe_path, parse_patch, patch_paths
+from scripts.ai_profile import profile_requested, profile_run
+from scripts.ai_source import SourceFile, merge_spans
 
-POLICY_PATH = Path("config/review-policy.yaml")
-MAX_FILE_BYTES = 1_000_000
+AUTOFIX_MARKERS = {
+    "TODO_AUTOFIX": "DONE_AUTOFIX",
+    "FIXME_AUTOFIX": "DONE_AUTOFIX",
+    "TODO_SECURITY": "RESOLVED_SECURITY",
+}
+MARKER_BYTES = tuple(marker.encode("ascii") for marker in AUTOFIX_MARKERS)
 MAX_DIFF_CHARS = 200_000
+DEFAULT_SHARD_MAX_TOKENS = 24_000
+MAX_FEEDBACK_ERRORS = 10
+DEFAULT_CONTEXT_LINES = 20
+REVIEW_INPUT_PATH = "ai_review.json"
 AUTOFIX_INSTRUCTIONS = "You are a code-fixing agent. Return JSON only."
 
 
@@ -27,37 +52,131 @@ class Change:
 
 
 def load_policy() -> dict:
-    return load_yaml(POLICY_PATH)
-
-
-def apply_autofix_markers(path: Path, lines: list[str]) -> tuple[bool, list[str]]:
-    changed = False
-    new_lines: list[str] = []
-    for line in lines:
-        new_line = line
-        if "TODO_AUTOFIX" in new_line:
-            new_line = new_line.replace("TODO_AUTOFIX", "DONE_AUTOFIX")
-        if "FIXME_AUTOFIX" in new_line:
-            new_line = new_line.replace("FIXME_AUTOFIX", "DONE_AUTOFIX")
-        if "TODO_SECURITY" in new_line:
-            new_line = new_line.replace("TODO_SECURITY", "RESOLVED_SECURITY")
-        if new_line != line:
-            changed = True
-        new_lines.append(new_line)
-    return changed, new_lines
+    return load_config_bundle()["policy"]
+
+
+def apply_autofix_markers(data: bytes) -> bytes:
+    # Markers are ASCII, so replacing bytes is safe for any encoding and keeps line endings as they are.
+    for marker, replacement in AUTOFIX_MARKERS.items():
+        data = data.replace(marker.encode("ascii"), replacement.encode("ascii"))
+    return data
+
+
+def fix_marker_files(paths: list[str]) -> list[tuple[str, str]]:
+    fixed: list[tuple[str, str]] = []
+    for file in paths:
+        path = Path(file)
+        # mmap find is a cheap first pass; only files that carry a marker are read in full and rewritten.
+        with SourceFile(path) as source:
+            if source.is_binary() or not source.contains(MARKER_BYTES):
+                continue
+        try:
+            data = path.read_bytes()
+            new_data = apply_autofix_markers(data)
+            if new_data != data:
+                path.write_bytes(new_data)
+                fixed.append((file, "자동 수정 마커 치환"))
+        except OSError:
+            continue
+    return fixed
+
+
+def load_review_findings(policy: dict, review: dict | None = None) -> dict[str, list[dict]] | None:
+    if review is not None:
+        return collect_findings(policy, review.get("comments", []))
+    path = Path(os.environ.get("AI_REVIEW_INPUT", REVIEW_INPUT_PATH))
+    if not path.exists():
+        return None
+    try:
+        # Accepts either output format; jsonl comment records are read a line at a time.
+        return collect_findings(policy, iter_review_records(path, "comment"))
+    except (OSError, ValueError):
+        return None
+
+
+def collect_findings(policy: dict, comments: Iterable[dict]) -> dict[str, list[dict]]:
+    blocking_agents = set(policy.get("review", {}).get("blocking_agents", []))
+    findings: dict[str, list[dict]] = {}
+    for c in comments:
+        if not isinstance(c, dict) or c.get("level") != "blocking":
+            continue
+        if blocking_agents and c.get("agent") not in blocking_agents:
+            continue
+        try:
+            line = max(1, int(c.get("line", 1)))
+        except (TypeError, ValueError):
+            line = 1
+        findings.setdefault(str(c.get("path", "")), []).append(
+            {"line": line, "agent": str(c.get("agent", "")), "body": str(c.get("body", ""))}
+        )
+    return findings
+
+
+def source_windows(source: SourceFile, finding_lines: list[int], context: int) -> list[dict]:
+    windows: list[dict] = []
+    for start, end in merge_spans(((ln, ln) for ln in finding_lines), context):
+        lines = source.read_lines(start, end)
+        if lines:
+            windows.append({"start_line": start, "end_line": start + len(lines) - 1, "text": "\n".join(lines)})
+    return windows
+
+
+def build_finding_prompt(
+    path: str,
+    findings: list[dict],
+    windows: list[dict],
+    previous_errors: list[str] | None = None,
+) -> str:
+    prompt = {
+        "task": "리뷰에서 차단(blocking)으로 지적된 항목만 최소 범위로 수정",
+        "constraints": [
+            "반드시 unified diff 형식으로 patch를 생성",
+            f"{path} 파일만 수정",
+            "지적된 항목 외 변경 금지",
+            "hunk 컨텍스트는 source_windows의 원문과 정확히 일치",
+        ],
+        "expected_output": {
+            "apply_patch": "unified diff string",
+            "change_summary": "string",
+            "files_changed": "array of strings",
+        },
+        "path": path,
+        "findings": findings,
+        "source_windows": windows,
+    }
+    if previous_errors:
+        prompt["previous_attempt_errors"] = previous_errors[:MAX_FEEDBACK_ERRORS]
+    return json.dumps(prompt, ensure_ascii=False)
+
+
+def build_finding_targets(
+    findings: dict[str, list[dict]],
+    candidates: list[str],
+    context: int,
+) -> list[tuple[str, Callable[[list[str]], str]]]:
+    in_scope = set(candidates)
+    targets: list[tuple[str, Callable[[list[str]], str]]] = []
+    for path in sorted(findings):
+        if path not in in_scope or not is_safe_path(path):
+            continue
+        items = sorted(findings[path], key=lambda f: f["line"])
+        with SourceFile(Path(path)) as source:
+            if source.is_binary():
+                continue
+            windows = source_windows(source, [f["line"] for f in items], context)
+        if not windows:
+            continue
+        targets.append(
+            (path, lambda errors, p=path, f=items, w=windows: build_finding_prompt(p, f, w, errors))
+        )
+    return targets
 
 
 def extract_patch_paths(diff_text: str) -> set[str]:
-    paths: set[str] = set()
-    for line in diff_text.splitlines():
-        if line.startswith("+++ b/"):
-            paths.add(line[6:].strip())
-        elif line.startswith("--- a/"):
-            paths.add(line[6:].strip())
-    return {p for p in paths if p and p != "/dev/null"}
+    return patch_paths(parse_patch(diff_text, keep_lines=False))
 
 
-def build_prompt(changed_files: list[str], diff_text: str) -> str:
+def build_prompt(changed_files: list[str], diff_text: str, previous_errors: list[str] | None = None) -> str:
     prompt = {
         "task": "PR 변경사항의 오류/취약점을 자동 수정",
         "constraints": [
@@ -73,6 +192,8 @@ def build_prompt(changed_files: list[str], diff_text: str) -> str:
         "changed_files": changed_files,
         "diff": diff_text,
     }
+    if previous_errors:
+        prompt["previous_attempt_errors"] = previous_errors[:MAX_FEEDBACK_ERRORS]
     return json.dumps(prompt, ensure_ascii=False)
 
 
@@ -98,63 +219,241 @@ def apply_patch_text(diff_text: str) -> bool:
     return result.returncode == 0
 
 
-def main() -> int:
-    policy = load_policy()
-    branch_prefix = policy.get("autofix", {}).get("branch_prefix", "auto/fix")
-    title_template = policy.get("autofix", {}).get("pr_title_template", "AI:feat {change_summary}")
-    max_attempts = int(policy.get("autofix", {}).get("max_attempts", 3))
+def validate_patch_result(
+    ai_result: dict | None,
+    policy: dict,
+    allowed_paths: set[str] | None = None,
+) -> tuple[str, list[FileDiff], set[str]] | None:
     allowed_exts = set(policy.get("autofix", {}).get("allowed_extensions", [".py"]))
     max_patch_chars = int(policy.get("autofix", {}).get("max_patch_chars", MAX_DIFF_CHARS))
-    backoff_sec = int(policy.get("autofix", {}).get("retry_backoff_sec", 2))
+    if not ai_result:
+        return None
+    patch_text = ai_result.get("apply_patch", "")
+    if not patch_text or len(patch_text) > max_patch_chars:
+        return None
+    file_diffs = parse_patch(patch_text)
+    paths = patch_paths(file_diffs)
+    if not paths or not all(Path(p).suffix in allowed_exts and is_safe_path(p) for p in paths):
+        return None
+    if allowed_paths is not None and not paths <= allowed_paths:
+        return None
+    return patch_text, file_diffs, paths
+
+
+def apply_validated_patch(patch_text: str, file_diffs: list[FileDiff], policy: dict) -> PatchOutcome:
+    autofix_cfg = policy.get("autofix", {})
+    engine = str(autofix_cfg.get("patch_engine", "python"))
+    if engine == "git":
+        ok = apply_patch_text(patch_text)
+        return PatchOutcome(ok, errors=[] if ok else ["git apply --check failed"])
+    outcome = apply_patch(file_diffs, fuzz=int(autofix_cfg.get("patch_fuzz", DEFAULT_FUZZ)))
+    if not outcome.ok and autofix_cfg.get("git_apply_fallback", False) and apply_patch_text(patch_text):
+        return PatchOutcome(True, files=sorted(patch_paths(file_diffs)))
+    return outcome
+
+
+def patch_changes(ai_result: dict, paths: set[str]) -> list[Change]:
+    return [Change(path, "AI patch") for path in ai_result.get("files_changed", sorted(paths))]
 
-    diff_text = run_git(["diff", "HEAD"])
-    if len(diff_text) > MAX_DIFF_CHARS:
-        diff_text = diff_text[:MAX_DIFF_CHARS] + "\n...DIFF_TRUNCATED..."
 
-    changed_files = [
-        str(p)
-        for p in Path(".").rglob("*")
-        if p.is_file() and p.suffix in allowed_exts
-    ]
+def attempt_label(allowed_paths: set[str] | None) -> str:
+    return f"autofix:{min(allowed_paths)}" if allowed_paths else "autofix"
+
+
+def run_fix_attempts(
+    build: Callable[[list[str]], str],
+    policy: dict,
+    apply_lock: threading.Lock,
+    allowed_paths: set[str] | None = None,
+) -> tuple[list[Change], dict]:
+    max_attempts = int(policy.get("autofix", {}).get("max_attempts", 3))
+    backoff_sec = int(policy.get("autofix", {}).get("retry_backoff_sec", 2))
 
     changes: list[Change] = []
     attempts_used = 0
+    feedback: list[str] = []
     for attempt in range(1, max_attempts + 1):
         attempts_used = attempt
-        ai_result = call_openai(build_prompt(changed_files, diff_text), policy, "autofix_model", AUTOFIX_INSTRUCTIONS)
-        if not ai_result:
+        # Retries need fresh samples, so autofix never reads from the response cache.
+        with METRICS.stage("prompt_build"):
+            prompt = build(feedback)
+        ai_result = call_openai(
+            prompt, policy, "autofix_model", AUTOFIX_INSTRUCTIONS, use_cache=False, label=attempt_label(allowed_paths)
+        )
+        validated = validate_patch_result(ai_result, policy, allowed_paths)
+        if validated is None:
             time.sleep(backoff_sec)
             continue
-        patch_text = ai_result.get("apply_patch", "")
-        if not patch_text or len(patch_text) > max_patch_chars:
-            time.sleep(backoff_sec)
-            continue
-        patch_paths = extract_patch_paths(patch_text)
-        if not patch_paths or not all(Path(p).suffix in allowed_exts for p in patch_paths):
-            time.sleep(backoff_sec)
-            continue
-        if apply_patch_text(patch_text):
-            for path in ai_result.get("files_changed", list(patch_paths)):
-                changes.append(Change(path, "AI patch"))
+        patch_text, file_diffs, paths = validated
+        # Shards are fixed concurrently, but patches touch one shared working tree.
+        with apply_lock, METRICS.stage("patch_apply"):
+            outcome = apply_validated_patch(patch_text, file_diffs, policy)
+        if outcome.ok:
+            changes = patch_changes(ai_result, paths)
             break
+        feedback = outcome.errors
         time.sleep(backoff_sec)
+    return changes, {"mode": "sequential", "attempts_used": attempts_used, "last_errors": [] if changes else feedback}
 
-    if not changes:
-        candidates = [p for p in Path(".").rglob("*") if p.is_file() and p.suffix in allowed_exts]
-        for path in candidates:
-            lines = read_file_lines(path, MAX_FILE_BYTES)
-            if not lines:
+
+def run_speculative_attempts(
+    build: Callable[[list[str]], str],
+    policy: dict,
+    apply_lock: threading.Lock,
+    allowed_paths: set[str] | None = None,
+) -> tuple[list[Change], dict]:
+    spec_cfg = policy.get("autofix", {}).get("speculative", {})
+    attempts = max(1, int(spec_cfg.get("attempts", policy.get("autofix", {}).get("max_attempts", 3))))
+    concurrency = max(1, min(attempts, int(spec_cfg.get("concurrency", attempts))))
+    temperatures = [float(t) for t in spec_cfg.get("temperatures", [])] or [None]
+
+    changes: list[Change] = []
+    winner: int | None = None
+    completed = 0
+    # Set once an attempt wins (or the loop fails): the others stop at their next stream event.
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    futures: dict[Future, int] = {}
+    with METRICS.stage("prompt_build"):
+        prompt = build([])
+    for idx in range(attempts):
+        futures[
+            pool.submit(
+                bind_metrics(call_openai),
+                prompt,
+                policy,
+                "autofix_model",
+                AUTOFIX_INSTRUCTIONS,
+                False,
+                temperatures[idx % len(temperatures)],
+                attempt_label(allowed_paths),
+                None,
+                cancel,
+            )
+        ] = idx
+    try:
+        # Validate in arrival order; the first patch that applies cleanly wins.
+        for future in as_completed(futures):
+            completed += 1
+            try:
+                ai_result = future.result()
+            except Exception:
+                continue
+            validated = validate_patch_result(ai_result, policy, allowed_paths)
+            if validated is None:
                 continue
-            changed, new_lines = apply_autofix_markers(path, lines)
-            if changed:
-                write_file_lines(path, new_lines)
-                changes.append(Change(str(path), "자동 수정 마커 치환"))
+            patch_text, file_diffs, paths = validated
+            with apply_lock, METRICS.stage("patch_apply"):
+                outcome = apply_validated_patch(patch_text, file_diffs, policy)
+            if outcome.ok:
+                changes = patch_changes(ai_result, paths)
+                winner = futures[future] + 1
+                break
+    finally:
+        cancel.set()
+        cancelled = sum(1 for future in futures if future.cancel())
+        in_flight = [future for future in futures if not future.done()]
+        # Losers only need to notice the event, so waiting for them is short and nothing outlives the run.
+        pool.shutdown(wait=True)
+
+    stopped = 0
+    for future in in_flight:
+        result = None if future.exception() is not None else future.result()
+        if result is None or result.get("aborted"):
+            stopped += 1
+    report = {
+        "mode": "speculative",
+        "attempts_issued": attempts - cancelled,
+        "attempts_used": completed,
+        "concurrency": concurrency,
+        "winner_attempt": winner,
+        "cancelled": cancelled,
+        "stopped_in_flight": stopped,
+        "completed": attempts - cancelled - stopped,
+    }
+    return changes, report
+
+
+def run_autofix(
+    base_sha: str = "",
+    review: dict | None = None,
+    pr_number: str | None = None,
+    run_id: str | None = None,
+    policy: dict | None = None,
+) -> dict:
+    METRICS.reset()
+    with METRICS.stage("config"):
+        policy = policy or load_policy()
+    branch_prefix = policy.get("autofix", {}).get("branch_prefix", "auto/fix")
+    title_template = policy.get("autofix", {}).get("pr_title_template", "AI:feat {change_summary}")
+    allowed_exts = set(policy.get("autofix", {}).get("allowed_extensions", [".py"]))
+    shard_max_tokens = int(policy.get("autofix", {}).get("shard_max_tokens", DEFAULT_SHARD_MAX_TOKENS))
+    max_concurrency = int(policy.get("autofix", {}).get("max_concurrency", 4))
+
+    context_lines = int(policy.get("autofix", {}).get("context_lines", DEFAULT_CONTEXT_LINES))
+
+    # Scope to the PR's files when the base is known; the candidate list is reused for markers below.
+    base_sha = base_sha.strip()
+    with METRICS.stage("git"):
+        changed_files = list_changed_files(base_sha, "HEAD", allowed_exts, include_deleted=False)
+        if not changed_files:
+            changed_files = list_repo_files(allowed_exts)
+
+    # Prefer one compact prompt per file with blocking review findings; the diff shards are the fallback.
+    with METRICS.stage("review_findings"):
+        findings = load_review_findings(policy, review)
+        targets = build_finding_targets(findings, changed_files, context_lines) if findings else []
+    mode = "review_guided" if targets else "diff"
+    if not targets:
+        with METRICS.stage("git"):
+            shards = shard_file_diffs(iter_file_diffs(stream_git(["diff", "HEAD"])), shard_max_tokens) or [""]
+        targets = [
+            (None, lambda errors, shard=shard: build_prompt(changed_files, shard, errors))
+            for shard in shards
+        ]
+
+    speculative = bool(policy.get("autofix", {}).get("speculative", {}).get("enabled", False))
+    run_attempts = run_speculative_attempts if speculative else run_fix_attempts
+    apply_lock = threading.Lock()
+    workers = max(1, min(max_concurrency, len(targets)))
+    with METRICS.stage("fix_attempts"), ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(
+            pool.map(
+                bind_metrics(
+                    lambda target: run_attempts(
+                        target[1],
+                        policy,
+                        apply_lock,
+                        {target[0]} if target[0] else None,
+                    )
+                ),
+                targets,
+            )
+        )
+
+    changes: list[Change] = []
+    attempt_reports: list[dict] = []
+    for shard_changes, report in outcomes:
+        changes.extend(shard_changes)
+        attempt_reports.append(report)
+    attempts_used = sum(r["attempts_used"] for r in attempt_reports)
+
+    if not changes:
+        heuristics_cfg = policy.get("heuristics", {})
+        with METRICS.stage("markers"):
+            fixed = map_chunks(
+                fix_marker_files,
+                changed_files,
+                resolve_workers(heuristics_cfg.get("workers", 0)),
+                int(heuristics_cfg.get("chunk_size", DEFAULT_CHUNK_SIZE)),
+            )
+        changes.extend(Change(path, reason) for path, reason in fixed)
 
     applied = bool(changes)
     change_summary = "no changes" if not changes else "; ".join(c.path for c in changes[:3])
 
-    pr_number = os.environ.get("PR_NUMBER", "0")
-    run_id = os.environ.get("RUN_ID", "0")
+    pr_number = pr_number or os.environ.get("PR_NUMBER", "0")
+    run_id = run_id or os.environ.get("RUN_ID", "0")
     branch_name = f"{branch_prefix}-{pr_number}-{run_id}"
 
     result = {
@@ -164,9 +463,19 @@ def main() -> int:
         "branch_name": branch_name,
         "pr_title": title_template.replace("{change_summary}", change_summary),
         "attempts_used": attempts_used,
+        "mode": mode,
+        "targets": [path for path, _ in targets if path],
+        "shards": 0 if mode == "review_guided" else len(targets),
+        "attempts": attempt_reports,
+        "metrics": export_metrics(policy, "autofix"),
     }
+    return result
 
+
+def main() -> int:
     out = os.environ.get("AI_AUTOFIX_OUTPUT", "ai_autofix.json")
+    with profile_run(Path(out), "autofix", profile_requested(sys.argv[1:])):
+        result = run_autofix(os.environ.get("BASE_SHA", ""))
     write_json(Path(out), result)
     print(f"Wrote autofix to {out}")
     return 0
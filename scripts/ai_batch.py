@@ -0,0 +1,186 @@
+﻿from __future__ import annotations
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts.ai_common import RequestLimiter, get_http_session, run_git, use_request_limiter, write_json
+from scripts.ai_metrics import Metrics, use_metrics
+from scripts.ai_output import output_format, write_review
+from scripts.ai_review import load_review_config, run_review
+
+DEFAULT_OUTPUT_DIR = "ai_review_batch"
+
+
+@dataclass
+class ReviewRange:
+    base_sha: str
+    head_sha: str
+    pr_number: str | None = None
+
+
+def batch_config(policy: dict) -> dict:
+    cfg = policy.get("batch", {}) or {}
+    concurrency = os.environ.get("AI_BATCH_CONCURRENCY", "").strip() or cfg.get("concurrency", 4)
+    return {
+        "concurrency": max(1, int(concurrency)),
+        "max_in_flight_requests": int(cfg.get("max_in_flight_requests", 0) or 0),
+        "requests_per_minute": float(cfg.get("requests_per_minute", 0) or 0),
+        "output_dir": os.environ.get("AI_BATCH_OUTPUT_DIR", "").strip() or str(cfg.get("output_dir", DEFAULT_OUTPUT_DIR)),
+    }
+
+
+def parse_ranges(lines: Iterable[str]) -> tuple[list[ReviewRange], list[str]]:
+    # One range per line: "<base> <head> [PR]" or "<base>..<head> [PR]"; blank lines and # comments are skipped.
+    ranges: list[ReviewRange] = []
+    problems: list[str] = []
+    for line_no, line in enumerate(lines, 1):
+        parts = line.split("#", 1)[0].split()
+        if not parts:
+            continue
+        if ".." in parts[0]:
+            base, _, head = parts[0].partition("..")
+            parts = [base, head, *parts[1:]]
+        if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+            problems.append(f"{line_no}행: '<base> <head> [PR 번호]' 형식이 아닙니다: {line.strip()}")
+            continue
+        ranges.append(ReviewRange(parts[0], parts[1], parts[2] if len(parts) == 3 else None))
+    return ranges, problems
+
+
+def group_ranges(ranges: list[ReviewRange]) -> list[list[int]]:
+    # Pushes of one PR run in input order so each can review incrementally on top of the previous one;
+    # everything else is independent.
+    groups: dict[str, list[int]] = {}
+    for index, item in enumerate(ranges):
+        key = f"pr:{item.pr_number}" if item.pr_number else f"range:{index}"
+        groups.setdefault(key, []).append(index)
+    return list(groups.values())
+
+
+def resolve_commit(ref: str) -> str:
+    return run_git(["rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"])
+
+
+def review_range(index: int, item: ReviewRange, config: tuple[dict, dict, dict], out_dir: Path, suffix: str) -> dict:
+    entry: dict = {"index": index, "base_sha": item.base_sha, "head_sha": item.head_sha, "pr_number": item.pr_number}
+    started = time.perf_counter()
+    try:
+        base_sha, head_sha = resolve_commit(item.base_sha), resolve_commit(item.head_sha)
+        if not base_sha or not head_sha:
+            raise ValueError("커밋을 찾을 수 없습니다")
+        # Each range gets its own metrics collector; ranges without a PR leave the per-PR review state alone.
+        with use_metrics(Metrics()):
+            result = run_review(base_sha, head_sha, None, item.pr_number, config, keep_state=bool(item.pr_number))
+        path = out_dir / f"{index:04d}-{base_sha[:7]}..{head_sha[:7]}{suffix}"
+        write_review(path, result)
+    except Exception as exc:
+        entry.update(status="error", error=f"{exc.__class__.__name__}: {exc}")
+    else:
+        totals = result["metrics"]["totals"]
+        entry.update(
+            base_sha=base_sha,
+            head_sha=head_sha,
+            status=result["status"],
+            blocking=result["blocking"],
+            review_mode=result["review_mode"],
+            comment_count=len(result["comments"]),
+            api_calls=totals["api_calls"],
+            cost_usd=totals["cost_usd"],
+            output=str(path),
+        )
+    entry["wall_time_sec"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def run_batch(ranges: list[ReviewRange], out_dir: Path, config: tuple[dict, dict, dict] | None = None) -> dict:
+    config = config or load_review_config()
+    policy = config[0]
+    cfg = batch_config(policy)
+    review_cfg = policy.get("review", {})
+    ai_cfg = policy.get("ai", {})
+
+    # One limiter for the whole batch: the limits hold across ranges and their agents together.
+    limiter = RequestLimiter(cfg["max_in_flight_requests"], cfg["requests_per_minute"])
+    if os.environ.get("OPENAI_API_KEY"):
+        in_flight = cfg["max_in_flight_requests"] or cfg["concurrency"] * int(review_cfg.get("max_concurrency", 4))
+        get_http_session(max(int(ai_cfg.get("retry", {}).get("pool_maxsize", 8)), in_flight))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    suffix = ".jsonl" if output_format(out_dir / "review.json") == "jsonl" else ".json"
+    entries: list[dict | None] = [None] * len(ranges)
+
+    def run_group(indexes: list[int]) -> None:
+        with use_request_limiter(limiter):
+            for index in indexes:
+                entries[index] = review_range(index, ranges[index], config, out_dir, suffix)
+
+    started = time.perf_counter()
+    groups = group_ranges(ranges)
+    if cfg["concurrency"] <= 1 or len(groups) <= 1:
+        for group in groups:
+            run_group(group)
+    else:
+        with ThreadPoolExecutor(max_workers=min(cfg["concurrency"], len(groups))) as pool:
+            list(pool.map(run_group, groups))
+    wall = time.perf_counter() - started
+
+    done = [e for e in entries if e is not None]
+    statuses = [e["status"] for e in done]
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "concurrency": cfg["concurrency"],
+        "max_in_flight_requests": cfg["max_in_flight_requests"],
+        "requests_per_minute": cfg["requests_per_minute"],
+        "totals": {
+            "ranges": len(done),
+            "pass": statuses.count("pass"),
+            "fail": statuses.count("fail"),
+            "error": statuses.count("error"),
+            "comments": sum(e.get("comment_count", 0) for e in done),
+            "api_calls": sum(e.get("api_calls", 0) for e in done),
+            "cost_usd": round(sum(e.get("cost_usd", 0.0) for e in done), 6),
+            "wall_time_sec": round(wall, 3),
+            "ranges_per_minute": round(len(done) * 60 / wall, 2) if wall > 0 else 0.0,
+        },
+        "ranges": done,
+    }
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if len(args) > 1:
+        print("usage: ai_batch.py [범위 파일 | -]", file=sys.stderr)
+        return 2
+    if not args or args[0] == "-":
+        ranges, problems = parse_ranges(sys.stdin)
+    else:
+        with open(args[0], "r", encoding="utf-8-sig") as handle:
+            ranges, problems = parse_ranges(handle)
+    for problem in problems:
+        print(f"[batch] {problem}", file=sys.stderr)
+
+    config = load_review_config()
+    out_dir = Path(batch_config(config[0])["output_dir"])
+    summary = run_batch(ranges, out_dir, config)
+    summary["input_problems"] = problems
+    write_json(out_dir / "summary.json", summary)
+    totals = summary["totals"]
+    print(
+        f"Reviewed {totals['ranges']} ranges in {totals['wall_time_sec']}s "
+        f"(pass {totals['pass']} / fail {totals['fail']} / error {totals['error']}); summary in {out_dir / 'summary.json'}"
+    )
+    return 1 if problems or totals["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,120 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from scripts.ai_metrics import METRICS
+
+DEFAULT_CACHE_DIR = ".ai_cache/responses"
+DEFAULT_MAX_BYTES = 200_000_000
+DEFAULT_MAX_AGE_DAYS = 14
+CACHE_COUNTERS = ("hits", "misses", "writes", "evicted")
+
+
+def cache_enabled(policy: dict) -> bool:
+    if os.environ.get("AI_CACHE_DISABLE", "").strip().lower() in {"1", "true", "yes"}:
+        return False
+    return bool(policy.get("cache", {}).get("enabled", True))
+
+
+def cache_dir(policy: dict) -> Path:
+    return Path(os.environ.get("AI_CACHE_DIR") or policy.get("cache", {}).get("dir", DEFAULT_CACHE_DIR))
+
+
+def cache_key(model: str, instructions: str, temperature: float, prompt: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    material = json.dumps([model, instructions, temperature, prompt_hash], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _entry_path(policy: dict, key: str) -> Path:
+    return cache_dir(policy) / key[:2] / f"{key}.json"
+
+
+def _bump(name: str, amount: int = 1) -> None:
+    # Counted on the run's metrics collector, so batch ranges and service jobs each report their own.
+    METRICS.count(f"cache_{name}", amount)
+
+
+def cache_get(policy: dict, key: str) -> dict | None:
+    path = _entry_path(policy, key)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        _bump("misses")
+        return None
+    try:
+        # Reads refresh mtime so eviction behaves as LRU rather than FIFO.
+        os.utime(path)
+    except OSError:
+        pass
+    _bump("hits")
+    return data
+
+
+def cache_put(policy: dict, key: str, value: dict) -> None:
+    path = _entry_path(policy, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        return
+    _bump("writes")
+
+
+def evict_cache(policy: dict) -> int:
+    cfg = policy.get("cache", {})
+    max_bytes = int(cfg.get("max_bytes", DEFAULT_MAX_BYTES))
+    max_age_sec = float(cfg.get("max_age_days", DEFAULT_MAX_AGE_DAYS)) * 86400
+    removed = evict_dir(cache_dir(policy), max_bytes, max_age_sec)
+    _bump("evicted", removed)
+    return removed
+
+
+def evict_dir(root: Path, max_bytes: int, max_age_sec: float) -> int:
+    # Age limit first, then least recently used down to max_bytes, over <root>/<xx>/<key>.json.
+    if not root.exists():
+        return 0
+    now = time.time()
+
+    entries: list[tuple[float, int, Path]] = []
+    for path in root.glob("*/*.json"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    removed = 0
+    kept: list[tuple[float, int, Path]] = []
+    for mtime, size, path in entries:
+        if now - mtime > max_age_sec:
+            removed += _unlink(path)
+        else:
+            kept.append((mtime, size, path))
+
+    total = sum(size for _, size, _ in kept)
+    for mtime, size, path in sorted(kept):
+        if total <= max_bytes:
+            break
+        removed += _unlink(path)
+        total -= size
+    return removed
+
+
+def _unlink(path: Path) -> int:
+    try:
+        path.unlink()
+    except OSError:
+        return 0
+    return 1
+
+
+def cache_stats() -> dict:
+    return {name: METRICS.counter(f"cache_{name}") for name in CACHE_COUNTERS}
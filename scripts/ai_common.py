@@ -2,13 +2,32 @@
 
 import json
 import os
+import random
 import re
 import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Iterable
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
 
-import requests
-import yaml
+from scripts.ai_cache import cache_enabled, cache_get, cache_key, cache_put
+from scripts.ai_metrics import METRICS
+from scripts.ai_stream import consume_stream
+
+# requests and yaml cost ~120ms to import; they load on first use so the heuristic path never pays for HTTP.
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RATELIMIT_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+RATELIMIT_UNIT_SEC = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+MAX_JSON_CANDIDATES = 8
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
 
 
 def run_git(args: list[str]) -> str:
@@ -18,9 +37,35 @@ def run_git(args: list[str]) -> str:
     return result.stdout.strip()
 
 
+def stream_git(args: list[str]) -> Iterator[str]:
+    # Lines arrive as git writes them; large diffs are parsed without ever being one string.
+    try:
+        proc = subprocess.Popen(
+            ["git", *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+    except OSError:
+        return
+    try:
+        for line in proc.stdout:
+            yield line[:-1] if line.endswith("\n") else line
+    finally:
+        # A consumer that stops early must not leave git blocked on a full pipe.
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+
 def load_yaml(path: Path) -> dict:
     if not path.exists():
         return {}
+    import yaml
+
     return yaml.safe_load(path.read_text(encoding="utf-8")) or {}
 
 
@@ -64,25 +109,225 @@ def parse_json_from_text(text: str) -> dict | None:
         return json.loads(text)
     except json.JSONDecodeError:
         pass
-    match = re.search(r"\{[\s\S]*\}", text)
-    if not match:
+    # raw_decode stops at the end of the first complete object, so trailing prose or a
+    # closing code fence costs nothing and malformed output is not re-scanned end to end.
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    for _ in range(MAX_JSON_CANDIDATES):
+        if start < 0:
+            break
+        try:
+            value, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict):
+            return value
+        start = text.find("{", start + 1)
+    return None
+
+
+def get_http_session(pool_maxsize: int = 8) -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def remaining_run_budget(retry_cfg: dict) -> float | None:
+    # The deadline lives on the run's metrics collector, which METRICS.reset() clears per run.
+    budget = float(retry_cfg.get("run_deadline_sec", 0) or 0)
+    if budget <= 0:
         return None
+    return METRICS.remaining_budget(budget)
+
+
+class RequestLimiter:
+    # Concurrency and rate limits shared by every run bound to it: the ranges of a batch or the service's jobs.
+    def __init__(self, max_in_flight: int = 0, requests_per_minute: float = 0.0) -> None:
+        self.slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait_turn(self) -> None:
+        # Spaces request starts evenly across all runs sharing the limiter.
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at)
+            self._next_at = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def defer(self, delay: float) -> None:
+        # A rate-limit hint seen by one run pauses the others too instead of letting them hit the same wall.
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + delay)
+
+
+_limiter: ContextVar[RequestLimiter | None] = ContextVar("ai_request_limiter", default=None)
+
+
+@contextmanager
+def use_request_limiter(limiter: RequestLimiter | None) -> Iterator[RequestLimiter | None]:
+    token = _limiter.set(limiter)
     try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
+        yield limiter
+    finally:
+        _limiter.reset(token)
+
+
+def parse_ratelimit_duration(value: str) -> float | None:
+    value = (value or "").strip()
+    if not value:
         return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = RATELIMIT_DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * RATELIMIT_UNIT_SEC[unit] for amount, unit in parts)
+
+
+def server_retry_delay(resp: requests.Response) -> float | None:
+    retry_after = resp.headers.get("Retry-After", "").strip()
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    delays: list[float] = []
+    for kind in ("requests", "tokens"):
+        if resp.headers.get(f"x-ratelimit-remaining-{kind}", "").strip() != "0":
+            continue
+        delay = parse_ratelimit_duration(resp.headers.get(f"x-ratelimit-reset-{kind}", ""))
+        if delay is not None:
+            delays.append(delay)
+    if resp.status_code == 429 and not delays:
+        for kind in ("requests", "tokens"):
+            delay = parse_ratelimit_duration(resp.headers.get(f"x-ratelimit-reset-{kind}", ""))
+            if delay is not None:
+                delays.append(delay)
+    return max(delays) if delays else None
+
+
+def backoff_delay(attempt: int, retry_cfg: dict) -> float:
+    base = float(retry_cfg.get("backoff_base_sec", 1.0))
+    cap = float(retry_cfg.get("backoff_max_sec", 30.0))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def post_with_retries(
+    url: str,
+    headers: dict,
+    payload: dict,
+    ai_cfg: dict,
+    timeout_sec: float,
+    stats: dict | None = None,
+    stream: bool = False,
+    cancel: threading.Event | None = None,
+) -> requests.Response | None:
+    import requests
+
+    retry_cfg = ai_cfg.get("retry", {}) or {}
+    max_retries = int(retry_cfg.get("max_retries", 4))
+    session = get_http_session(int(retry_cfg.get("pool_maxsize", 8)))
+
+    for attempt in range(max_retries + 1):
+        if stats is not None:
+            stats["retries"] = attempt
+        if cancel is not None and cancel.is_set():
+            return None
+        remaining = remaining_run_budget(retry_cfg)
+        if remaining is not None and remaining <= 0:
+            return None
+        request_timeout = timeout_sec if remaining is None else min(timeout_sec, remaining)
+        limiter = _limiter.get()
+        if limiter is not None:
+            limiter.wait_turn()
+        slots = limiter.slots if limiter is not None else None
+        if slots is not None:
+            # With streaming the slot covers the request up to the response headers.
+            slots.acquire()
+        try:
+            resp = session.post(url, headers=headers, json=payload, timeout=request_timeout, stream=stream)
+        except (requests.Timeout, requests.ConnectionError):
+            resp = None
+        finally:
+            if slots is not None:
+                slots.release()
+        if resp is not None and resp.status_code not in RETRY_STATUS_CODES:
+            return resp
+        if attempt >= max_retries:
+            return resp
+
+        delay = backoff_delay(attempt, retry_cfg)
+        if resp is not None:
+            hinted = server_retry_delay(resp)
+            if hinted is not None:
+                # Server hints win, plus a little jitter so parallel agents do not retry in lockstep.
+                delay = hinted + random.uniform(0, min(1.0, float(retry_cfg.get("backoff_base_sec", 1.0))))
+                if limiter is not None:
+                    limiter.defer(hinted)
+        remaining = remaining_run_budget(retry_cfg)
+        if remaining is not None and delay >= remaining:
+            return resp
+        if cancel is not None:
+            cancel.wait(delay)
+        else:
+            time.sleep(delay)
+    return None
 
 
-def call_openai(prompt: str, policy: dict, model_key: str, instructions: str) -> dict | None:
+def call_openai(
+    prompt: str,
+    policy: dict,
+    model_key: str,
+    instructions: str,
+    use_cache: bool = True,
+    temperature: float | None = None,
+    label: str = "",
+    on_comment: Callable[[dict], bool] | None = None,
+    cancel: threading.Event | None = None,
+) -> dict | None:
     api_key = os.environ.get("OPENAI_API_KEY", "").strip()
     if not api_key:
         return None
 
     ai_cfg = policy.get("ai", {})
     model = os.environ.get("OPENAI_MODEL", ai_cfg.get(model_key, "gpt-4.1"))
-    temperature = float(ai_cfg.get("temperature", 0.2))
+    if temperature is None:
+        temperature = float(ai_cfg.get("temperature", 0.2))
     max_output_tokens = int(ai_cfg.get("max_output_tokens", 1200))
     timeout_sec = int(ai_cfg.get("request_timeout_sec", 120))
+    # A cancellable call always streams: dropping the connection is the only way to stop a response
+    # that is already being generated.
+    stream = bool(ai_cfg.get("stream", False)) or cancel is not None
+    base_url = (os.environ.get("OPENAI_BASE_URL", "").strip() or str(ai_cfg.get("base_url", DEFAULT_BASE_URL))).rstrip("/")
+
+    label = label or model_key
+    started = time.perf_counter()
+    key = None
+    if use_cache and cache_enabled(policy):
+        key = cache_key(model, instructions, temperature, prompt)
+        cached = cache_get(policy, key)
+        if cached is not None:
+            METRICS.record_call(label, model, time.perf_counter() - started, "cache_hit", cached=True)
+            return cached
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -103,16 +348,74 @@ def call_openai(prompt: str, policy: dict, model_key: str, instructions: str) ->
         "max_output_tokens": max_output_tokens,
         "store": False,
     }
+    if stream:
+        payload["stream"] = True
 
-    resp = requests.post(
-        "https://api.openai.com/v1/responses",
-        headers=headers,
-        json=payload,
-        timeout=timeout_sec,
+    attempt_stats = {"retries": 0}
+    resp = post_with_retries(
+        f"{base_url}/responses", headers, payload, ai_cfg, timeout_sec, attempt_stats, stream, cancel
     )
-    if resp.status_code != 200:
+    if resp is None or resp.status_code != 200:
+        status = "no_response" if resp is None else str(resp.status_code)
+        if resp is None and cancel is not None and cancel.is_set():
+            status = "cancelled"
+        METRICS.record_call(label, model, time.perf_counter() - started, status, attempt_stats["retries"])
         return None
+    if stream:
+        return read_stream(resp, policy, key, label, model, started, attempt_stats["retries"], on_comment, cancel)
 
-    data = resp.json()
+    try:
+        data = resp.json()
+    except ValueError:
+        METRICS.record_call(label, model, time.perf_counter() - started, "invalid_json", attempt_stats["retries"])
+        return None
+    METRICS.record_call(
+        label, model, time.perf_counter() - started, "200", attempt_stats["retries"], data.get("usage")
+    )
     text = extract_output_text(data)
-    return parse_json_from_text(text)
+    parsed = parse_json_from_text(text)
+    if key and parsed is not None:
+        cache_put(policy, key, parsed)
+    return parsed
+
+
+def read_stream(
+    resp: requests.Response,
+    policy: dict,
+    key: str | None,
+    label: str,
+    model: str,
+    started: float,
+    retries: int,
+    on_comment: Callable[[dict], bool] | None,
+    cancel: threading.Event | None,
+) -> dict | None:
+    import requests
+
+    def on_item(item: Any) -> bool:
+        return isinstance(item, dict) and on_comment is not None and on_comment(item)
+
+    try:
+        outcome = consume_stream(resp.iter_lines(chunk_size=None), on_item, cancel, started)
+    except (requests.RequestException, OSError):
+        METRICS.record_call(label, model, time.perf_counter() - started, "stream_error", retries)
+        return None
+    finally:
+        # Closing mid-stream drops the connection, which stops generation (and billing) upstream.
+        resp.close()
+    elapsed = time.perf_counter() - started
+    if outcome.aborted:
+        METRICS.record_call(label, model, elapsed, "aborted", retries, outcome.usage, first_item_sec=outcome.first_item_sec)
+        return {"comments": [c for c in outcome.items if isinstance(c, dict)], "aborted": True}
+    if outcome.failed:
+        METRICS.record_call(label, model, elapsed, "stream_failed", retries, outcome.usage)
+        return None
+    if not outcome.completed and outcome.parsed is None:
+        # Cut off mid-object: the full-body parse would pick up one of the inner findings instead.
+        METRICS.record_call(label, model, elapsed, "stream_truncated", retries, outcome.usage)
+        return None
+    METRICS.record_call(label, model, elapsed, "200", retries, outcome.usage, first_item_sec=outcome.first_item_sec)
+    parsed = outcome.parsed if isinstance(outcome.parsed, dict) else parse_json_from_text(outcome.text)
+    if key and parsed is not None and outcome.completed:
+        cache_put(policy, key, parsed)
+    return parsed
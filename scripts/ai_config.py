@@ -0,0 +1,156 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts.ai_common import load_yaml
+from scripts.ai_routing import AGENTS_CONFIG_PATH
+from scripts.ai_rules import HeuristicRule, parse_heuristic_rule
+
+POLICY_PATH = Path("config/review-policy.yaml")
+AGENT_PROMPTS_PATH = Path("config/agent-prompts.yaml")
+RULES_DIR = Path("config/rules")
+BUNDLE_DIR = Path(".ai_cache/config")
+BUNDLE_VERSION = 1
+MAX_KEPT_BUNDLES = 8
+
+_memo: dict[str, dict] = {}
+
+
+def config_sources() -> list[Path]:
+    rules = sorted(RULES_DIR.glob("*.yaml")) if RULES_DIR.exists() else []
+    return [POLICY_PATH, AGENT_PROMPTS_PATH, AGENTS_CONFIG_PATH, *rules]
+
+
+def sources_digest(paths: list[Path]) -> str:
+    digest = hashlib.sha256(f"bundle-v{BUNDLE_VERSION}".encode("utf-8"))
+    for path in paths:
+        digest.update(str(path).encode("utf-8") + b"\0")
+        try:
+            digest.update(path.read_bytes())
+        except OSError:
+            digest.update(b"\0missing")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _mapping(value: object, source: Path, problems: list[str]) -> dict:
+    if isinstance(value, dict):
+        return value
+    if value:
+        problems.append(f"{source}: 최상위가 매핑이 아니어서 무시합니다")
+    return {}
+
+
+def validate_bundle(bundle: dict) -> list[str]:
+    problems: list[str] = []
+    review_cfg = bundle["policy"].get("review", {}) or {}
+    agents = set((bundle["agent_prompts"].get("agents", {}) or {}).keys())
+    order = list(review_cfg.get("agents_order", []) or [])
+    if agents:
+        for name in order:
+            if name not in agents:
+                problems.append(f"review.agents_order: {name} 프롬프트가 {AGENT_PROMPTS_PATH}에 없습니다")
+    for name in review_cfg.get("blocking_agents", []) or []:
+        if name not in order:
+            problems.append(f"review.blocking_agents: {name}이(가) agents_order에 없습니다")
+    for name in review_cfg.get("rule_templates", []) or []:
+        if name not in bundle["rule_templates"]:
+            problems.append(f"review.rule_templates: {RULES_DIR / name}.yaml 이 없습니다")
+    for name in (bundle["routing"].get("file_routes", {}) or {}):
+        if name not in order:
+            problems.append(f"routing.file_routes: {name}이(가) agents_order에 없습니다")
+    return problems
+
+
+def compile_bundle() -> dict:
+    problems: list[str] = []
+    policy = _mapping(load_yaml(POLICY_PATH), POLICY_PATH, problems)
+    agent_prompts = _mapping(load_yaml(AGENT_PROMPTS_PATH), AGENT_PROMPTS_PATH, problems)
+    agents_cfg = _mapping(load_yaml(AGENTS_CONFIG_PATH), AGENTS_CONFIG_PATH, problems)
+    templates: dict[str, dict] = {}
+    heuristics: list[dict] = []
+    for path in config_sources()[3:]:
+        template = _mapping(load_yaml(path), path, problems)
+        for raw in template.pop("heuristics", None) or []:
+            rule = parse_heuristic_rule(raw, f"{path.stem}-{len(heuristics)}")
+            if rule is None:
+                problems.append(f"{path}: 잘못된 heuristics 항목 {raw!r}")
+                continue
+            if rule.kind == "pattern" and rule.pattern:
+                try:
+                    re.compile(rule.pattern)
+                except re.error as exc:
+                    # One bad pattern would break the combined matcher for every rule.
+                    problems.append(f"{path}: {rule.id} 정규식 오류({exc}), 규칙을 제외합니다")
+                    continue
+            heuristics.append(rule.__dict__)
+        templates[path.stem] = template
+    bundle = {
+        "version": BUNDLE_VERSION,
+        "policy": policy,
+        "agent_prompts": agent_prompts,
+        "routing": agents_cfg.get("routing", {}) or {},
+        "rule_templates": templates,
+        "heuristics": heuristics,
+    }
+    bundle["problems"] = problems + validate_bundle(bundle)
+    return bundle
+
+
+def _write_bundle(path: Path, bundle: dict) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(bundle, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        stale = sorted(path.parent.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in stale[MAX_KEPT_BUNDLES:]:
+            old.unlink()
+    except OSError:
+        pass
+
+
+def load_config_bundle() -> dict:
+    # Keyed by the sources' bytes: any edit recompiles, otherwise one JSON read replaces every yaml parse.
+    digest = sources_digest(config_sources())
+    if digest in _memo:
+        return _memo[digest]
+    path = BUNDLE_DIR / f"{digest}.json"
+    try:
+        bundle = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        bundle = compile_bundle()
+        for problem in bundle["problems"]:
+            print(f"[config] {problem}", file=sys.stderr)
+        _write_bundle(path, bundle)
+    _memo.clear()
+    _memo[digest] = bundle
+    return bundle
+
+
+def bundle_heuristic_rules(bundle: dict) -> list[HeuristicRule]:
+    return [HeuristicRule(**raw) for raw in bundle.get("heuristics", [])]
+
+
+def main() -> int:
+    digest = sources_digest(config_sources())
+    bundle = compile_bundle()
+    path = BUNDLE_DIR / f"{digest}.json"
+    _write_bundle(path, bundle)
+    for problem in bundle["problems"]:
+        print(f"[config] {problem}")
+    print(f"Wrote config bundle to {path}")
+    return 1 if bundle["problems"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
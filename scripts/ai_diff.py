@@ -0,0 +1,418 @@
+﻿from __future__ import annotations
+
+import re
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from typing import Iterable, Iterator
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DIFF_HEADER_RE = re.compile(r"^diff --git a/(.*) b/(.*)$")
+CHARS_PER_TOKEN = 4
+SUB_HUNK_HEADER_CHARS = 64
+INDENT_SENSITIVE_EXTS = (".py", ".pyi", ".yaml", ".yml", "Makefile", ".mk")
+
+
+@dataclass(slots=True)
+class Hunk:
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: list[str] = field(default_factory=list)
+    # New-side numbers of "+" lines and old-side numbers of "-" lines, ascending.
+    added: array = field(default_factory=lambda: array("I"))
+    removed: array = field(default_factory=lambda: array("I"))
+
+    def __post_init__(self) -> None:
+        if not self.added and not self.removed and len(self.lines) > 1:
+            self.added, self.removed = line_offsets(self.old_start, self.new_start, self.lines[1:])
+
+
+@dataclass(slots=True)
+class FileDiff:
+    path: str
+    old_path: str
+    header: list[str] = field(default_factory=list)
+    hunks: list[Hunk] = field(default_factory=list)
+
+    @property
+    def is_deleted(self) -> bool:
+        return self.path == "/dev/null"
+
+    @property
+    def is_new(self) -> bool:
+        return self.old_path == "/dev/null"
+
+    @property
+    def changed_path(self) -> str:
+        return self.old_path if self.is_deleted else self.path
+
+
+def line_offsets(old_start: int, new_start: int, body: Iterable[str]) -> tuple[array, array]:
+    added, removed = array("I"), array("I")
+    old_no, new_no = old_start, new_start
+    for line in body:
+        tag = line[:1]
+        if tag == "+":
+            added.append(new_no)
+            new_no += 1
+        elif tag == "-":
+            removed.append(old_no)
+            old_no += 1
+        elif tag == " ":
+            old_no += 1
+            new_no += 1
+    return added, removed
+
+
+def _strip_prefix(raw: str, prefix: str) -> str:
+    raw = raw.strip()
+    if raw.startswith('"') and raw.endswith('"'):
+        raw = raw[1:-1]
+    if raw == "/dev/null":
+        return raw
+    return raw[len(prefix):] if raw.startswith(prefix) else raw
+
+
+def _finish(file_diff: FileDiff) -> FileDiff:
+    if not file_diff.old_path:
+        file_diff.old_path = file_diff.path
+    return file_diff
+
+
+def iter_file_diffs(lines: Iterable[str], keep_lines: bool = True) -> Iterator[FileDiff]:
+    # Each file is yielded once the next one starts, so a piped `git diff` is never held whole.
+    # Without keep_lines hunks carry only their ranges and added/removed line numbers.
+    current: FileDiff | None = None
+    hunk: Hunk | None = None
+    old_left = new_left = old_no = new_no = 0
+    for line in lines:
+        if hunk is not None:
+            tag = line[:1]
+            if tag == "\\":
+                if keep_lines:
+                    hunk.lines.append(line)
+                continue
+            within = old_left > 0 or new_left > 0
+            if within and not line:
+                tag = line = " "
+            # Hand-written patches often undercount; past the counts, body lines are absorbed and the counts fixed.
+            if (
+                tag == " "
+                or (tag == "-" and (within or not line.startswith("--- ")))
+                or (tag == "+" and (within or not line.startswith("+++ ")))
+            ):
+                if keep_lines:
+                    hunk.lines.append(line)
+                if tag != "+":
+                    if tag == "-":
+                        hunk.removed.append(old_no)
+                    old_no += 1
+                    if within:
+                        old_left -= 1
+                    else:
+                        hunk.old_count += 1
+                if tag != "-":
+                    if tag == "+":
+                        hunk.added.append(new_no)
+                    new_no += 1
+                    if within:
+                        new_left -= 1
+                    else:
+                        hunk.new_count += 1
+                continue
+            hunk = None
+        if line.startswith("diff --git "):
+            if current is not None:
+                yield _finish(current)
+            match = DIFF_HEADER_RE.match(line)
+            old_path, new_path = (match.group(1), match.group(2)) if match else ("", "")
+            current = FileDiff(path=new_path, old_path=old_path, header=[line])
+            continue
+        if line.startswith("--- ") and (
+            current is None or current.hunks or any(h.startswith("--- ") for h in current.header)
+        ):
+            # Plain unified diff without a "diff --git" line.
+            if current is not None:
+                yield _finish(current)
+            current = FileDiff(path="", old_path="")
+        if current is None:
+            continue
+        header_match = HUNK_HEADER_RE.match(line)
+        if header_match:
+            old_start, old_count, new_start, new_count = header_match.groups()
+            hunk = Hunk(
+                old_start=int(old_start),
+                old_count=int(old_count) if old_count is not None else 1,
+                new_start=int(new_start),
+                new_count=int(new_count) if new_count is not None else 1,
+                lines=[line] if keep_lines else [],
+            )
+            old_left, new_left = hunk.old_count, hunk.new_count
+            old_no, new_no = hunk.old_start, hunk.new_start
+            current.hunks.append(hunk)
+            continue
+        if current.hunks or not line:
+            continue
+        current.header.append(line)
+        if line.startswith("--- "):
+            current.old_path = _strip_prefix(line[4:], "a/")
+        elif line.startswith("+++ "):
+            current.path = _strip_prefix(line[4:], "b/")
+        elif line.startswith("rename from "):
+            current.old_path = line[len("rename from "):].strip()
+        elif line.startswith("rename to "):
+            current.path = line[len("rename to "):].strip()
+    if current is not None:
+        yield _finish(current)
+
+
+def parse_unified_diff(diff_text: str) -> list[FileDiff]:
+    return list(iter_file_diffs(diff_text.split("\n")))
+
+
+def render_file_diff(file_diff: FileDiff, hunks: list[Hunk] | None = None) -> str:
+    lines = list(file_diff.header)
+    for hunk in file_diff.hunks if hunks is None else hunks:
+        lines.extend(hunk.lines)
+    return "\n".join(lines)
+
+
+def remap_line(hunks: list[Hunk], line: int) -> int | None:
+    # Maps an old-side line number to the new side; None when the line itself was edited or removed.
+    offset = 0
+    for hunk in hunks:
+        if hunk.old_count == 0:
+            if line <= hunk.old_start:
+                return line + offset
+            offset += hunk.new_count
+            continue
+        if line < hunk.old_start:
+            return line + offset
+        if line < hunk.old_start + hunk.old_count:
+            removed_above = bisect_left(hunk.removed, line)
+            if removed_above < len(hunk.removed) and hunk.removed[removed_above] == line:
+                return None
+            # Context lines keep their order; every added line at or before the position pushes it down.
+            new_no = hunk.new_start + (line - hunk.old_start - removed_above)
+            for added in hunk.added:
+                if added > new_no:
+                    break
+                new_no += 1
+            return new_no
+        offset += hunk.new_count - hunk.old_count
+    return line + offset
+
+
+def new_side_lines(file_diff: FileDiff) -> Iterator[tuple[int, str]]:
+    # The hunks' own context and "+" lines, numbered on the new side: the file as the diff shows it.
+    for hunk in file_diff.hunks:
+        line_no = hunk.new_start
+        for line in hunk.lines[1:]:
+            if line[:1] in (" ", "+"):
+                yield line_no, line[1:].removesuffix("\r")
+                line_no += 1
+
+
+def changed_spans(file_diff: FileDiff) -> list[tuple[int, int]]:
+    # New-side line ranges covered by the hunks; a pure deletion still marks the line it left behind.
+    return [(hunk.new_start, hunk.new_start + max(hunk.new_count, 1) - 1) for hunk in file_diff.hunks]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def rendered_chars(file_diff: FileDiff) -> int:
+    lines = len(file_diff.header) + sum(len(hunk.lines) for hunk in file_diff.hunks)
+    chars = sum(map(len, file_diff.header)) + sum(sum(map(len, hunk.lines)) for hunk in file_diff.hunks)
+    return chars + max(lines - 1, 0)
+
+
+def _make_hunk(old_start: int, old_count: int, new_start: int, new_count: int, body: list[str]) -> Hunk:
+    header = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@"
+    return Hunk(old_start, old_count, new_start, new_count, [header, *body])
+
+
+def split_hunk(hunk: Hunk, max_chars: int) -> list[Hunk]:
+    if sum(len(line) + 1 for line in hunk.lines) <= max_chars:
+        return [hunk]
+    pieces: list[Hunk] = []
+    old_no, new_no = hunk.old_start, hunk.new_start
+    old_start, new_start, old_count, new_count = old_no, new_no, 0, 0
+    body: list[str] = []
+    size = 0
+    for line in hunk.lines[1:]:
+        if body and size + len(line) + 1 > max_chars - SUB_HUNK_HEADER_CHARS:
+            pieces.append(_make_hunk(old_start, old_count, new_start, new_count, body))
+            old_start, new_start, old_count, new_count = old_no, new_no, 0, 0
+            body, size = [], 0
+        body.append(line)
+        size += len(line) + 1
+        tag = line[:1]
+        if tag in (" ", "-"):
+            old_no += 1
+            old_count += 1
+        if tag in (" ", "+"):
+            new_no += 1
+            new_count += 1
+    if body:
+        pieces.append(_make_hunk(old_start, old_count, new_start, new_count, body))
+    return pieces
+
+
+def _file_units(file_diff: FileDiff, max_chars: int) -> list[str]:
+    text = render_file_diff(file_diff)
+    if len(text) <= max_chars:
+        return [text]
+    # Oversized files are cut on hunk boundaries; every piece repeats the file header.
+    header = "\n".join(file_diff.header)
+    budget = max(max_chars - len(header) - 1, SUB_HUNK_HEADER_CHARS * 2)
+    units: list[str] = []
+    group: list[str] = []
+    size = len(header)
+    for hunk in file_diff.hunks:
+        for piece in split_hunk(hunk, budget):
+            piece_text = "\n".join(piece.lines)
+            if group and size + len(piece_text) + 1 > max_chars:
+                units.append("\n".join([header, *group]))
+                group, size = [], len(header)
+            group.append(piece_text)
+            size += len(piece_text) + 1
+    if group:
+        units.append("\n".join([header, *group]))
+    return units
+
+
+class ShardPacker:
+    # Files are packed in diff order, so neighbouring paths (same package) share a shard.
+    # Past max_shards only the count is kept, so a huge diff can be fed through one file at a time.
+    def __init__(self, max_tokens: int, max_shards: int = 0) -> None:
+        self.max_chars = max(max_tokens, 1) * CHARS_PER_TOKEN
+        self.max_shards = max_shards
+        self.shards: list[str] = []
+        self.total = 0
+        self.current: list[str] = []
+        self.size = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.total - len(self.shards)
+
+    def add(self, file_diff: FileDiff) -> None:
+        for unit in _file_units(file_diff, self.max_chars):
+            if self.current and self.size + len(unit) + 1 > self.max_chars:
+                self._emit()
+            self.current.append(unit)
+            self.size += len(unit) + 1
+
+    def _emit(self) -> None:
+        self.total += 1
+        if not self.max_shards or len(self.shards) < self.max_shards:
+            self.shards.append("\n".join(self.current))
+        self.current, self.size = [], 0
+
+    def finish(self) -> list[str]:
+        if self.current:
+            self._emit()
+        return self.shards
+
+
+def shard_file_diffs(file_diffs: Iterable[FileDiff], max_tokens: int) -> list[str]:
+    packer = ShardPacker(max_tokens)
+    for file_diff in file_diffs:
+        packer.add(file_diff)
+    return packer.finish()
+
+
+def shard_diff(diff_text: str, max_tokens: int) -> list[str]:
+    if not diff_text.strip():
+        return []
+    file_diffs = parse_unified_diff(diff_text)
+    if not file_diffs:
+        return [diff_text]
+    return shard_file_diffs(file_diffs, max_tokens)
+
+
+def is_whitespace_only(hunk: Hunk, indent_sensitive: bool) -> bool:
+    removed = [line[1:] for line in hunk.lines[1:] if line[:1] == "-"]
+    added = [line[1:] for line in hunk.lines[1:] if line[:1] == "+"]
+    if not removed and not added:
+        return False
+    if indent_sensitive:
+        # Leading indentation is syntax here; only trailing spaces and blank lines are noise.
+        return [r.rstrip() for r in removed if r.strip()] == [a.rstrip() for a in added if a.strip()]
+    # Runs of whitespace (line breaks included) collapse to one space; removing or adding a
+    # separator, as in "a b" -> "ab", changes tokens and is kept.
+    return " ".join(" ".join(removed).split()) == " ".join(" ".join(added).split())
+
+
+def trim_context(hunk: Hunk, keep: int) -> tuple[Hunk, int]:
+    body = hunk.lines[1:]
+    lead = 0
+    while lead < len(body) and body[lead][:1] == " ":
+        lead += 1
+    trail = 0
+    if not any(line[:1] == "\\" for line in body):
+        while trail < len(body) - lead and body[len(body) - 1 - trail][:1] == " ":
+            trail += 1
+    cut_lead, cut_trail = max(0, lead - keep), max(0, trail - keep)
+    if not cut_lead and not cut_trail:
+        return hunk, 0
+    kept = body[cut_lead : len(body) - cut_trail]
+    old_count = hunk.old_count - cut_lead - cut_trail
+    new_count = hunk.new_count - cut_lead - cut_trail
+    old_start = hunk.old_start + cut_lead - (1 if old_count == 0 else 0)
+    new_start = hunk.new_start + cut_lead - (1 if new_count == 0 else 0)
+    return _make_hunk(old_start, old_count, new_start, new_count, kept), cut_lead + cut_trail
+
+
+def compaction_stats() -> dict:
+    return {"files_dropped": [], "whitespace_hunks_dropped": 0, "context_lines_trimmed": 0}
+
+
+def compact_file_diff(
+    file_diff: FileDiff,
+    exclude_globs: list[str],
+    context_lines: int,
+    stats: dict,
+    indent_sensitive_exts: tuple[str, ...] = INDENT_SENSITIVE_EXTS,
+) -> FileDiff | None:
+    path = file_diff.changed_path
+    if any(fnmatch(path, pattern) for pattern in exclude_globs):
+        stats["files_dropped"].append(path)
+        return None
+    indent_sensitive = path.endswith(indent_sensitive_exts)
+    hunks: list[Hunk] = []
+    for hunk in file_diff.hunks:
+        if is_whitespace_only(hunk, indent_sensitive):
+            stats["whitespace_hunks_dropped"] += 1
+            continue
+        if context_lines >= 0:
+            hunk, trimmed = trim_context(hunk, context_lines)
+            stats["context_lines_trimmed"] += trimmed
+        hunks.append(hunk)
+    if file_diff.hunks and not hunks:
+        stats["files_dropped"].append(path)
+        return None
+    return FileDiff(file_diff.path, file_diff.old_path, file_diff.header, hunks)
+
+
+def compact_diff(
+    diff_text: str,
+    exclude_globs: list[str],
+    context_lines: int,
+    indent_sensitive_exts: tuple[str, ...] = INDENT_SENSITIVE_EXTS,
+) -> tuple[str, dict]:
+    stats = compaction_stats()
+    file_diffs = parse_unified_diff(diff_text)
+    if not file_diffs:
+        return diff_text, stats
+    kept: list[str] = []
+    for file_diff in file_diffs:
+        compacted = compact_file_diff(file_diff, exclude_globs, context_lines, stats, indent_sensitive_exts)
+        if compacted is not None:
+            kept.append(render_file_diff(compacted))
+    return "\n".join(kept), stats
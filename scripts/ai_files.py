@@ -0,0 +1,101 @@
+﻿from __future__ import annotations
+
+import os
+import subprocess
+from typing import Iterable
+
+SKIP_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".venv",
+    "venv",
+    "node_modules",
+    "__pycache__",
+    ".ai_cache",
+    ".tox",
+    ".nox",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+}
+
+
+def _git_paths(args: list[str]) -> list[str] | None:
+    try:
+        result = subprocess.run(["git", *args], capture_output=True, check=False)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return [p for p in result.stdout.decode("utf-8", errors="surrogateescape").split("\0") if p]
+
+
+def filter_extensions(paths: Iterable[str], exts: Iterable[str] | None) -> list[str]:
+    if not exts:
+        return list(paths)
+    suffixes = tuple(exts)
+    return [p for p in paths if p.endswith(suffixes)]
+
+
+def walk_files(exts: Iterable[str] | None = None) -> list[str]:
+    found: list[str] = []
+    for root, dirs, files in os.walk("."):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.endswith(".egg-info"))
+        rel_root = os.path.relpath(root, ".")
+        for name in sorted(files):
+            found.append(name if rel_root == "." else f"{rel_root}/{name}".replace(os.sep, "/"))
+    return filter_extensions(found, exts)
+
+
+def list_repo_files(exts: Iterable[str] | None = None) -> list[str]:
+    # Tracked plus untracked-but-not-ignored files, straight from the index; no tree walk.
+    paths = _git_paths(["ls-files", "-z", "--cached", "--others", "--exclude-standard"])
+    if paths is None:
+        return walk_files(exts)
+    return filter_extensions(sorted(set(paths)), exts)
+
+
+def list_changed_files(
+    base_sha: str,
+    head_sha: str,
+    exts: Iterable[str] | None = None,
+    include_deleted: bool = True,
+) -> list[str]:
+    if not base_sha or not head_sha:
+        return []
+    args = ["diff", "--name-only", "-z"]
+    if not include_deleted:
+        args.append("--diff-filter=d")
+    paths = _git_paths([*args, base_sha, head_sha])
+    if not paths:
+        return []
+    return filter_extensions(paths, exts)
+
+
+def read_blobs(specs: list[str]) -> list[bytes | None]:
+    # One `git cat-file --batch` for many "<rev>:<path>" specs; None where the spec is not a blob.
+    if not specs:
+        return []
+    request = "".join(f"{spec}\n" for spec in specs).encode("utf-8", errors="surrogateescape")
+    try:
+        result = subprocess.run(["git", "cat-file", "--batch"], input=request, capture_output=True, check=False)
+    except OSError:
+        return [None] * len(specs)
+    out = result.stdout
+    blobs: list[bytes | None] = []
+    pos = 0
+    for _ in specs:
+        end = out.find(b"\n", pos)
+        if end == -1:
+            blobs.append(None)
+            continue
+        parts = out[pos:end].split(b" ")
+        pos = end + 1
+        if len(parts) != 3 or not parts[2].isdigit():
+            blobs.append(None)
+            continue
+        size = int(parts[2])
+        blobs.append(out[pos : pos + size] if parts[1] == b"blob" else None)
+        pos += size + 1
+    return blobs
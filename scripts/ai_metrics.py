@@ -0,0 +1,212 @@
+﻿from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+
+if TYPE_CHECKING:
+    from scripts.ai_profile import StageProfiler
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.perf_counter()
+            self.stages: dict[str, dict[str, float]] = {}
+            self.calls: list[dict] = []
+            self.counters: dict[str, int] = {}
+            # retry.run_deadline_sec counts from the run's first request, so overlapping runs keep their own.
+            self.deadline: float | None = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        hook = _stage_hook
+        if hook is not None:
+            hook.enter(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+            if hook is not None:
+                hook.exit(name)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "count": 0})
+            entry["seconds"] += seconds
+            entry["count"] += 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def remaining_budget(self, budget: float) -> float:
+        with self._lock:
+            if self.deadline is None:
+                self.deadline = time.monotonic() + budget
+            return self.deadline - time.monotonic()
+
+    def record_call(
+        self,
+        label: str,
+        model: str,
+        seconds: float,
+        status: str,
+        retries: int = 0,
+        usage: dict | None = None,
+        cached: bool = False,
+        first_item_sec: float | None = None,
+    ) -> None:
+        usage = usage or {}
+        details = usage.get("input_tokens_details") or {}
+        call = {
+            "label": label,
+            "model": model,
+            "seconds": round(seconds, 4),
+            "status": status,
+            "retries": retries,
+            "cached": cached,
+            "input_tokens": int(usage.get("input_tokens", 0) or 0),
+            "output_tokens": int(usage.get("output_tokens", 0) or 0),
+            "cached_tokens": int(details.get("cached_tokens", 0) or 0),
+        }
+        if first_item_sec is not None:
+            call["first_item_sec"] = round(first_item_sec, 4)
+        with self._lock:
+            self.calls.append(call)
+
+    def snapshot(self, policy: dict) -> dict:
+        pricing = policy.get("ai", {}).get("pricing", {}) or {}
+        with self._lock:
+            stages = {name: {"seconds": round(v["seconds"], 4), "count": int(v["count"])} for name, v in self.stages.items()}
+            calls = [dict(c) for c in self.calls]
+            wall = time.perf_counter() - self.started
+        for call in calls:
+            call["cost_usd"] = estimate_cost(call, pricing.get(call["model"], {}))
+        totals = {
+            "calls": len(calls),
+            "api_calls": sum(1 for c in calls if not c["cached"]),
+            "cache_hits": sum(1 for c in calls if c["cached"]),
+            "retries": sum(c["retries"] for c in calls),
+            "input_tokens": sum(c["input_tokens"] for c in calls),
+            "output_tokens": sum(c["output_tokens"] for c in calls),
+            "cached_tokens": sum(c["cached_tokens"] for c in calls),
+            "cost_usd": round(sum(c["cost_usd"] for c in calls), 6),
+        }
+        return {"wall_time_sec": round(wall, 4), "stages": stages, "calls": calls, "totals": totals}
+
+
+def estimate_cost(call: dict, rates: dict) -> float:
+    if not rates:
+        return 0.0
+    uncached = max(0, call["input_tokens"] - call["cached_tokens"])
+    cached_rate = float(rates.get("cached_input_per_1m", rates.get("input_per_1m", 0.0)))
+    cost = (
+        uncached * float(rates.get("input_per_1m", 0.0))
+        + call["cached_tokens"] * cached_rate
+        + call["output_tokens"] * float(rates.get("output_per_1m", 0.0))
+    ) / 1_000_000
+    return round(cost, 6)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_openmetrics(snapshot: dict, pipeline: str) -> str:
+    p = f'pipeline="{_label(pipeline)}"'
+    lines = [
+        "# TYPE autoreview_wall_seconds gauge",
+        "# UNIT autoreview_wall_seconds seconds",
+        f"autoreview_wall_seconds{{{p}}} {snapshot['wall_time_sec']}",
+        "# TYPE autoreview_stage_seconds gauge",
+        "# UNIT autoreview_stage_seconds seconds",
+    ]
+    for name, stage in sorted(snapshot["stages"].items()):
+        lines.append(f'autoreview_stage_seconds{{{p},stage="{_label(name)}"}} {stage["seconds"]}')
+
+    per_label: dict[str, float] = {}
+    for call in snapshot["calls"]:
+        per_label[call["label"]] = per_label.get(call["label"], 0.0) + call["seconds"]
+    lines.append("# TYPE autoreview_call_seconds gauge")
+    lines.append("# UNIT autoreview_call_seconds seconds")
+    for label, seconds in sorted(per_label.items()):
+        lines.append(f'autoreview_call_seconds{{{p},agent="{_label(label)}"}} {round(seconds, 4)}')
+
+    totals = snapshot["totals"]
+    lines.append("# TYPE autoreview_api_calls counter")
+    lines.append(f"autoreview_api_calls_total{{{p}}} {totals['api_calls']}")
+    lines.append("# TYPE autoreview_cache_hits counter")
+    lines.append(f"autoreview_cache_hits_total{{{p}}} {totals['cache_hits']}")
+    lines.append("# TYPE autoreview_retries counter")
+    lines.append(f"autoreview_retries_total{{{p}}} {totals['retries']}")
+    lines.append("# TYPE autoreview_tokens counter")
+    for kind in ("input", "output", "cached"):
+        lines.append(f'autoreview_tokens_total{{{p},kind="{kind}"}} {totals[f"{kind}_tokens"]}')
+    lines.append("# TYPE autoreview_cost_usd counter")
+    lines.append(f"autoreview_cost_usd_total{{{p}}} {totals['cost_usd']}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_openmetrics(path: Path, snapshot: dict, pipeline: str) -> None:
+    path.write_text(to_openmetrics(snapshot, pipeline), encoding="utf-8")
+
+
+def export_metrics(policy: dict, pipeline: str) -> dict:
+    snapshot = METRICS.snapshot(policy)
+    path = os.environ.get("AI_METRICS_OPENMETRICS", "").strip()
+    if path:
+        write_openmetrics(Path(path), snapshot, pipeline)
+    return snapshot
+
+
+class _ActiveMetrics:
+    # Resolves to the collector bound to the current job; scripts run with the process default.
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_active.get(), name)
+
+
+_active: ContextVar[Metrics] = ContextVar("ai_metrics", default=Metrics())
+METRICS = _ActiveMetrics()
+# Installed by scripts/ai_profile.py for a profiled run only; otherwise a stage costs one None check.
+_stage_hook: StageProfiler | None = None
+
+
+def set_stage_hook(hook: StageProfiler | None) -> None:
+    global _stage_hook
+    _stage_hook = hook
+
+
+@contextmanager
+def use_metrics(metrics: Metrics) -> Iterator[Metrics]:
+    token = _active.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _active.reset(token)
+
+
+def bind_metrics(func: Callable[..., Any]) -> Callable[..., Any]:
+    # Pool threads do not inherit context variables, so carry the caller's over: its metrics
+    # collector and whatever else the run is bound to, such as its request limiter.
+    context = copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        # A context can only be entered by one thread at a time; every call gets its own copy.
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
@@ -0,0 +1,127 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Iterator
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts.ai_common import write_json
+
+JSONL_FORMAT = "ai-review-jsonl/1"
+# Bulky or derivable fields that the header replaces with a count or a hash.
+RECORD_FIELDS = ("comments", "changed_files", "policy")
+
+
+def policy_hash(policy: dict) -> str:
+    material = json.dumps(policy, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def output_format(path: Path) -> str:
+    fmt = os.environ.get("AI_REVIEW_FORMAT", "").strip().lower()
+    if fmt in ("json", "jsonl"):
+        return fmt
+    return "jsonl" if path.suffix == ".jsonl" else "json"
+
+
+def _record(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def review_header(result: dict) -> dict:
+    header = {"type": "header", "format": JSONL_FORMAT}
+    header.update((key, value) for key, value in result.items() if key not in RECORD_FIELDS)
+    header["policy_hash"] = policy_hash(result.get("policy", {}))
+    header["comment_count"] = len(result.get("comments", []))
+    header["changed_file_count"] = len(result.get("changed_files", []))
+    return header
+
+
+def write_review_jsonl(path: Path, result: dict) -> None:
+    # Header first so readers can stop after one line; one record per comment/file after it.
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as handle:
+        handle.write(_record(review_header(result)))
+        for comment in result.get("comments", []):
+            handle.write(_record({"type": "comment", **comment}))
+        for file in result.get("changed_files", []):
+            handle.write(_record({"type": "file", "path": file}))
+    os.replace(tmp, path)
+
+
+def write_review(path: Path, result: dict) -> None:
+    if output_format(path) == "jsonl":
+        write_review_jsonl(path, result)
+    else:
+        write_json(path, result)
+
+
+def _first_record(path: Path) -> dict | None:
+    with open(path, "r", encoding="utf-8") as handle:
+        line = handle.readline()
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and record.get("type") == "header" else None
+
+
+def read_review_header(path: Path) -> dict:
+    header = _first_record(path)
+    if header is not None:
+        return header
+    # Legacy pretty-printed document: the whole file has to be parsed once.
+    header = review_header(json.loads(path.read_text(encoding="utf-8")))
+    header["format"] = "json"
+    return header
+
+
+def iter_review_records(path: Path, kind: str) -> Iterator[dict]:
+    if _first_record(path) is None:
+        review = json.loads(path.read_text(encoding="utf-8"))
+        if kind == "comment":
+            yield from review.get("comments", [])
+        elif kind == "file":
+            yield from ({"path": file} for file in review.get("changed_files", []))
+        return
+    with open(path, "r", encoding="utf-8") as handle:
+        next(handle, None)
+        for line in handle:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.pop("type", None) == kind:
+                yield record
+
+
+def load_review(path: Path) -> dict:
+    # Rebuilds the json-format shape (minus the policy) from either format.
+    review = read_review_header(path)
+    review.pop("type", None)
+    review["comments"] = list(iter_review_records(path, "comment"))
+    review["changed_files"] = [record["path"] for record in iter_review_records(path, "file")]
+    return review
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if len(args) != 2 or args[0] not in ("header", "comments"):
+        print("usage: ai_output.py header|comments <review file>", file=sys.stderr)
+        return 2
+    path = Path(args[1])
+    if args[0] == "header":
+        sys.stdout.write(_record(read_review_header(path)))
+    else:
+        for comment in iter_review_records(path, "comment"):
+            sys.stdout.write(_record(comment))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
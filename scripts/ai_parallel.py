@@ -0,0 +1,54 @@
+﻿from __future__ import annotations
+
+import os
+from typing import Any, Callable, Sequence
+
+DEFAULT_CHUNK_SIZE = 64
+
+
+def resolve_workers(value: Any) -> int:
+    env_value = os.environ.get("AI_HEURISTIC_WORKERS", "").strip()
+    if env_value:
+        value = env_value
+    try:
+        workers = int(value or 0)
+    except (TypeError, ValueError):
+        workers = 0
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def chunked(items: Sequence[Any], size: int) -> list[list[Any]]:
+    size = max(1, size)
+    return [list(items[i : i + size]) for i in range(0, len(items), size)]
+
+
+def map_chunks(
+    func: Callable[[list[Any]], list[Any]],
+    items: Sequence[Any],
+    workers: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    initializer: Callable[..., None] | None = None,
+    initargs: tuple = (),
+) -> list[Any]:
+    batches = chunked(items, chunk_size)
+    if workers <= 1 or len(batches) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [result for batch in batches for result in func(batch)]
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Batch ranges and service jobs call this from threads, and forking a multithreaded
+    # process can leave the child blocked on a lock another thread held, so workers are
+    # started from a fork server (spawn where there is none).
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    # Batches amortize pickling; map() yields in submission order so output stays deterministic.
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(batches)),
+        mp_context=multiprocessing.get_context(method),
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        return [result for batch_results in pool.map(func, batches) for result in batch_results]
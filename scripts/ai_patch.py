@@ -0,0 +1,238 @@
+﻿from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+
+from scripts.ai_diff import FileDiff, Hunk, iter_file_diffs
+
+DEFAULT_FUZZ = 2
+
+
+@dataclass
+class PatchOutcome:
+    ok: bool
+    files: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+
+def parse_patch(patch_text: str, keep_lines: bool = True) -> list[FileDiff]:
+    file_diffs = iter_file_diffs(patch_text.split("\n"), keep_lines)
+    return [fd for fd in file_diffs if fd.hunks or fd.path != fd.old_path]
+
+
+def patch_paths(file_diffs: list[FileDiff]) -> set[str]:
+    paths = {fd.path for fd in file_diffs} | {fd.old_path for fd in file_diffs}
+    return {p for p in paths if p and p != "/dev/null"}
+
+
+def is_safe_path(path: str) -> bool:
+    pure = PurePosixPath(path)
+    return bool(path) and not pure.is_absolute() and ".." not in pure.parts and not path.startswith(".git/")
+
+
+def _split_text(text: str) -> tuple[list[str], bool, str]:
+    # Lines keep their "\r", so untouched lines are written back byte for byte; the first line's
+    # terminator is the one given to the lines a patch adds.
+    lines = text.split("\n")
+    ends_with_newline = lines[-1] == ""
+    if ends_with_newline:
+        lines.pop()
+    crlf = bool(lines) and (len(lines) > 1 or ends_with_newline) and lines[0].endswith("\r")
+    return lines, ends_with_newline, "\r\n" if crlf else "\n"
+
+
+def _hunk_blocks(hunk: Hunk) -> tuple[list[str], list[str], int, int, bool | None]:
+    old_block: list[str] = []
+    new_block: list[str] = []
+    body = hunk.lines[1:]
+    for line in body:
+        tag = line[:1]
+        if tag in (" ", "-"):
+            old_block.append(line[1:])
+        if tag in (" ", "+"):
+            new_block.append(line[1:])
+    lead = 0
+    while lead < len(body) and body[lead][:1] == " ":
+        lead += 1
+    trail = 0
+    tail = [line for line in body if line[:1] != "\\"]
+    while trail < len(tail) - lead and tail[len(tail) - 1 - trail][:1] == " ":
+        trail += 1
+
+    # "\ No newline at end of file" after the last new-side line decides the final newline.
+    new_eol: bool | None = None
+    for prev, line in zip(body, body[1:]):
+        if line.startswith("\\"):
+            if prev[:1] in (" ", "+"):
+                new_eol = False
+            elif new_eol is None:
+                new_eol = True
+    return old_block, new_block, lead, trail, new_eol
+
+
+def _matches(lines: list[str], pos: int, block: list[str], loose: bool) -> bool:
+    if pos < 0 or pos + len(block) > len(lines):
+        return False
+    if loose:
+        return all(
+            lines[pos + i].rstrip().lstrip("\ufeff") == block[i].rstrip().lstrip("\ufeff") for i in range(len(block))
+        )
+    return lines[pos : pos + len(block)] == block
+
+
+def _find_block(lines: list[str], block: list[str], expected: int, lower: int) -> int | None:
+    if not block:
+        return max(lower, min(expected, len(lines)))
+    upper = len(lines) - len(block)
+    if upper < lower:
+        return None
+    expected = max(lower, min(expected, upper))
+    for loose in (False, True):
+        # Search outward from the line number the hunk claims, like patch(1) offsets.
+        for distance in range(0, max(expected - lower, upper - expected) + 1):
+            for pos in (expected - distance, expected + distance):
+                if lower <= pos <= upper and _matches(lines, pos, block, loose):
+                    return pos
+    return None
+
+
+def apply_hunks(
+    lines: list[str],
+    file_diff: FileDiff,
+    fuzz: int = DEFAULT_FUZZ,
+    newline: str = "\n",
+) -> tuple[list[str] | None, bool | None, list[str]]:
+    # Hunks are matched with "\r" ignored on both sides; lines they add get the file's terminator.
+    keys = [line.removesuffix("\r") for line in lines]
+    cr = "\r" if newline == "\r\n" else ""
+    result: list[str] = []
+    errors: list[str] = []
+    cursor = 0
+    drift = 0
+    final_eol: bool | None = None
+    for number, hunk in enumerate(file_diff.hunks, start=1):
+        old_block, new_block, lead, trail, new_eol = _hunk_blocks(hunk)
+        old_block = [line.removesuffix("\r") for line in old_block]
+        new_block = [line.removesuffix("\r") + cr for line in new_block]
+        base = hunk.old_start if hunk.old_count == 0 else hunk.old_start - 1
+        placed: tuple[int, int, int] | None = None
+        for level in range(0, fuzz + 1):
+            cut_lead, cut_trail = min(level, lead), min(level, trail)
+            if level and not (cut_lead or cut_trail):
+                break
+            trimmed = old_block[cut_lead : len(old_block) - cut_trail]
+            pos = _find_block(keys, trimmed, base + drift + cut_lead, cursor)
+            if pos is not None:
+                placed = (pos, cut_lead, cut_trail)
+                break
+        if placed is None:
+            preview = old_block[lead] if lead < len(old_block) else (old_block[0] if old_block else "")
+            errors.append(
+                f"{file_diff.path}: hunk {number} (@@ -{hunk.old_start},{hunk.old_count}) "
+                f"does not match the working tree near line {hunk.old_start}: {preview.strip()[:80]!r}"
+            )
+            continue
+        pos, cut_lead, cut_trail = placed
+        drift = pos - cut_lead - base
+        result.extend(lines[cursor:pos])
+        result.extend(new_block[cut_lead : len(new_block) - cut_trail])
+        cursor = pos + len(old_block) - cut_lead - cut_trail
+        if new_eol is not None:
+            final_eol = new_eol
+    if errors:
+        return None, None, errors
+    result.extend(lines[cursor:])
+    return result, final_eol, errors
+
+
+def check_patch(
+    file_diffs: list[FileDiff],
+    root: Path = Path("."),
+    fuzz: int = DEFAULT_FUZZ,
+) -> tuple[dict[str, str | None], list[str]]:
+    planned: dict[str, str | None] = {}
+    errors: list[str] = []
+    for fd in file_diffs:
+        unsafe = [p for p in {fd.path, fd.old_path} if p != "/dev/null" and not is_safe_path(p)]
+        if unsafe:
+            errors.extend(f"{path}: path escapes the repository" for path in sorted(unsafe))
+            continue
+        if fd.is_new:
+            lines, eol, newline = [], True, "\n"
+            if (root / fd.path).exists():
+                errors.append(f"{fd.path}: file already exists")
+                continue
+        else:
+            source = root / fd.old_path
+            try:
+                text = planned[fd.old_path] if fd.old_path in planned else source.read_bytes().decode("utf-8")
+            except (OSError, UnicodeDecodeError) as exc:
+                errors.append(f"{fd.old_path}: cannot read ({exc.__class__.__name__})")
+                continue
+            if text is None:
+                errors.append(f"{fd.old_path}: deleted earlier in the same patch")
+                continue
+            lines, eol, newline = _split_text(text)
+        new_lines, new_eol, hunk_errors = apply_hunks(lines, fd, fuzz, newline)
+        if new_lines is None:
+            errors.extend(hunk_errors)
+            continue
+        if new_eol is not None:
+            eol = new_eol
+        if fd.is_deleted:
+            planned[fd.old_path] = None
+            continue
+        if fd.old_path != fd.path and not fd.is_new:
+            planned[fd.old_path] = None
+        if not eol and new_lines and newline == "\r\n":
+            new_lines[-1] = new_lines[-1].removesuffix("\r")
+        if lines and lines[0].startswith("\ufeff") and new_lines and not new_lines[0].startswith("\ufeff"):
+            # A hunk matched loosely over the first line; keep the file's BOM.
+            new_lines[0] = "\ufeff" + new_lines[0]
+        planned[fd.path] = "\n".join(new_lines) + ("\n" if eol and new_lines else "")
+    return planned, errors
+
+
+def write_planned(planned: dict[str, str | None], root: Path = Path(".")) -> None:
+    # Stage every file next to its target first so a failed write leaves the tree untouched.
+    staged: list[tuple[Path, Path]] = []
+    try:
+        for path, text in planned.items():
+            if text is None:
+                continue
+            target = root / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f".{target.name}.{os.getpid()}.autofix.tmp")
+            tmp.write_bytes(text.encode("utf-8"))
+            if target.exists():
+                os.chmod(tmp, target.stat().st_mode)
+            staged.append((tmp, target))
+    except OSError:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
+        raise
+    for tmp, target in staged:
+        os.replace(tmp, target)
+    for path, text in planned.items():
+        if text is None:
+            (root / path).unlink(missing_ok=True)
+
+
+def apply_patch(
+    file_diffs: list[FileDiff],
+    root: Path = Path("."),
+    fuzz: int = DEFAULT_FUZZ,
+    dry_run: bool = False,
+) -> PatchOutcome:
+    if not file_diffs:
+        return PatchOutcome(False, errors=["patch contains no file changes"])
+    planned, errors = check_patch(file_diffs, root, fuzz)
+    if errors:
+        return PatchOutcome(False, errors=errors)
+    if not dry_run:
+        try:
+            write_planned(planned, root)
+        except OSError as exc:
+            return PatchOutcome(False, errors=[f"write failed: {exc}"])
+    return PatchOutcome(True, files=sorted(planned))
@@ -0,0 +1,246 @@
+﻿from __future__ import annotations
+
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from scripts import ai_metrics
+from scripts.ai_metrics import set_stage_hook
+
+DEFAULT_TOP_N = 20
+# Frames below this share of a stage are folded into their parent; a flame graph cannot show them anyway.
+MIN_FRAME_US = 50.0
+MAX_STACK_DEPTH = 96
+# Roots that are the profiler switching itself on and off around a stage body.
+SKIP_ROOT_FILES = frozenset((__file__, ai_metrics.__file__, contextlib.__file__))
+# Allocation sites that belong to the profiler rather than the pipeline.
+SKIP_ALLOC_FILES = ("tracemalloc.py", "cProfile.py", "ai_profile.py")
+
+
+def profile_requested(argv: list[str]) -> bool:
+    if "--profile" in argv:
+        return True
+    value = os.environ.get("AI_PROFILE", "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return False
+    if value in ("1", "true", "yes", "on"):
+        return True
+    try:
+        rate = float(value)
+    except ValueError:
+        return False
+    # A fraction profiles that share of runs, so CI can leave the switch on permanently.
+    return random.random() < rate
+
+
+@lru_cache(maxsize=None)
+def _short_path(filename: str) -> str:
+    path = Path(filename)
+    try:
+        return path.resolve().relative_to(ROOT_DIR).as_posix()
+    except ValueError:
+        return "/".join(path.parts[-2:])
+
+
+def _frame_label(func: tuple) -> str:
+    filename, _, name = func
+    label = name if filename == "~" else f"{_short_path(filename)}:{name}"
+    return label.replace(";", ",")
+
+
+def collapse_profile(stats: dict, prefix: str, min_us: float = MIN_FRAME_US) -> Counter:
+    # cProfile keeps caller->callee edges, not stacks: paths are rebuilt from the roots down and each
+    # edge's time is split in proportion to the share of the callee reached along that path.
+    children: dict[tuple, list[tuple[tuple, float]]] = {}
+    roots: list[tuple] = []
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers and func[0] not in SKIP_ROOT_FILES:
+            roots.append(func)
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    stacks: Counter = Counter()
+
+    def walk(func: tuple, path: tuple[str, ...], seconds: float, seen: frozenset) -> None:
+        _, _, own, total, _ = stats[func]
+        share = seconds / total if total > 0 else 0.0
+        path = (*path, _frame_label(func))
+        edges = children.get(func, ())
+        # Recursive edges (imports, mostly) can add up to more than the callee's total; clamp to this frame.
+        budget = max(0.0, seconds - own * share)
+        spent = sum(edge_seconds for _, edge_seconds in edges) * share
+        scale = share * min(1.0, budget / spent) if spent > 0 else share
+        folded = 0.0
+        for child, edge_seconds in edges:
+            child_seconds = edge_seconds * scale
+            if child in seen or len(path) >= MAX_STACK_DEPTH or child_seconds * 1e6 < min_us:
+                folded += child_seconds
+                continue
+            walk(child, path, child_seconds, seen | {child})
+        self_us = (own * share + folded) * 1e6
+        if self_us >= 1:
+            stacks[";".join(path)] += self_us
+
+    for root in roots:
+        walk(root, (prefix,), stats[root][3], frozenset((root,)))
+    return stacks
+
+
+class StageProfiler:
+    # One cProfile per open stage; stage names become the root frames of the collapsed stacks.
+    # Traces are cleared when a top-level stage opens, so its closing snapshot holds only what the
+    # stage allocated and kept: grouping a snapshot is pure Python and costs O(live blocks).
+    def __init__(self, top_n: int = DEFAULT_TOP_N) -> None:
+        import tracemalloc
+
+        self.top_n = top_n
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stacks: Counter = Counter()
+        self.stages: dict[str, dict] = {}
+        self.open: list[dict] = []
+        tracemalloc.start()
+
+    def _frames(self) -> list[dict]:
+        frames = getattr(self.local, "frames", None)
+        if frames is None:
+            frames = self.local.frames = []
+        return frames
+
+    def _track_peak(self) -> None:
+        # Peaks are process-wide; every stage open at the time is charged with them.
+        import tracemalloc
+
+        _, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            for frame in self.open:
+                frame["peak"] = max(frame["peak"], peak)
+        tracemalloc.reset_peak()
+
+    def enter(self, name: str) -> None:
+        import cProfile
+        import tracemalloc
+
+        frames = self._frames()
+        if frames and frames[-1]["profile"] is not None:
+            frames[-1]["profile"].disable()
+        self._track_peak()
+        with self.lock:
+            top_level = not self.open
+        if top_level:
+            tracemalloc.clear_traces()
+        frame = {
+            "name": name,
+            "path": ";".join([*(f["name"] for f in frames), name]),
+            "snapshot": None if top_level else tracemalloc.take_snapshot(),
+            "peak": 0,
+            "started": time.perf_counter(),
+        }
+        with self.lock:
+            self.open.append(frame)
+        frames.append(frame)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process, and that one already sees this thread.
+            profile = None
+        frame["profile"] = profile
+
+    def exit(self, name: str) -> None:
+        import tracemalloc
+
+        frames = self._frames()
+        frame = frames.pop()
+        profile = frame["profile"]
+        if profile is not None:
+            profile.disable()
+        seconds = time.perf_counter() - frame["started"]
+        self._track_peak()
+        with self.lock:
+            self.open.remove(frame)
+        snapshot = tracemalloc.take_snapshot()
+        if frame["snapshot"] is None:
+            allocations = [(s.traceback[0], s.size, s.count) for s in snapshot.statistics("lineno")]
+        else:
+            diff = snapshot.compare_to(frame["snapshot"], "lineno")
+            allocations = [(s.traceback[0], s.size_diff, s.count_diff) for s in diff]
+        stacks: Counter = Counter()
+        if profile is not None:
+            profile.create_stats()
+            stacks = collapse_profile(profile.stats, frame["path"])
+        with self.lock:
+            self.stacks.update(stacks)
+            entry = self.stages.setdefault(
+                frame["path"], {"seconds": 0.0, "count": 0, "peak": 0, "sizes": Counter(), "blocks": Counter()}
+            )
+            entry["seconds"] += seconds
+            entry["count"] += 1
+            entry["peak"] = max(entry["peak"], frame["peak"])
+            for site, size, blocks in allocations:
+                if (size or blocks) and not site.filename.endswith(SKIP_ALLOC_FILES):
+                    where = f"{_short_path(site.filename)}:{site.lineno}"
+                    entry["sizes"][where] += size
+                    entry["blocks"][where] += blocks
+        if frames and frames[-1]["profile"] is not None:
+            try:
+                frames[-1]["profile"].enable()
+            except ValueError:
+                # Another thread took the process-wide profiler; keep what the outer stage has so far.
+                pass
+
+    def write_collapsed(self, path: Path) -> None:
+        lines = [f"{stack} {round(us)}" for stack, us in sorted(self.stacks.items()) if round(us) > 0]
+        path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+
+    def write_allocations(self, path: Path, pipeline: str) -> None:
+        lines = [
+            f"# {pipeline}: tracemalloc, top {self.top_n} sites per stage by memory allocated in the stage and live at its end",
+            f"# peak: highest traced memory while the stage was open, counted from the start of its top-level stage",
+            f"# {'stage':<28} {'count':>5} {'seconds':>9} {'peak MiB':>9} {'kept KiB':>10}",
+        ]
+        for name, entry in self.stages.items():
+            kept = sum(entry["sizes"].values())
+            lines.append(
+                f"  {name:<28} {entry['count']:>5} {entry['seconds']:>9.4f} "
+                f"{entry['peak'] / 1048576:>9.1f} {kept / 1024:>+10.1f}"
+            )
+        for name, entry in self.stages.items():
+            lines.append("")
+            lines.append(f"## {name}")
+            ranked = sorted(entry["sizes"].items(), key=lambda item: -abs(item[1]))
+            for where, size in ranked[: self.top_n]:
+                lines.append(f"  {size / 1024:>+10.1f} KiB  {entry['blocks'][where]:>+8} blocks  {where}")
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@contextmanager
+def profile_run(out: Path, pipeline: str, enabled: bool) -> Iterator[None]:
+    # Writes <out stem>.folded (collapsed stacks in microseconds) and <out stem>.alloc.txt next to out.
+    if not enabled:
+        yield
+        return
+    import tracemalloc
+
+    profiler = StageProfiler(int(os.environ.get("AI_PROFILE_TOP", DEFAULT_TOP_N)))
+    set_stage_hook(profiler)
+    try:
+        yield
+    finally:
+        set_stage_hook(None)
+        tracemalloc.stop()
+    folded, report = out.with_suffix(".folded"), out.with_suffix(".alloc.txt")
+    profiler.write_collapsed(folded)
+    profiler.write_allocations(report, pipeline)
+    print(f"Wrote profile to {folded} and {report}")
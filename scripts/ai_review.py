@@ -1,9 +1,10 @@
 ﻿from __future__ import annotations
 
+import hashlib
 import json
 import os
-import re
 import sys
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
@@ -13,13 +14,40 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
-from scripts.ai_common import call_openai, load_yaml, read_file_lines, run_git, write_json
-
-POLICY_PATH = Path("config/review-policy.yaml")
-AGENT_PROMPTS_PATH = Path("config/agent-prompts.yaml")
-RULES_DIR = Path("config/rules")
-MAX_FILE_BYTES = 1_000_000
-MAX_DIFF_CHARS = 200_000
+from scripts.ai_cache import cache_stats, evict_cache
+from scripts.ai_config import RULES_DIR, bundle_heuristic_rules, load_config_bundle
+from scripts.ai_common import (
+    call_openai,
+    run_git,
+    stream_git,
+    write_json,
+)
+from scripts.ai_diff import (
+    CHARS_PER_TOKEN,
+    FileDiff,
+    ShardPacker,
+    changed_spans,
+    compact_file_diff,
+    compaction_stats,
+    estimate_tokens,
+    iter_file_diffs,
+    new_side_lines,
+    parse_unified_diff,
+    remap_line,
+    rendered_chars,
+)
+from scripts.ai_files import list_changed_files, list_repo_files
+from scripts.ai_metrics import METRICS, bind_metrics, export_metrics
+from scripts.ai_output import write_review
+from scripts.ai_parallel import DEFAULT_CHUNK_SIZE, map_chunks, resolve_workers
+from scripts.ai_profile import profile_requested, profile_run
+from scripts.ai_routing import route_files
+from scripts.ai_rules import HeuristicRule, RuleEngine, init_scan_worker, scan_files
+from scripts.ai_symbols import SymbolIndex, evict_symbols, select_symbols, symbol_context, symbols_config
+from scripts.ai_triage import Triage, filter_file_diffs, triage_config, triage_file_diffs
+
+DEFAULT_SHARD_MAX_TOKENS = 24_000
+DEFAULT_MAX_SHARDS = 50
 DEFAULT_SEVERITY_RANK = {"blocking": 3, "warn": 2, "info": 1}
 LEVEL_ALIASES = {
     "block": "blocking",
@@ -29,6 +57,7 @@ LEVEL_ALIASES = {
     "low": "info",
 }
 REVIEW_INSTRUCTIONS = "You are an expert code reviewer. Return JSON only."
+DEFAULT_STATE_DIR = ".ai_cache/review-state"
 
 
 @dataclass
@@ -41,65 +70,55 @@ class Comment:
 
 
 def load_policy() -> dict:
-    return load_yaml(POLICY_PATH)
+    return load_config_bundle()["policy"]
 
 
 def load_agent_prompts() -> dict:
-    return load_yaml(AGENT_PROMPTS_PATH)
+    return load_config_bundle()["agent_prompts"]
 
 
 def load_rule_templates(names: list[str]) -> dict:
-    templates: dict[str, dict] = {}
-    if not RULES_DIR.exists():
-        return templates
-    for name in names:
-        path = RULES_DIR / f"{name}.yaml"
-        if not path.exists():
-            continue
-        templates[name] = load_yaml(path)
-    return templates
+    templates = load_config_bundle()["rule_templates"]
+    return {name: templates[name] for name in names if name in templates}
 
 
 def get_changed_files(base_sha: str, head_sha: str) -> list[str]:
-    if not base_sha or not head_sha:
-        return []
-    out = run_git(["diff", "--name-only", base_sha, head_sha])
-    return [line.strip() for line in out.splitlines() if line.strip()]
-
-
-def find_markers(lines: Iterable[str], marker: str) -> list[int]:
-    hits: list[int] = []
-    for idx, line in enumerate(lines, start=1):
-        if marker in line:
-            hits.append(idx)
-    return hits
-
-
-def detect_issues(files: list[str]) -> list[Comment]:
-    comments: list[Comment] = []
-    for file in files:
-        path = Path(file)
-        lines = read_file_lines(path, MAX_FILE_BYTES)
-        if not lines:
-            continue
-
-        for ln in find_markers(lines, "TODO_SECURITY") + find_markers(lines, "FIXME_SECURITY"):
-            comments.append(Comment(file, ln, "SecurityAgent", "blocking", "보안 관련 TODO/FIXME 발견"))
+    return list_changed_files(base_sha, head_sha)
 
-        for ln in find_markers(lines, "TODO_AUTOFIX") + find_markers(lines, "FIXME_AUTOFIX"):
-            comments.append(Comment(file, ln, "BugRiskAgent", "blocking", "자동 수정 대상 표시(AUTOFIX) 발견"))
 
-        for ln in find_markers(lines, "NPLUS1"):
-            comments.append(Comment(file, ln, "PerformanceAgent", "warn", "N+1 가능성 표시(NPLUS1) 발견"))
-
-        long_lines = [i for i, line in enumerate(lines, start=1) if len(line) > 120]
-        for ln in long_lines[:5]:
-            comments.append(Comment(file, ln, "StyleAgent", "info", "라인 길이 120자 초과"))
-
-        if re.search(r"\bauth\b|\bpermission\b|\bjwt\b", " ".join(lines), re.IGNORECASE):
-            comments.append(Comment(file, 1, "SecurityAgent", "warn", "인증/인가 관련 변경 감지"))
-
-    return comments
+def detect_issues(
+    files: list[str],
+    rules: list[HeuristicRule] | None = None,
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    windows: dict[str, list[tuple[int, int]]] | None = None,
+    rev: str | None = None,
+    file_diffs: list[FileDiff] | None = None,
+) -> list[Comment]:
+    if rules is None:
+        rules = bundle_heuristic_rules(load_config_bundle())
+    if file_diffs is not None:
+        # A bare diff has no commit to read: scan the new side its hunks carry, not the service's checkout.
+        engine = RuleEngine(rules)
+        return [
+            Comment(fd.changed_path, ln, rule.agent, rule.level, rule.message)
+            for fd in file_diffs
+            if not fd.is_deleted
+            for rule, ln in engine.scan_numbered(new_side_lines(fd))
+        ]
+    # With a diff only the changed hunks are read; without one every file is scanned whole.
+    # rev reads the files at that commit instead of the working tree.
+    items = [(file, None if windows is None else windows.get(file, [])) for file in files]
+    hits = map_chunks(scan_files, items, workers, chunk_size, init_scan_worker, (rules, rev))
+    return [Comment(*hit) for hit in hits]
+
+
+def heuristics_rev(head_sha: str) -> str | None:
+    # None when head_sha is what the working tree has checked out, so files can be read from disk.
+    if not head_sha:
+        return None
+    head = run_git(["rev-parse", "--verify", "--quiet", f"{head_sha}^{{commit}}"])
+    return None if head and head == run_git(["rev-parse", "HEAD"]) else head_sha
 
 
 def build_summary(comments: list[Comment], suitability_pass: bool) -> str:
@@ -122,28 +141,46 @@ def format_details(comments: list[Comment]) -> str:
     return "\n".join(lines)
 
 
-def build_agent_prompt(
-    agent_name: str,
-    agent_spec: dict,
+def build_shared_prefix(
     changed_files: list[str],
     diff_text: str,
     rule_templates: dict[str, dict],
-    aggregated: dict | None = None,
+    symbols: list[dict] | None = None,
 ) -> str:
-    prompt = {
+    shared = {
+        "rule_templates": rule_templates,
+        "changed_files": changed_files,
+        "diff": diff_text,
+    }
+    if symbols:
+        # Definitions the changed hunks call and callers of the functions they change (review.symbols).
+        shared["symbols"] = symbols
+    return "[SHARED CONTEXT]\n" + json.dumps(shared, ensure_ascii=False, sort_keys=True)
+
+
+def build_agent_task(agent_name: str, agent_spec: dict, aggregated: dict | None = None) -> str:
+    task = {
         "agent": agent_name,
         "purpose": agent_spec.get("purpose", ""),
         "instructions": agent_spec.get("prompt", ""),
         "checks": agent_spec.get("checks", []),
         "severity_guidelines": agent_spec.get("severity_guidelines", {}),
-        "rule_templates": rule_templates,
         "expected_output": agent_spec.get("schema", {}),
-        "changed_files": changed_files,
-        "diff": diff_text,
     }
     if aggregated:
-        prompt["aggregated"] = aggregated
-    return json.dumps(prompt, ensure_ascii=False)
+        task["aggregated"] = aggregated
+    return "[AGENT TASK]\n" + json.dumps(task, ensure_ascii=False)
+
+
+def build_agent_prompt(
+    agent_name: str,
+    agent_spec: dict,
+    shared_prefix: str,
+    aggregated: dict | None = None,
+) -> str:
+    # The large shared part goes first and is byte-identical for every agent, so
+    # provider-side prompt caching can reuse it; only the short task differs.
+    return f"{shared_prefix}\n\n{build_agent_task(agent_name, agent_spec, aggregated)}"
 
 
 def normalize_comments(raw_comments: list) -> list[Comment]:
@@ -202,12 +239,100 @@ def dedupe_comments(
     return result
 
 
+def run_agent_calls(
+    prompts: list[str],
+    policy: dict,
+    labels: list[str] | None = None,
+    early_stop: dict | None = None,
+    stop_on_blocking: bool = False,
+) -> list[dict | None]:
+    review_cfg = policy.get("review", {})
+    max_concurrency = int(review_cfg.get("max_concurrency", 4))
+    labels = labels or [""] * len(prompts)
+    streaming = bool(policy.get("ai", {}).get("stream", False))
+    # Echoing streamed comments is for a watched CI log; batch and service runs stay quiet by default.
+    verbose = os.environ.get("AI_REVIEW_VERBOSE", "").strip().lower() in {"1", "true", "yes"}
+    blocking_agents = set(review_cfg.get("blocking_agents", []))
+    severity_rank = review_cfg.get("severity_rank", DEFAULT_SEVERITY_RANK)
+    cancel = threading.Event()
+    skipped: list[str] = []
+    stop_lock = threading.Lock()
+
+    def stop(label: str, path: str, line: int) -> None:
+        with stop_lock:
+            if early_stop is not None and not cancel.is_set():
+                early_stop.update({"agent": label, "path": path, "line": line})
+            cancel.set()
+
+    def on_comment(label: str, raw: dict) -> bool:
+        comments = normalize_comments([raw])
+        if not comments:
+            return False
+        c = comments[0]
+        level = normalize_level(c.level, severity_rank)
+        if verbose:
+            print(f"[{label}] {c.path}:{c.line} ({level}) {c.body[:200]}", flush=True)
+        if not (stop_on_blocking and level == "blocking" and label in blocking_agents):
+            return False
+        stop(label, c.path, c.line)
+        return True
+
+    def call(item: tuple[str, str]) -> dict | None:
+        prompt, label = item
+        if cancel.is_set():
+            skipped.append(label)
+            return None
+        if not streaming:
+            result = call_openai(prompt, policy, "review_model", REVIEW_INSTRUCTIONS, label=label)
+        else:
+            result = call_openai(
+                prompt,
+                policy,
+                "review_model",
+                REVIEW_INSTRUCTIONS,
+                label=label,
+                on_comment=lambda raw: on_comment(label, raw),
+                cancel=cancel if stop_on_blocking else None,
+            )
+        if stop_on_blocking and result and label in blocking_agents and not cancel.is_set():
+            found = [
+                c for c in normalize_comments(result.get("comments", []))
+                if normalize_level(c.level, severity_rank) == "blocking"
+            ]
+            if found:
+                stop(label, found[0].path, found[0].line)
+            elif result.get("blocking"):
+                stop(label, "", 0)
+        return result
+
+    if max_concurrency <= 1 or len(prompts) <= 1:
+        results = [call(item) for item in zip(prompts, labels)]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # pool.map keeps submission order, so merged output matches the sequential path.
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(prompts))) as pool:
+            results = list(pool.map(bind_metrics(call), zip(prompts, labels)))
+    if early_stop is not None and cancel.is_set():
+        aborted = [label for label, r in zip(labels, results) if r and r.get("aborted")]
+        early_stop["aborted_calls"] = len(aborted)
+        early_stop["skipped_calls"] = len(skipped)
+        early_stop["short_circuited_agents"] = sorted(set(aborted) | set(skipped))
+    return results
+
+
 def run_agents_ai(
     policy: dict,
     agent_prompts: dict,
     changed_files: list[str],
-    diff_text: str,
+    file_diffs: Iterable[FileDiff],
+    carried: list[Comment] | None = None,
+    stats: dict | None = None,
+    routing: dict | None = None,
+    head_sha: str = "",
 ) -> tuple[list[Comment], list[str], bool, bool, str | None]:
+    routing = routing or {}
+    file_routes = routing.get("file_routes", {}) or {}
     order = policy.get("review", {}).get("agents_order", [])
     blocking_agents = set(policy.get("review", {}).get("blocking_agents", []))
     severity_rank = policy.get("review", {}).get("severity_rank", DEFAULT_SEVERITY_RANK)
@@ -219,14 +344,94 @@ def run_agents_ai(
     blocking = False
     suitability_pass = True if changed_files else False
 
+    compaction_cfg = policy.get("review", {}).get("compaction", {})
+    compact = bool(compaction_cfg.get("enabled", True))
+    exclude_globs = list(compaction_cfg.get("exclude_globs", []))
+    context_lines = int(compaction_cfg.get("context_lines", 3))
+    compaction: dict = compaction_stats() if compact else {}
+    shard_max_tokens = int(policy.get("review", {}).get("shard_max_tokens", DEFAULT_SHARD_MAX_TOKENS))
+    max_shards = int(policy.get("review", {}).get("max_shards", DEFAULT_MAX_SHARDS))
+
+    agent_slices: dict[str, tuple[str, ...]] = {}
+    skipped_agents: list[str] = []
     for agent_name in order:
-        if agent_name == "SummaryAgent":
-            continue
-        spec = agents_cfg.get(agent_name, {})
-        if not spec:
+        if agent_name == "SummaryAgent" or not agents_cfg.get(agent_name):
             continue
-        prompt = build_agent_prompt(agent_name, spec, changed_files, diff_text, rules)
-        result = call_openai(prompt, policy, "review_model", REVIEW_INSTRUCTIONS)
+        agent_files = route_files(changed_files, file_routes.get(agent_name))
+        if agent_files:
+            agent_slices[agent_name] = tuple(agent_files)
+        else:
+            skipped_agents.append(agent_name)
+    full_slice = tuple(changed_files)
+    with_summary = "SummaryAgent" in order and bool(agents_cfg.get("SummaryAgent"))
+    # Agents that see the same file slice share shards and byte-identical prefixes.
+    packers = {
+        key: ShardPacker(shard_max_tokens, max_shards)
+        for key in {*agent_slices.values(), *([full_slice] if with_summary else [])}
+    }
+    members = {key: None if key == full_slice else set(key) for key in packers}
+
+    symbols_cfg = symbols_config(policy)
+    changed_lines: dict[str, list[int]] = {}
+
+    # Single pass: each file is compacted, handed to every slice that includes it and then dropped.
+    raw_chars = 0
+    with METRICS.stage("diff"):
+        for file_diff in file_diffs:
+            raw_chars += rendered_chars(file_diff) + 1
+            if symbols_cfg["enabled"] and head_sha and file_diff.path.endswith(".py"):
+                changed_lines[file_diff.path] = [line_no for hunk in file_diff.hunks for line_no in hunk.added]
+            if compact:
+                file_diff = compact_file_diff(file_diff, exclude_globs, context_lines, compaction)
+                if file_diff is None:
+                    continue
+            for key, packer in packers.items():
+                if members[key] is None or file_diff.changed_path in members[key]:
+                    packer.add(file_diff)
+
+    snippets: list[dict] = []
+    symbol_index: SymbolIndex | None = None
+    if changed_lines:
+        with METRICS.stage("symbols"):
+            symbol_index = SymbolIndex(head_sha, Path(symbols_cfg["dir"]))
+            snippets = symbol_context(symbol_index, changed_lines, symbols_cfg)
+
+    with METRICS.stage("prompt_build"):
+        slices: dict[tuple[str, ...], tuple[list[str], int, int]] = {}
+        for key, packer in packers.items():
+            shards = packer.finish() or [""]
+            symbols = select_symbols(snippets, members[key], symbols_cfg["max_tokens"])
+            # Symbol snippets are added context, not diff: reported apart from the compaction figures.
+            symbol_tokens = estimate_tokens(json.dumps(symbols, ensure_ascii=False, sort_keys=True)) if symbols else 0
+            prefixes = [build_shared_prefix(list(key), shard, rules, symbols) for shard in shards]
+            slices[key] = (prefixes, packer.skipped, symbol_tokens * len(prefixes))
+        raw_prefix_tokens = estimate_tokens(build_shared_prefix(changed_files, "", rules)) + raw_chars // CHARS_PER_TOKEN
+        prompt_tokens: dict[str, dict[str, int]] = {}
+        routed: dict[str, dict] = {}
+        agent_calls: list[tuple[str, int, int, str]] = []
+        for agent_name, agent_files in agent_slices.items():
+            spec = agents_cfg[agent_name]
+            prefixes, skipped_shards, symbol_tokens = slices[agent_files]
+            routed[agent_name] = {"files": len(agent_files), "shards": len(prefixes), "skipped_shards": skipped_shards}
+            task_tokens = estimate_tokens(build_agent_task(agent_name, spec))
+            prompt_tokens[agent_name] = {
+                "before_compaction": raw_prefix_tokens + task_tokens,
+                "after_compaction": sum(estimate_tokens(prefix) + task_tokens for prefix in prefixes) - symbol_tokens,
+                "symbols": symbol_tokens,
+            }
+            for idx, prefix in enumerate(prefixes):
+                agent_calls.append((agent_name, idx, len(prefixes), build_agent_prompt(agent_name, spec, prefix)))
+
+    early_stop: dict = {}
+    with METRICS.stage("agent_calls"):
+        results = run_agent_calls(
+            [prompt for _, _, _, prompt in agent_calls],
+            policy,
+            [agent_name for agent_name, _, _, _ in agent_calls],
+            early_stop,
+            bool(routing.get("stop_on_blocking", False)),
+        )
+    for (agent_name, idx, total, _), result in zip(agent_calls, results):
         if not result:
             continue
         comments = normalize_comments(result.get("comments", []))
@@ -235,62 +440,230 @@ def run_agents_ai(
         all_comments.extend(comments)
         agent_summary = result.get("summary")
         if agent_summary:
-            details_lines.append(f"[{agent_name}] {agent_summary}")
+            label = agent_name if total == 1 else f"{agent_name} {idx + 1}/{total}"
+            details_lines.append(f"[{label}] {agent_summary}")
         if result.get("blocking") and agent_name in blocking_agents:
             blocking = True
+    skipped_shards = max((r["skipped_shards"] for r in routed.values()), default=0)
+    if skipped_shards:
+        total_shards = max(r["shards"] + r["skipped_shards"] for r in routed.values())
+        details_lines.append(f"[Sharding] diff 분할 {total_shards}개 중 {skipped_shards}개 미검토(max_shards)")
+    if skipped_agents:
+        details_lines.append(f"[Routing] 해당 파일이 없어 생략: {', '.join(skipped_agents)}")
+    if early_stop:
+        blocking = True
+    # Only worth a line when the stop cut calls short; otherwise every call had already finished.
+    if early_stop.get("short_circuited_agents"):
+        where = f"({early_stop['path']}:{early_stop['line']})" if early_stop["path"] else ""
+        details_lines.append(
+            f"[EarlyStop] {early_stop['agent']} 차단 이슈{where} 발견으로 "
+            f"진행 중 호출 {early_stop['aborted_calls']}개 중단, 남은 호출 {early_stop['skipped_calls']}개 생략"
+        )
 
     summary_text = None
-    if "SummaryAgent" in order and agents_cfg.get("SummaryAgent"):
+    if with_summary:
+        full_prefixes, _, _ = slices[full_slice]
         aggregated = {
-            "comments": [c.__dict__ for c in all_comments],
+            "comments": [c.__dict__ for c in (carried or []) + all_comments],
             "details": details_lines,
         }
         prompt = build_agent_prompt(
             "SummaryAgent",
             agents_cfg.get("SummaryAgent", {}),
-            changed_files,
-            diff_text,
-            rules,
+            # Sharded PRs are summarized from the aggregated findings rather than the full diff.
+            full_prefixes[0] if len(full_prefixes) == 1 else build_shared_prefix(changed_files, "", rules),
             aggregated,
         )
-        summary_result = call_openai(prompt, policy, "review_model", REVIEW_INSTRUCTIONS)
+        with METRICS.stage("summary_agent"):
+            summary_result = call_openai(prompt, policy, "review_model", REVIEW_INSTRUCTIONS, label="SummaryAgent")
         if summary_result and summary_result.get("summary"):
             summary_text = summary_result.get("summary")
             details_lines.append(f"[SummaryAgent] {summary_text}")
 
+    if stats is not None:
+        stats["compaction"] = compaction
+        stats["shards"] = max((r["shards"] for r in routed.values()), default=0)
+        stats["prompt_tokens"] = prompt_tokens
+        stats["routing"] = {
+            "stop_on_blocking": bool(routing.get("stop_on_blocking", False)),
+            "agents": routed,
+            "skipped_agents": skipped_agents,
+            "short_circuited_agents": early_stop.get("short_circuited_agents", []),
+        }
+        if early_stop:
+            stats["early_stop"] = early_stop
+        if symbol_index is not None:
+            stats["symbols"] = {**symbol_index.stats, "snippets": len(snippets)}
+
     return all_comments, details_lines, blocking, suitability_pass, summary_text
 
 
-def main() -> int:
-    policy = load_policy()
-    agent_prompts = load_agent_prompts()
-    base_sha = os.environ.get("BASE_SHA", "")
-    head_sha = os.environ.get("HEAD_SHA", "")
+def config_fingerprint(policy: dict, agent_prompts: dict, routing: dict | None = None) -> str:
+    material = json.dumps([policy, agent_prompts, routing or {}], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
 
-    changed_files = get_changed_files(base_sha, head_sha)
-    if not changed_files:
-        changed_files = [str(p) for p in Path(".").rglob("*.py")]
+def review_state_path(policy: dict, pr_number: str | None = None) -> Path:
+    cfg = policy.get("review", {}).get("incremental", {})
+    state_dir = Path(os.environ.get("AI_REVIEW_STATE_DIR") or cfg.get("state_dir", DEFAULT_STATE_DIR))
+    pr_number = (pr_number or os.environ.get("PR_NUMBER", "")).strip() or "local"
+    return state_dir / f"pr-{pr_number}.json"
 
-    diff_text = run_git(["diff", base_sha, head_sha]) if base_sha and head_sha else ""
-    if len(diff_text) > MAX_DIFF_CHARS:
-        diff_text = diff_text[:MAX_DIFF_CHARS] + "\n...DIFF_TRUNCATED..."
+
+def load_previous_review(
+    policy: dict,
+    fingerprint: str,
+    head_sha: str,
+    pr_number: str | None = None,
+) -> dict | None:
+    cfg = policy.get("review", {}).get("incremental", {})
+    if not cfg.get("enabled", True) or os.environ.get("AI_REVIEW_FULL", "").strip() == "1":
+        return None
+    path = review_state_path(policy, pr_number)
+    if not head_sha or not path.exists():
+        return None
+    try:
+        previous = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    prev_head = previous.get("head_sha", "")
+    if not prev_head or previous.get("config_hash") != fingerprint:
+        return None
+    # Force-pushes rewrite history; only an ancestor head can be diffed forward safely.
+    if prev_head != head_sha and run_git(["merge-base", prev_head, head_sha]) != prev_head:
+        return None
+    return previous
+
+
+def carry_forward_comments(
+    previous: dict,
+    file_diffs: list[FileDiff],
+    changed_files: list[str],
+    severity_rank: dict,
+) -> list[Comment]:
+    touched = {fd.old_path: fd for fd in file_diffs}
+    still_changed = set(changed_files)
+    carried: list[Comment] = []
+    for c in normalize_comments(previous.get("comments", [])):
+        fd = touched.get(c.path)
+        if fd is not None:
+            if fd.is_deleted:
+                continue
+            new_line = remap_line(fd.hunks, c.line)
+            if new_line is None:
+                continue
+            c.path, c.line = fd.path, new_line
+        if c.path not in still_changed:
+            continue
+        c.level = normalize_level(c.level, severity_rank)
+        carried.append(c)
+    return carried
+
+
+def load_review_config() -> tuple[dict, dict, dict]:
+    bundle = load_config_bundle()
+    return bundle["policy"], bundle["agent_prompts"], bundle["routing"]
+
+
+def run_review(
+    base_sha: str = "",
+    head_sha: str = "",
+    diff_text: str | None = None,
+    pr_number: str | None = None,
+    config: tuple[dict, dict, dict] | None = None,
+    keep_state: bool = True,
+) -> dict:
+    METRICS.reset()
+    with METRICS.stage("config"):
+        policy, agent_prompts, routing = config or load_review_config()
+
+    with METRICS.stage("git"):
+        if diff_text is None:
+            changed_files = get_changed_files(base_sha, head_sha)
+            from_diff = bool(changed_files)
+            if not changed_files:
+                changed_files = list_repo_files([".py"])
+            # Lazy: git only runs, and its output is only parsed file by file, if the agents need the diff.
+            file_diffs: Iterable[FileDiff] = (
+                iter_file_diffs(stream_git(["diff", base_sha, head_sha])) if base_sha and head_sha else []
+            )
+        else:
+            file_diffs = parse_unified_diff(diff_text)
+            changed_files = [fd.changed_path for fd in file_diffs]
+            from_diff = True
 
     ai_comments: list[Comment] = []
     ai_details_lines: list[str] = []
     ai_blocking = False
     ai_suitability_pass = False
     ai_summary: str | None = None
+    severity_rank = policy.get("review", {}).get("severity_rank", DEFAULT_SEVERITY_RANK)
+    fingerprint = config_fingerprint(policy, agent_prompts, routing)
+    incremental: dict | None = None
+    triage: Triage | None = None
+    triage_cfg = triage_config(policy)
+    prompt_stats: dict = {}
 
     if agent_prompts and os.environ.get("OPENAI_API_KEY"):
-        ai_comments, ai_details_lines, ai_blocking, ai_suitability_pass, ai_summary = run_agents_ai(
-            policy, agent_prompts, changed_files, diff_text
-        )
+        with METRICS.stage("incremental"):
+            previous = load_previous_review(policy, fingerprint, head_sha, pr_number) if keep_state else None
+            review_files, review_diffs, carried = changed_files, file_diffs, []
+            range_base, range_diffs = base_sha, None
+            if previous:
+                inc_args = ["diff", previous["head_sha"], head_sha]
+                # Hunk ranges are enough to carry comments; the agents get a second streamed pass with bodies.
+                inc_diffs = list(iter_file_diffs(stream_git(inc_args), keep_lines=False))
+                carried = carry_forward_comments(previous, inc_diffs, changed_files, severity_rank)
+                review_files = [fd.path for fd in inc_diffs if not fd.is_deleted and fd.path in changed_files]
+                review_diffs = iter_file_diffs(stream_git(inc_args))
+                range_base, range_diffs = previous["head_sha"], inc_diffs
+                incremental = {
+                    "previous_head": previous["head_sha"],
+                    "files_reviewed": [],
+                    "comments_carried": len(carried),
+                }
+
+        if triage_cfg["enabled"] and from_diff and review_files:
+            with METRICS.stage("triage"):
+                if diff_text is not None and incremental is None:
+                    triage = triage_file_diffs(file_diffs, triage_cfg)
+                else:
+                    if range_diffs is None:
+                        range_diffs = iter_file_diffs(stream_git(["diff", range_base, head_sha]), keep_lines=False)
+                    triage = triage_file_diffs(range_diffs, triage_cfg, range_base, head_sha)
+                kinds = triage_cfg["review_kinds"]
+                review_files = [f for f in review_files if triage.files.get(f, "logic") in kinds]
+                review_diffs = filter_file_diffs(review_diffs, triage, kinds)
+
+        if review_files:
+            ai_comments, ai_details_lines, ai_blocking, ai_suitability_pass, ai_summary = run_agents_ai(
+                policy, agent_prompts, review_files, review_diffs, carried, prompt_stats, routing, head_sha
+            )
+        if triage is not None:
+            counts = triage.counts()
+            ai_details_lines.append(
+                f"[Triage] 변경 없음 {counts['unchanged']} / 문서 {counts['docs']} / 테스트 {counts['tests']} / "
+                f"로직 {counts['logic']} (모델 전송 {len(review_files)}, 주석 hunk 제외 {triage.hunks_dropped})"
+            )
+            if not review_files:
+                # Nothing substantive changed: pass without calling the model.
+                ai_suitability_pass = True
+                ai_summary = None if incremental is not None else "자동 리뷰: 실질적 변경 없음(로컬 분류로 통과)"
+        if incremental is not None:
+            # Recorded after triage: only the files actually sent to the agents were re-reviewed.
+            incremental["files_reviewed"] = review_files
+            ai_comments = carried + ai_comments
+            ai_suitability_pass = bool(changed_files)
+            ai_details_lines.append(
+                f"[Incremental] {incremental['previous_head'][:7]}..{head_sha[:7]}: "
+                f"재리뷰 파일 {len(review_files)} / 유지 코멘트 {len(carried)}"
+            )
 
     if ai_comments or ai_details_lines:
-        severity_rank = policy.get("review", {}).get("severity_rank", DEFAULT_SEVERITY_RANK)
         max_total = int(policy.get("review", {}).get("max_comments_total", 50))
         max_per_file = int(policy.get("review", {}).get("max_comments_per_file", 8))
-        comments = dedupe_comments(ai_comments, severity_rank, max_total, max_per_file)
+        with METRICS.stage("dedupe"):
+            comments = dedupe_comments(ai_comments, severity_rank, max_total, max_per_file)
         blocking_agents = set(policy.get("review", {}).get("blocking_agents", []))
         blocking = ai_blocking or any(
             c.level == "blocking" and c.agent in blocking_agents for c in comments
@@ -299,7 +672,20 @@ def main() -> int:
         summary = ai_summary or build_summary(comments, suitability_pass)
         details = "\n".join(f"- {d}" for d in ai_details_lines) if ai_details_lines else format_details(comments)
     else:
-        comments = detect_issues(changed_files)
+        heuristics_cfg = policy.get("heuristics", {})
+        with METRICS.stage("heuristics"):
+            windows = None
+            if from_diff and diff_text is None:
+                ranges = iter_file_diffs(stream_git(["diff", base_sha, head_sha]), keep_lines=False)
+                windows = {fd.changed_path: changed_spans(fd) for fd in ranges}
+            comments = detect_issues(
+                changed_files,
+                workers=resolve_workers(heuristics_cfg.get("workers", 0)),
+                chunk_size=int(heuristics_cfg.get("chunk_size", DEFAULT_CHUNK_SIZE)),
+                windows=windows,
+                rev=heuristics_rev(head_sha) if diff_text is None else None,
+                file_diffs=file_diffs if diff_text is not None else None,
+            )
         suitability_pass = bool(changed_files)
         blocking = any(c.level == "blocking" for c in comments) or not suitability_pass
         summary = build_summary(comments, suitability_pass)
@@ -314,11 +700,40 @@ def main() -> int:
         "comments": [c.__dict__ for c in comments],
         "changed_files": changed_files,
         "timestamp": datetime.now(timezone.utc).isoformat(),
+        "base_sha": base_sha,
+        "head_sha": head_sha,
+        "config_hash": fingerprint,
+        "review_mode": "incremental" if incremental is not None else "full",
         "policy": policy,
     }
+    if incremental is not None:
+        result["incremental"] = incremental
+    if triage is not None:
+        result["triage"] = triage.to_dict(triage_cfg["review_kinds"])
+    if "early_stop" in prompt_stats:
+        result["early_stop"] = prompt_stats.pop("early_stop")
+    if "routing" in prompt_stats:
+        result["routing"] = prompt_stats.pop("routing")
+    if prompt_stats:
+        result["prompt_stats"] = prompt_stats
+    with METRICS.stage("cache_evict"):
+        evict_cache(policy)
+        evict_symbols(policy)
+    result["cache"] = cache_stats()
+    result["metrics"] = export_metrics(policy, "review")
+
+    if keep_state and head_sha and (ai_comments or ai_details_lines):
+        state_path = review_state_path(policy, pr_number)
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        write_json(state_path, result)
+    return result
 
+
+def main() -> int:
     out = os.environ.get("AI_REVIEW_OUTPUT", "ai_review.json")
-    write_json(Path(out), result)
+    with profile_run(Path(out), "review", profile_requested(sys.argv[1:])):
+        result = run_review(os.environ.get("BASE_SHA", ""), os.environ.get("HEAD_SHA", ""))
+    write_review(Path(out), result)
     print(f"Wrote review to {out}")
     return 0
 
@@ -0,0 +1,27 @@
+﻿from __future__ import annotations
+
+from fnmatch import fnmatch
+from pathlib import Path
+
+from scripts.ai_common import load_yaml
+
+AGENTS_CONFIG_PATH = Path("config/agents.yaml")
+
+
+def load_routing(path: Path = AGENTS_CONFIG_PATH) -> dict:
+    return load_yaml(path).get("routing", {}) or {}
+
+
+def route_matches(path: str, route: dict | None) -> bool:
+    if not route:
+        return True
+    include = list(route.get("include", []) or [])
+    exclude = list(route.get("exclude", []) or [])
+    if any(fnmatch(path, pattern) for pattern in exclude):
+        return False
+    return not include or any(fnmatch(path, pattern) for pattern in include)
+
+
+def route_files(files: list[str], route: dict | None) -> list[str]:
+    return [path for path in files if route_matches(path, route)]
+
@@ -0,0 +1,140 @@
+﻿from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from scripts.ai_common import load_yaml
+from scripts.ai_files import read_blobs
+from scripts.ai_source import SourceFile
+
+_worker_engine: RuleEngine | None = None
+# Group references and global inline flags only mean the same thing inside the rule's own pattern.
+_UNJOINABLE_RE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+_worker_rev: str | None = None
+
+
+@dataclass
+class HeuristicRule:
+    id: str
+    agent: str
+    level: str
+    message: str
+    kind: str = "pattern"
+    pattern: str = ""
+    ignore_case: bool = False
+    scope: str = "line"
+    max_hits: int = 0
+    max_length: int = 0
+
+
+def parse_heuristic_rule(raw: object, default_id: str) -> HeuristicRule | None:
+    if not isinstance(raw, dict):
+        return None
+    try:
+        return HeuristicRule(
+            id=str(raw.get("id", default_id)),
+            agent=str(raw.get("agent", "UnknownAgent")),
+            level=str(raw.get("level", "info")),
+            message=str(raw.get("message", "")),
+            kind=str(raw.get("kind", "pattern")),
+            pattern=str(raw.get("pattern", "")),
+            ignore_case=bool(raw.get("ignore_case", False)),
+            scope=str(raw.get("scope", "line")),
+            max_hits=int(raw.get("max_hits", 0)),
+            max_length=int(raw.get("max_length", 0)),
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def load_heuristic_rules(rules_dir: Path) -> list[HeuristicRule]:
+    rules: list[HeuristicRule] = []
+    if not rules_dir.exists():
+        return rules
+    for path in sorted(rules_dir.glob("*.yaml")):
+        for raw in load_yaml(path).get("heuristics", []) or []:
+            rule = parse_heuristic_rule(raw, f"{path.stem}-{len(rules)}")
+            if rule is not None:
+                rules.append(rule)
+    return rules
+
+
+class RuleEngine:
+    def __init__(self, rules: list[HeuristicRule]) -> None:
+        self.rules = rules
+        self.length_rules = [i for i, r in enumerate(rules) if r.kind == "line_length" and r.max_length > 0]
+        self.min_long_line = min((rules[i].max_length for i in self.length_rules), default=0)
+        self.patterns: list[tuple[int, re.Pattern]] = []
+        self.always: list[tuple[int, re.Pattern]] = []
+        alternatives: list[str] = []
+        for i, rule in enumerate(rules):
+            if rule.kind != "pattern" or not rule.pattern:
+                continue
+            compiled = re.compile(rule.pattern, re.IGNORECASE if rule.ignore_case else 0)
+            self.patterns.append((i, compiled))
+            if _UNJOINABLE_RE.search(rule.pattern):
+                self.always.append((i, compiled))
+            else:
+                alternatives.append(f"(?{'i' if rule.ignore_case else ''}:{rule.pattern})")
+        # One alternation over every pattern rule is only a prefilter: lines it rejects
+        # are skipped, and lines it accepts are matched against each rule's own pattern
+        # so overlapping matches all fire. Rules with group references or global flags
+        # can't be joined without changing their meaning and are always checked alone.
+        self.matcher = re.compile("|".join(alternatives)) if alternatives else None
+
+    def scan(self, lines: Iterable[str]) -> list[tuple[HeuristicRule, int]]:
+        return self.scan_numbered(enumerate(lines, start=1))
+
+    def scan_numbered(self, numbered: Iterable[tuple[int, str]]) -> list[tuple[HeuristicRule, int]]:
+        hits: dict[int, list[int]] = {i: [] for i in range(len(self.rules))}
+        file_done: set[int] = set()
+        for line_no, line in numbered:
+            if self.matcher is not None and self.matcher.search(line):
+                candidates = self.patterns
+            else:
+                candidates = self.always
+            for idx, pattern in candidates:
+                if idx not in file_done and pattern.search(line):
+                    if self.rules[idx].scope == "file":
+                        file_done.add(idx)
+                        hits[idx].append(1)
+                    else:
+                        hits[idx].append(line_no)
+            if self.min_long_line and len(line) > self.min_long_line:
+                for idx in self.length_rules:
+                    if len(line) > self.rules[idx].max_length:
+                        hits[idx].append(line_no)
+
+        results: list[tuple[HeuristicRule, int]] = []
+        for idx, rule in enumerate(self.rules):
+            rule_hits = hits[idx]
+            if rule.max_hits > 0:
+                rule_hits = rule_hits[: rule.max_hits]
+            results.extend((rule, ln) for ln in rule_hits)
+        return results
+
+
+def init_scan_worker(rules: list[HeuristicRule], rev: str | None = None) -> None:
+    global _worker_engine, _worker_rev
+    _worker_engine = RuleEngine(rules)
+    _worker_rev = rev
+
+
+def scan_files(items: list[tuple[str, list[tuple[int, int]] | None]]) -> list[tuple[str, int, str, str, str]]:
+    # Each item is a path plus the line spans to read; None scans the whole file.
+    # With a worker rev the files are read at that commit, one `git cat-file --batch` per chunk.
+    engine = _worker_engine or RuleEngine([])
+    hits: list[tuple[str, int, str, str, str]] = []
+    blobs = read_blobs([f"{_worker_rev}:{file}" for file, _ in items]) if _worker_rev else [None] * len(items)
+    for (file, spans), blob in zip(items, blobs):
+        if _worker_rev and blob is None:
+            continue
+        with SourceFile(Path(file), blob) as source:
+            if not source.size or source.is_binary():
+                continue
+            numbered = source.iter_lines() if spans is None else source.iter_windows(spans)
+            for rule, ln in engine.scan_numbered(numbered):
+                hits.append((file, ln, rule.agent, rule.level, rule.message))
+    return hits
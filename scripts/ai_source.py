@@ -0,0 +1,110 @@
+﻿from __future__ import annotations
+
+import mmap
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+
+BINARY_SNIFF_BYTES = 8000
+BLOCK_BYTES = 1 << 20
+
+
+def _split_block(block: bytes) -> list[str]:
+    text = block.decode("utf-8", errors="replace")
+    lines = text.split("\n")
+    if text.endswith("\n"):
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+
+def merge_spans(spans: Iterable[tuple[int, int]], context: int = 0) -> list[tuple[int, int]]:
+    merged: list[list[int]] = []
+    for start, end in sorted(spans):
+        start, end = max(1, start - context), end + context
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged if start <= end]
+
+
+class SourceFile:
+    # Memory-mapped, read-only view of a source file. Line offsets are indexed lazily and only
+    # as far as the highest line asked for; text is decoded per window with U+FFFD for bad bytes.
+    # Given data (a blob read from git), the same view is kept over those bytes instead.
+    def __init__(self, path: Path, data: bytes | None = None) -> None:
+        self.path = path
+        self.size = 0
+        self._data: mmap.mmap | bytes | None = None
+        self._blob = data
+        self._offsets = array("Q", [0])
+        self._indexed = False
+
+    def __enter__(self) -> SourceFile:
+        if self._blob is not None:
+            self.size = len(self._blob)
+            self._data = self._blob or None
+            return self
+        try:
+            with open(self.path, "rb") as handle:
+                handle.seek(0, 2)
+                self.size = handle.tell()
+                if self.size:
+                    self._data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.size = 0
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def is_binary(self) -> bool:
+        return self._data is not None and self._data.find(b"\0", 0, BINARY_SNIFF_BYTES) != -1
+
+    def contains(self, needles: Iterable[bytes]) -> bool:
+        return self._data is not None and any(self._data.find(needle) != -1 for needle in needles)
+
+    def _index_to(self, line_no: int) -> None:
+        offsets = self._offsets
+        while not self._indexed and len(offsets) < line_no:
+            newline = self._data.find(b"\n", offsets[-1]) if self._data is not None else -1
+            if newline == -1 or newline + 1 >= self.size:
+                self._indexed = True
+                break
+            offsets.append(newline + 1)
+
+    def line_count(self) -> int:
+        if not self.size:
+            return 0
+        self._index_to(1 << 62)
+        return len(self._offsets)
+
+    def read_lines(self, start: int, end: int) -> list[str]:
+        # 1-based and inclusive; clamped to the file.
+        start = max(1, start)
+        if self._data is None or end < start:
+            return []
+        self._index_to(end + 1)
+        if start > len(self._offsets):
+            return []
+        stop = self._offsets[end] if end < len(self._offsets) else self.size
+        return _split_block(self._data[self._offsets[start - 1] : stop])
+
+    def iter_windows(self, spans: Iterable[tuple[int, int]]) -> Iterator[tuple[int, str]]:
+        for start, end in merge_spans(spans):
+            yield from enumerate(self.read_lines(start, end), start=start)
+
+    def iter_lines(self) -> Iterator[tuple[int, str]]:
+        # Whole-file scan in newline-aligned blocks, so memory stays bounded for any file size.
+        line_no = pos = 0
+        while self._data is not None and pos < self.size:
+            end = min(pos + BLOCK_BYTES, self.size)
+            if end < self.size:
+                newline = self._data.rfind(b"\n", pos, end)
+                end = newline + 1 if newline != -1 else (self._data.find(b"\n", end) + 1 or self.size)
+            lines = _split_block(self._data[pos:end])
+            yield from enumerate(lines, start=line_no + 1)
+            line_no += len(lines)
+            pos = end
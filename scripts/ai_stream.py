@@ -0,0 +1,176 @@
+﻿from __future__ import annotations
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+
+FAILED_EVENTS = {"response.failed", "error"}
+
+
+class StreamingJSONParser:
+    def __init__(self, array_key: str = "comments") -> None:
+        self.array_key = array_key
+        self.chunks: list[str] = []
+        self.offset = 0
+        self.start: int | None = None
+        self.end: int | None = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.key_parts: list[str] | None = None
+        self.last_key = ""
+        self.in_array = False
+        self.item_parts: list[str] | None = None
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> list[Any]:
+        # Single pass over each character; every comments[] element is decoded once, when it closes.
+        items: list[Any] = []
+        self.chunks.append(chunk)
+        if self.end is not None:
+            self.offset += len(chunk)
+            return items
+        item_from = key_from = 0
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.key_parts is not None:
+                        self.key_parts.append(chunk[key_from:i])
+                        self.last_key = "".join(self.key_parts)
+                        self.key_parts = None
+                continue
+            if self.start is None:
+                if ch == "{":
+                    self.start = self.offset + i
+                    self.depth = 1
+                    self.expect_key = True
+                continue
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect_key:
+                    self.key_parts = []
+                    key_from = i + 1
+            elif ch in "{[":
+                if self.depth == 1 and ch == "[":
+                    self.in_array = self.last_key == self.array_key
+                elif self.depth == 2 and self.in_array and self.item_parts is None:
+                    self.item_parts = []
+                    item_from = i
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 2 and self.item_parts is not None:
+                    self.item_parts.append(chunk[item_from : i + 1])
+                    try:
+                        items.append(json.loads("".join(self.item_parts)))
+                    except ValueError:
+                        pass
+                    self.item_parts = None
+                elif self.depth == 1:
+                    self.in_array = False
+                elif self.depth == 0:
+                    self.end = self.offset + i + 1
+                    break
+            elif self.depth == 1 and ch == ":":
+                self.expect_key = False
+            elif self.depth == 1 and ch == ",":
+                self.expect_key = True
+        if self.item_parts is not None:
+            self.item_parts.append(chunk[item_from:])
+        if self.key_parts is not None:
+            self.key_parts.append(chunk[key_from:])
+        self.offset += len(chunk)
+        return items
+
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def result(self) -> Any:
+        if self.start is None or self.end is None:
+            return None
+        try:
+            return json.loads(self.text()[self.start : self.end])
+        except ValueError:
+            return None
+
+
+@dataclass
+class StreamOutcome:
+    text: str = ""
+    parsed: Any = None
+    usage: dict | None = None
+    completed: bool = False
+    failed: bool = False
+    aborted: bool = False
+    first_item_sec: float | None = None
+    items: list[Any] = field(default_factory=list)
+
+
+def iter_sse_events(lines: Iterable[bytes]) -> Iterable[dict]:
+    data: list[str] = []
+    for raw in lines:
+        line = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if not line:
+            if data:
+                try:
+                    event = json.loads("\n".join(data))
+                except ValueError:
+                    event = None
+                data = []
+                if isinstance(event, dict):
+                    yield event
+            continue
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        try:
+            event = json.loads("\n".join(data))
+        except ValueError:
+            return
+        if isinstance(event, dict):
+            yield event
+
+
+def consume_stream(
+    lines: Iterable[bytes],
+    on_item: Callable[[Any], bool] | None = None,
+    cancel: threading.Event | None = None,
+    started: float | None = None,
+) -> StreamOutcome:
+    started = time.perf_counter() if started is None else started
+    parser = StreamingJSONParser()
+    outcome = StreamOutcome()
+    for event in iter_sse_events(lines):
+        kind = event.get("type", "")
+        if kind == "response.output_text.delta":
+            for item in parser.feed(str(event.get("delta", ""))):
+                if outcome.first_item_sec is None:
+                    outcome.first_item_sec = time.perf_counter() - started
+                outcome.items.append(item)
+                if on_item is not None and on_item(item):
+                    outcome.aborted = True
+                    break
+        elif kind in ("response.completed", "response.incomplete"):
+            outcome.usage = (event.get("response") or {}).get("usage")
+            outcome.completed = True
+            break
+        elif kind in FAILED_EVENTS:
+            outcome.failed = True
+            break
+        if outcome.aborted or (cancel is not None and cancel.is_set()):
+            outcome.aborted = True
+            break
+    outcome.text = parser.text()
+    outcome.parsed = parser.result()
+    return outcome
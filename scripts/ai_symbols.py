@@ -0,0 +1,302 @@
+﻿from __future__ import annotations
+
+import ast
+import builtins
+import json
+import os
+import re
+import subprocess
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+from scripts.ai_cache import evict_dir
+from scripts.ai_diff import estimate_tokens
+from scripts.ai_files import read_blobs
+
+# 2: blobs are decoded as utf-8-sig; version 1 recorded files with a BOM as parse errors.
+INDEX_VERSION = 2
+DEFAULT_SYMBOLS_DIR = ".ai_cache/symbols"
+DEFAULT_SYMBOLS_MAX_BYTES = 50_000_000
+DEFAULT_SYMBOLS_MAX_AGE_DAYS = 30
+GIT_ARGS_CHUNK = 200
+SKIP_NAMES = frozenset(dir(builtins)) | {"self", "cls", "super"}
+IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+DEF_LINE_RE = re.compile(r"^\s*(?:async\s+)?(?:def|class)\s+([A-Za-z_][A-Za-z0-9_]*)")
+
+
+def symbols_config(policy: dict) -> dict:
+    cfg = policy.get("review", {}).get("symbols", {}) or {}
+    return {
+        "enabled": bool(cfg.get("enabled", True)),
+        "dir": str(cfg.get("dir", DEFAULT_SYMBOLS_DIR)),
+        "max_tokens": int(cfg.get("max_tokens", 2000)),
+        "max_files": int(cfg.get("max_files", 20)),
+        "max_names": int(cfg.get("max_names", 40)),
+        "max_candidates": int(cfg.get("max_candidates", 3)),
+        "max_callers": int(cfg.get("max_callers", 3)),
+        "max_def_lines": int(cfg.get("max_def_lines", 40)),
+        "max_bytes": int(cfg.get("max_bytes", DEFAULT_SYMBOLS_MAX_BYTES)),
+        "max_age_days": float(cfg.get("max_age_days", DEFAULT_SYMBOLS_MAX_AGE_DAYS)),
+    }
+
+
+def _collect_defs(body: list[ast.stmt], prefix: str, defs: list[list]) -> None:
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            qualname = f"{prefix}{node.name}"
+            start = min([node.lineno, *(d.lineno for d in node.decorator_list)])
+            kind = "class" if isinstance(node, ast.ClassDef) else "def"
+            defs.append([node.name, qualname, kind, start, node.lineno, node.end_lineno])
+            _collect_defs(node.body, f"{qualname}.", defs)
+            continue
+        # Definitions under module-level if/try (optional imports, platform branches) keep the outer prefix.
+        for field_name in ("body", "orelse", "finalbody", "handlers"):
+            block = getattr(node, field_name, None)
+            if isinstance(block, list):
+                _collect_defs(block, prefix, defs)
+
+
+def index_source(source: str) -> dict:
+    # defs: [name, qualname, kind, start (first decorator), def line, end]; calls: [name, line];
+    # imports: local name -> dotted target.
+    entry: dict = {"version": INDEX_VERSION, "defs": [], "calls": [], "imports": {}}
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError):
+        entry["error"] = True
+        return entry
+    _collect_defs(tree.body, "", entry["defs"])
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+            if name:
+                entry["calls"].append([name, node.lineno])
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                entry["imports"][alias.asname or alias.name.split(".")[0]] = alias.name
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            for alias in node.names:
+                entry["imports"][alias.asname or alias.name] = f"{module}.{alias.name}" if module else alias.name
+    return entry
+
+
+def _git_lines(args: list[str]) -> list[str]:
+    try:
+        result = subprocess.run(["git", *args], capture_output=True, check=False)
+    except OSError:
+        return []
+    # git grep exits 1 on "no match"; anything else is treated the same, as no context.
+    if result.returncode not in (0, 1):
+        return []
+    return result.stdout.decode("utf-8", errors="replace").splitlines()
+
+
+class SymbolIndex:
+    # Per-blob AST summaries of one commit, persisted under <dir>/<sha[:2]>/<sha>.json. Only the blobs
+    # a review actually touches are parsed, and an unchanged blob is never parsed twice.
+    def __init__(self, rev: str, root: Path) -> None:
+        self.rev = rev
+        self.root = root
+        self.blobs: dict[str, str] = {}
+        self.entries: dict[str, dict] = {}
+        self.stats = {"parsed": 0, "cached": 0}
+
+    def _entry_path(self, sha: str) -> Path:
+        return self.root / sha[:2] / f"{sha}.json"
+
+    def resolve(self, paths: Iterable[str]) -> None:
+        missing = sorted({path for path in paths if path not in self.blobs})
+        for i in range(0, len(missing), GIT_ARGS_CHUNK):
+            for line in _git_lines(["ls-tree", "-z", self.rev, "--", *missing[i : i + GIT_ARGS_CHUNK]]):
+                for record in line.split("\0"):
+                    meta, _, path = record.partition("\t")
+                    parts = meta.split()
+                    if len(parts) == 3 and parts[1] == "blob":
+                        self.blobs[path] = parts[2]
+
+    def load(self, paths: Iterable[str]) -> dict[str, dict]:
+        requested = list(dict.fromkeys(paths))
+        missing = [path for path in requested if path not in self.entries]
+        self.resolve(missing)
+        todo: list[str] = []
+        for path in missing:
+            sha = self.blobs.get(path)
+            if sha is None:
+                continue
+            entry_path = self._entry_path(sha)
+            try:
+                entry = json.loads(entry_path.read_text(encoding="utf-8"))
+                os.utime(entry_path)
+            except (OSError, ValueError):
+                todo.append(path)
+                continue
+            if entry.get("version") != INDEX_VERSION:
+                todo.append(path)
+                continue
+            self.entries[path] = entry
+            self.stats["cached"] += 1
+        for path, blob in zip(todo, read_blobs([self.blobs[path] for path in todo])):
+            entry = index_source(blob.decode("utf-8-sig", errors="replace")) if blob is not None else index_source("")
+            self.entries[path] = entry
+            self.stats["parsed"] += 1
+            self._store(self.blobs[path], entry)
+        return {path: self.entries[path] for path in requested if path in self.entries}
+
+    def _store(self, sha: str, entry: dict) -> None:
+        path = self._entry_path(sha)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(entry, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def grep(self, pattern: str) -> list[tuple[str, int, str]]:
+        prefix = f"{self.rev}:"
+        hits: list[tuple[str, int, str]] = []
+        for line in _git_lines(["grep", "-n", "-z", "-E", pattern, self.rev, "--", "*.py"]):
+            parts = line.split("\0", 2)
+            if len(parts) == 3 and parts[1].isdigit():
+                hits.append((parts[0].removeprefix(prefix), int(parts[1]), parts[2]))
+        return hits
+
+
+def _alternation(names: Iterable[str]) -> str:
+    return "|".join(sorted(names))
+
+
+def _module_paths(target: str) -> tuple[str, ...]:
+    module = target.lstrip(".").replace(".", "/")
+    parent = module.rsplit("/", 1)[0] if "/" in module else module
+    # "pkg.mod.func" may name a function in pkg/mod.py or a module pkg/mod/func.py.
+    return (f"{module}.py", f"{module}/__init__.py", f"{parent}.py", f"{parent}/__init__.py")
+
+
+def _innermost_def(defs: list[list], line_no: int) -> list | None:
+    found = None
+    for item in defs:
+        if item[3] <= line_no <= item[5] and (found is None or item[3] >= found[3]):
+            found = item
+    return found
+
+
+def collect_references(
+    entries: dict[str, dict],
+    changed: dict[str, list[int]],
+) -> tuple[Counter, dict[str, set[str]], dict[str, set[str]]]:
+    # Names called on changed lines and definitions that contain changed lines, with the files citing each.
+    called: Counter = Counter()
+    called_by: dict[str, set[str]] = {}
+    changed_defs: dict[str, set[str]] = {}
+    for path, entry in entries.items():
+        lines = set(changed.get(path, ()))
+        for name, line_no in entry["calls"]:
+            if line_no in lines and name not in SKIP_NAMES and not name.startswith("__"):
+                called[name] += 1
+                called_by.setdefault(name, set()).add(path)
+        for line_no in lines:
+            item = _innermost_def(entry["defs"], line_no)
+            if item is not None and not item[0].startswith("__"):
+                changed_defs.setdefault(item[0], set()).add(path)
+    return called, called_by, changed_defs
+
+
+def symbol_context(index: SymbolIndex, changed: dict[str, list[int]], cfg: dict) -> list[dict]:
+    # Snippets ordered by usefulness; each records the changed files ("refs") whose hunks cite it.
+    py_changed = {path: lines for path, lines in changed.items() if path.endswith(".py") and lines}
+    chosen = sorted(py_changed, key=lambda path: -len(py_changed[path]))[: cfg["max_files"]]
+    entries = index.load(chosen)
+    called, called_by, changed_defs = collect_references(entries, py_changed)
+
+    snippets: list[dict] = []
+    names = [name for name, _ in called.most_common(cfg["max_names"]) if IDENT_RE.match(name)]
+    if names:
+        found: dict[str, list[tuple[str, int]]] = {}
+        pattern = rf"^[[:space:]]*(async[[:space:]]+)?(def|class)[[:space:]]+({_alternation(names)})([^[:alnum:]_]|$)"
+        for path, line_no, text in index.grep(pattern):
+            match = DEF_LINE_RE.match(text)
+            if match and line_no not in set(py_changed.get(path, ())):
+                found.setdefault(match.group(1), []).append((path, line_no))
+        for name in names:
+            sites = found.get(name, [])
+            if not sites or len(sites) > cfg["max_candidates"]:
+                continue
+            refs = called_by[name]
+            targets = {target for path in refs for local, target in entries[path]["imports"].items() if local == name}
+            preferred = {module_path for target in targets for module_path in _module_paths(target)} | refs
+            ranked = sorted(sites, key=lambda site: (site[0] not in preferred, site[0], site[1]))
+            for path, line_no in ranked[: 1 if ranked[0][0] in preferred else cfg["max_candidates"]]:
+                snippets.append({"kind": "definition", "symbol": name, "path": path, "line": line_no, "refs": refs})
+
+    callee_names = [name for name in changed_defs if IDENT_RE.match(name)][: cfg["max_names"]]
+    if callee_names:
+        per_name: Counter = Counter()
+        pattern = rf"(^|[^[:alnum:]_])({_alternation(callee_names)})[[:space:]]*\("
+        call_re = re.compile(rf"(?:^|[^A-Za-z0-9_])({'|'.join(callee_names)})\s*\(")
+        for path, line_no, text in index.grep(pattern):
+            match = call_re.search(text)
+            if not match or DEF_LINE_RE.match(text) or line_no in set(py_changed.get(path, ())):
+                continue
+            name = match.group(1)
+            if per_name[name] >= cfg["max_callers"]:
+                continue
+            per_name[name] += 1
+            snippets.append({"kind": "caller", "symbol": name, "path": path, "line": line_no, "refs": changed_defs[name]})
+
+    if not snippets:
+        return []
+    index.resolve({snippet["path"] for snippet in snippets})
+    files = sorted({snippet["path"] for snippet in snippets if snippet["path"] in index.blobs})
+    sources = dict(zip(files, read_blobs([index.blobs[path] for path in files])))
+    caller_entries = index.load(sorted({s["path"] for s in snippets if s["kind"] == "caller"}))
+    def_entries = index.load(sorted({s["path"] for s in snippets if s["kind"] == "definition"}))
+    kept: list[dict] = []
+    for snippet in snippets:
+        blob = sources.get(snippet["path"])
+        if blob is None:
+            continue
+        lines = blob.decode("utf-8-sig", errors="replace").splitlines()
+        if snippet["kind"] == "definition":
+            entry = def_entries.get(snippet["path"], {})
+            item = next((d for d in entry.get("defs", []) if d[4] == snippet["line"]), None)
+            if item is None:
+                continue
+            start, end = item[3], min(item[5], item[3] + cfg["max_def_lines"] - 1)
+            snippet["symbol"] = item[1]
+            code = lines[start - 1 : end]
+            if end < item[5]:
+                code.append("    ...")
+        else:
+            enclosing = _innermost_def(caller_entries.get(snippet["path"], {}).get("defs", []), snippet["line"])
+            snippet["caller"] = enclosing[1] if enclosing else "<module>"
+            start = max(1, snippet["line"] - 1)
+            code = lines[start - 1 : snippet["line"] + 1]
+        snippet["code"] = "\n".join(code)
+        kept.append(snippet)
+    return kept
+
+
+def select_symbols(snippets: list[dict], files: set[str] | None, max_tokens: int) -> list[dict]:
+    # Budgeted view for one prompt slice; "refs" is bookkeeping and never reaches the prompt.
+    chosen: list[dict] = []
+    used = 0
+    for snippet in snippets:
+        if files is not None and not snippet["refs"] & files:
+            continue
+        item = {key: value for key, value in snippet.items() if key != "refs"}
+        cost = estimate_tokens(json.dumps(item, ensure_ascii=False))
+        if used + cost > max_tokens:
+            continue
+        chosen.append(item)
+        used += cost
+    return chosen
+
+
+def evict_symbols(policy: dict) -> int:
+    cfg = symbols_config(policy)
+    return evict_dir(Path(cfg["dir"]), cfg["max_bytes"], cfg["max_age_days"] * 86400)
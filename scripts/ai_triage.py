@@ -0,0 +1,441 @@
+﻿from __future__ import annotations
+
+import ast
+import io
+import tokenize
+from collections import Counter
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from typing import Iterable, Iterator
+
+from scripts.ai_diff import INDENT_SENSITIVE_EXTS, FileDiff, Hunk
+from scripts.ai_files import read_blobs
+
+TRIAGE_KINDS = ("unchanged", "docs", "tests", "logic")
+DEFAULT_DOC_GLOBS = ["*.md", "*.rst", "*.adoc", "docs/*", "*/docs/*", "LICENSE*", "CHANGELOG*"]
+# Files that decide what gets installed, built or run: always reviewed, whatever their path or edit looks like.
+MANIFEST_GLOBS = [
+    f"{prefix}{name}"
+    for name in (
+        "requirements*.txt",
+        "requirements*.in",
+        "constraints*.txt",
+        "setup.py",
+        "setup.cfg",
+        "pyproject.toml",
+        "Pipfile",
+        "Pipfile.lock",
+        "poetry.lock",
+        "package.json",
+        "package-lock.json",
+        "yarn.lock",
+        "pnpm-lock.yaml",
+        "go.mod",
+        "go.sum",
+        "Cargo.toml",
+        "Cargo.lock",
+        "Gemfile",
+        "Gemfile.lock",
+        "CMakeLists.txt",
+        "*.cmake",
+        "Makefile",
+        "Dockerfile*",
+    )
+    for prefix in ("", "*/")
+] + [".github/workflows/*"]
+DEFAULT_TEST_GLOBS = [
+    "tests/*",
+    "test/*",
+    "*/tests/*",
+    "*/test/*",
+    "test_*.py",
+    "*/test_*.py",
+    "*_test.py",
+    "*_test.go",
+    "*.test.js",
+    "*.test.ts",
+    "*.spec.js",
+    "*.spec.ts",
+]
+DEFAULT_MAX_FILE_BYTES = 1_000_000
+BLOB_BATCH_FILES = 64
+BODY_FIELDS = ("body", "handlers", "orelse", "finalbody", "cases")
+DOCSTRING_OWNERS = (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+COMMENT_PREFIXES = {
+    ".py": ("#",),
+    ".pyi": ("#",),
+    ".sh": ("#",),
+    ".rb": ("#",),
+    ".yaml": ("#",),
+    ".yml": ("#",),
+    ".toml": ("#",),
+    ".js": ("//", "/*", "*/"),
+    ".jsx": ("//", "/*", "*/"),
+    ".ts": ("//", "/*", "*/"),
+    ".tsx": ("//", "/*", "*/"),
+    ".java": ("//", "/*", "*/"),
+    ".kt": ("//", "/*", "*/"),
+    ".go": ("//", "/*", "*/"),
+    ".rs": ("//", "/*", "*/"),
+    ".c": ("//", "/*", "*/"),
+    ".h": ("//", "/*", "*/"),
+    ".cpp": ("//", "/*", "*/"),
+    ".cs": ("//", "/*", "*/"),
+    ".swift": ("//", "/*", "*/"),
+    ".php": ("//", "#", "/*", "*/"),
+}
+# Code wherever it lives: fnmatch's "*" crosses "/", so "docs/*" alone would take docs/conf.py for documentation.
+CODE_SUFFIXES = frozenset(COMMENT_PREFIXES) | {
+    ".cc", ".hpp", ".mjs", ".cjs", ".scala", ".sql", ".ps1", ".bat", ".mk", "Makefile"
+}
+
+
+@dataclass
+class Triage:
+    files: dict[str, str] = field(default_factory=dict)
+    # (old_start, new_start) of hunks in substantive files that only touch comments or blank lines.
+    trivial_hunks: dict[str, set[tuple[int, int]]] = field(default_factory=dict)
+    hunks_dropped: int = 0
+
+    def counts(self) -> dict[str, int]:
+        counts = dict.fromkeys(TRIAGE_KINDS, 0)
+        for kind in self.files.values():
+            counts[kind] += 1
+        return counts
+
+    def to_dict(self, review_kinds: Iterable[str]) -> dict:
+        return {
+            "review_kinds": list(review_kinds),
+            "counts": self.counts(),
+            "hunks_dropped": self.hunks_dropped,
+            "files": self.files,
+        }
+
+
+def triage_config(policy: dict) -> dict:
+    cfg = policy.get("review", {}).get("triage", {}) or {}
+    return {
+        "enabled": bool(cfg.get("enabled", True)),
+        "review_kinds": list(cfg.get("review_kinds", ["logic"])),
+        "doc_globs": list(cfg.get("doc_globs", DEFAULT_DOC_GLOBS)),
+        "test_globs": list(cfg.get("test_globs", DEFAULT_TEST_GLOBS)),
+        "manifest_globs": MANIFEST_GLOBS + list(cfg.get("manifest_globs", []) or []),
+        "max_file_bytes": int(cfg.get("max_file_bytes", DEFAULT_MAX_FILE_BYTES)),
+    }
+
+
+def _suffix(path: str) -> str:
+    name = path.rsplit("/", 1)[-1]
+    return name[name.rfind(".") :] if "." in name else name
+
+
+def _is_docstring(node: ast.AST) -> bool:
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def _start(node: ast.AST) -> int:
+    line = getattr(node, "lineno", None) or node.pattern.lineno
+    return min([line, *(d.lineno for d in getattr(node, "decorator_list", []))])
+
+
+def _field_dump(value: object) -> object:
+    if isinstance(value, ast.AST):
+        return ast.dump(value)
+    if isinstance(value, list):
+        return tuple(_field_dump(item) for item in value)
+    return value
+
+
+class PythonSide:
+    # Statement-level line index of one side of a file. Only statements that a changed line touches
+    # are dumped and compared, so the cost follows the size of the change, not of the file.
+    def __init__(self, source: str) -> None:
+        self.lines = source.splitlines()
+        self.entries: list[tuple[ast.AST, tuple, bool]] = []
+        self.owners: dict[int, list[int]] = {}
+        self.docstrings: set[int] = set()
+        self._index(ast.parse(source), ())
+
+    def _add(self, start: int, end: int, node: ast.AST, path: tuple, header: bool) -> None:
+        entry = len(self.entries)
+        self.entries.append((node, path, header))
+        for line_no in range(start, max(start, end) + 1):
+            self.owners.setdefault(line_no, []).append(entry)
+
+    def _index(self, parent: ast.AST, path: tuple) -> None:
+        for field_name in BODY_FIELDS:
+            block = getattr(parent, field_name, None)
+            if not isinstance(block, list):
+                continue
+            skip, run_start = 0, -1
+            for index, node in enumerate(block):
+                if index == 0 and field_name == "body" and isinstance(parent, DOCSTRING_OWNERS) and _is_docstring(node):
+                    self.docstrings.update(range(node.lineno, node.end_lineno + 1))
+                    skip = 1
+                    continue
+                # Positions skip the docstring; adjacent imports share one slot, so reordering them is not a change.
+                position = index - skip
+                if isinstance(node, (ast.Import, ast.ImportFrom)):
+                    run_start = position if run_start < 0 else run_start
+                    node_path = (*path, (field_name, "imports", run_start))
+                else:
+                    run_start = -1
+                    node_path = (*path, (field_name, position))
+                first = next((getattr(node, name)[0] for name in BODY_FIELDS if getattr(node, name, None)), None)
+                if first is None:
+                    self._add(node.lineno, node.end_lineno, node, node_path, False)
+                    continue
+                # Compound statement: its header (decorators through the line before the body) is its own entry.
+                self._add(_start(node), _start(first) - 1, node, node_path, True)
+                self._index(node, node_path)
+
+    def key(self, entry: int) -> tuple:
+        node, path, header = self.entries[entry]
+        if header:
+            fields = tuple((name, _field_dump(value)) for name, value in ast.iter_fields(node) if name not in BODY_FIELDS)
+            return (path, type(node).__name__, fields)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            node.names.sort(key=lambda alias: (alias.name, alias.asname or ""))
+        return (path, ast.dump(node))
+
+    def changes(self, line_numbers: Iterable[int], with_keys: bool = True) -> tuple[Counter, bool, bool, set[int]]:
+        # Keys of touched statements, whether a comment/docstring was edited, whether a line outside any
+        # statement (`else:`, `finally:`) was edited, and the changed lines that are only comment/docstring/blank.
+        keys: Counter = Counter()
+        seen: set[int] = set()
+        docs = structural = False
+        trivial: set[int] = set()
+        for line_no in line_numbers:
+            text = self.lines[line_no - 1] if line_no <= len(self.lines) else ""
+            owners = self.owners.get(line_no)
+            if owners:
+                for entry in owners if with_keys else ():
+                    if entry not in seen:
+                        seen.add(entry)
+                        keys[self.key(entry)] += 1
+                docs = docs or "#" in text
+            elif line_no in self.docstrings or text.lstrip().startswith("#"):
+                docs = True
+                trivial.add(line_no)
+            elif not text.strip():
+                trivial.add(line_no)
+            else:
+                structural = True
+        return keys, docs, structural, trivial
+
+
+def _tokens(source: str) -> tuple[list[tuple[int, str]], list[str]] | None:
+    # Code tokens without layout (indent width, non-logical newlines) and the comments, separately.
+    code: list[tuple[int, str]] = []
+    comments: list[str] = []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+            if tok.type == tokenize.COMMENT:
+                comments.append(tok.string.rstrip())
+            elif tok.type == tokenize.NL:
+                continue
+            else:
+                code.append((tok.type, "" if tok.type in (tokenize.INDENT, tokenize.NEWLINE) else tok.string))
+    except (tokenize.TokenError, SyntaxError):
+        return None
+    return code, comments
+
+
+def _changed_text(hunk: Hunk, old_lines: list[str], new_lines: list[str]) -> tuple[list[str], list[str]]:
+    removed = [old_lines[line_no - 1] if line_no <= len(old_lines) else "" for line_no in hunk.removed]
+    added = [new_lines[line_no - 1] if line_no <= len(new_lines) else "" for line_no in hunk.added]
+    return removed, added
+
+
+def _plain_code_change(removed: list[str], added: list[str]) -> bool:
+    # No comment, string or import on the changed lines and different non-blank text: code changed,
+    # no parse needed. Anything else (including parenthesis-only edits) goes to the statement compare.
+    if any(marker in line for line in (*removed, *added) for marker in ("#", '"', "'", "import")):
+        return False
+    return "".join("".join(line.split()) for line in removed) != "".join("".join(line.split()) for line in added)
+
+
+def _text_trivial(lines: list[str], prefixes: tuple[str, ...] | None) -> bool:
+    return all(not line.strip() or (prefixes and line.lstrip().startswith(prefixes)) for line in lines)
+
+
+def classify_python(old: str, new: str, hunks: list[Hunk]) -> tuple[str, set[tuple[int, int]]]:
+    # Returns the file's kind and the (old_start, new_start) of hunks that only touch comments,
+    # docstrings or blank lines.
+    old_lines, new_lines = old.splitlines(), new.splitlines()
+    plain_hunks = [_plain_code_change(*_changed_text(hunk, old_lines, new_lines)) for hunk in hunks]
+    plain = any(plain_hunks)
+    candidates = [hunk for hunk, is_plain in zip(hunks, plain_hunks) if not is_plain]
+    if plain and not candidates:
+        return "logic", set()
+    try:
+        old_side, new_side = PythonSide(old), PythonSide(new)
+    except (SyntaxError, ValueError, RecursionError):
+        # Unparseable on either side: fall back to comparing whole token streams.
+        trivial = {
+            (hunk.old_start, hunk.new_start)
+            for hunk in candidates
+            if _text_trivial([line for side in _changed_text(hunk, old_lines, new_lines) for line in side], ("#",))
+        }
+        old_tokens, new_tokens = _tokens(old), _tokens(new)
+        if old_tokens is None or new_tokens is None or old_tokens[0] != new_tokens[0]:
+            return "logic", trivial
+        return ("unchanged" if old_tokens[1] == new_tokens[1] else "docs"), trivial
+    if plain:
+        hunks = candidates
+    removed = [line_no for hunk in hunks for line_no in hunk.removed]
+    added = [line_no for hunk in hunks for line_no in hunk.added]
+    # With a plain code change already seen, only the trivial lines are needed, not statement keys.
+    old_keys, old_docs, old_structural, old_trivial = old_side.changes(removed, with_keys=not plain)
+    new_keys, new_docs, new_structural, new_trivial = new_side.changes(added, with_keys=not plain)
+    trivial = {(hunk.old_start, hunk.new_start) for hunk in hunks if is_trivial_hunk(hunk, old_trivial, new_trivial)}
+    if plain or old_structural or new_structural or old_keys != new_keys:
+        return "logic", trivial
+    return ("docs" if old_docs or new_docs else "unchanged"), trivial
+
+
+def classify_text(path: str, old: str, new: str) -> str:
+    if path.endswith(INDENT_SENSITIVE_EXTS):
+        # Indentation is meaning here; only trailing spaces and blank lines can be ignored.
+        def layout(text: str) -> list:
+            return [line.rstrip() for line in text.splitlines() if line.strip()]
+    else:
+        # Tokens per line, not per file: joining lines can change meaning (ASI in JS/Go).
+        def layout(text: str) -> list:
+            return [line.split() for line in text.splitlines() if line.strip()]
+    if layout(old) == layout(new):
+        return "unchanged"
+    prefixes = COMMENT_PREFIXES.get(_suffix(path))
+    if prefixes:
+        def code(text: str) -> list:
+            return [line for line in layout(text) if not "".join(line).lstrip().startswith(prefixes)]
+        if code(old) == code(new):
+            return "docs"
+    return "logic"
+
+
+def _comment_lines(source: str, prefixes: tuple[str, ...] | None) -> set[int]:
+    # 1-based numbers of lines that hold only a comment or nothing.
+    return {
+        line_no
+        for line_no, line in enumerate(source.splitlines(), start=1)
+        if not line.strip() or (prefixes and line.lstrip().startswith(prefixes))
+    }
+
+
+def is_trivial_hunk(hunk: Hunk, old_trivial: set[int], new_trivial: set[int]) -> bool:
+    if not hunk.added and not hunk.removed:
+        return False
+    return all(no in old_trivial for no in hunk.removed) and all(no in new_trivial for no in hunk.added)
+
+
+def _hunk_text_trivial(hunk: Hunk, prefixes: tuple[str, ...] | None) -> bool:
+    changed = [line[1:] for line in hunk.lines[1:] if line[:1] in ("+", "-")]
+    return bool(changed) and _text_trivial(changed, prefixes)
+
+
+def _matches(path: str, globs: list[str]) -> bool:
+    return any(fnmatch(path, pattern) for pattern in globs)
+
+
+def _decode(blob: bytes | None, limit: int) -> str | None:
+    if blob is None or len(blob) > limit or b"\0" in blob[:8000]:
+        return None
+    return blob.decode("utf-8-sig", errors="replace")
+
+
+def classify_file(
+    file_diff: FileDiff,
+    old_blob: bytes | None,
+    new_blob: bytes | None,
+    cfg: dict,
+    triage: Triage,
+) -> str:
+    path = file_diff.changed_path
+    if _matches(path, cfg["manifest_globs"]) or _matches(file_diff.old_path, cfg["manifest_globs"]):
+        return "logic"
+    if _matches(path, cfg["doc_globs"]) and _suffix(path) not in CODE_SUFFIXES:
+        return "docs"
+    is_test = _matches(path, cfg["test_globs"])
+    if not file_diff.hunks and not file_diff.is_new and not file_diff.is_deleted:
+        # Pure rename or mode change; binary edits are told apart by their bytes when both sides are known.
+        if old_blob is not None and new_blob is not None:
+            return "unchanged" if old_blob == new_blob else ("tests" if is_test else "logic")
+        return "unchanged" if file_diff.old_path != file_diff.path else ("tests" if is_test else "logic")
+    old = _decode(old_blob, cfg["max_file_bytes"])
+    new = _decode(new_blob, cfg["max_file_bytes"])
+    prefixes = COMMENT_PREFIXES.get(_suffix(path))
+    modified = not file_diff.is_new and not file_diff.is_deleted
+    if (old is None and not file_diff.is_new) or (new is None and not file_diff.is_deleted):
+        # No sources (a posted diff, or an oversized/binary side): only the hunk text can be judged.
+        trivial = {(hunk.old_start, hunk.new_start) for hunk in file_diff.hunks if _hunk_text_trivial(hunk, prefixes)}
+        if modified and file_diff.hunks and len(trivial) == len(file_diff.hunks):
+            return "docs"
+    elif path.endswith((".py", ".pyi")):
+        kind, trivial = classify_python(old or "", new or "", file_diff.hunks)
+        if modified and kind != "logic":
+            return kind
+    else:
+        kind = classify_text(path, old or "", new or "")
+        if modified and kind != "logic":
+            return kind
+        old_trivial, new_trivial = _comment_lines(old or "", prefixes), _comment_lines(new or "", prefixes)
+        trivial = {
+            (hunk.old_start, hunk.new_start)
+            for hunk in file_diff.hunks
+            if is_trivial_hunk(hunk, old_trivial, new_trivial)
+        }
+    if trivial:
+        triage.trivial_hunks[path] = trivial
+    return "tests" if is_test else "logic"
+
+
+def triage_file_diffs(
+    file_diffs: Iterable[FileDiff],
+    cfg: dict,
+    base_sha: str = "",
+    head_sha: str = "",
+) -> Triage:
+    # Hunk ranges are enough here; both sides of each file come from `git cat-file` in batches.
+    triage = Triage()
+    batch: list[FileDiff] = []
+
+    def flush() -> None:
+        specs: list[str] = []
+        for fd in batch:
+            specs.append(f"{base_sha}:{fd.old_path}" if base_sha and not fd.is_new else "")
+            specs.append(f"{head_sha}:{fd.path}" if head_sha and not fd.is_deleted else "")
+        wanted = [spec for spec in specs if spec]
+        found = dict(zip(wanted, read_blobs(wanted)))
+        for i, fd in enumerate(batch):
+            old_blob, new_blob = found.get(specs[2 * i]), found.get(specs[2 * i + 1])
+            triage.files[fd.changed_path] = classify_file(fd, old_blob, new_blob, cfg, triage)
+        batch.clear()
+
+    for file_diff in file_diffs:
+        batch.append(file_diff)
+        if len(batch) >= BLOB_BATCH_FILES:
+            flush()
+    if batch:
+        flush()
+    return triage
+
+
+def filter_file_diffs(
+    file_diffs: Iterable[FileDiff],
+    triage: Triage,
+    review_kinds: Iterable[str],
+) -> Iterator[FileDiff]:
+    kinds = set(review_kinds)
+    for file_diff in file_diffs:
+        path = file_diff.changed_path
+        if triage.files.get(path, "logic") not in kinds:
+            continue
+        trivial = triage.trivial_hunks.get(path)
+        if trivial:
+            hunks = [hunk for hunk in file_diff.hunks if (hunk.old_start, hunk.new_start) not in trivial]
+            triage.hunks_dropped += len(file_diff.hunks) - len(hunks)
+            if file_diff.hunks and not hunks:
+                continue
+            file_diff = FileDiff(file_diff.path, file_diff.old_path, file_diff.header, hunks)
+        yield file_diff
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    # The scripts run git in the working directory, so each test gets its own repository as cwd.
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    monkeypatch.chdir(repo)
+
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], check=True, capture_output=True, text=True).stdout.strip()
+
+    git("init", "-q")
+    git("config", "user.email", "tests@example.com")
+    git("config", "user.name", "tests")
+    git("config", "core.autocrlf", "false")
+    return git
+
+
+@pytest.fixture
+def commit_files(git_repo):
+    # Writes (or, for None, deletes) the given files, commits them and returns the new HEAD.
+    def commit(files: dict[str, bytes | None], message: str = "files") -> str:
+        for path, data in files.items():
+            target = Path(path)
+            if data is None:
+                target.unlink()
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+        git_repo("add", "-A")
+        git_repo("commit", "-q", "--allow-empty", "-m", message)
+        return git_repo("rev-parse", "HEAD")
+
+    return commit
@@ -0,0 +1,27 @@
+from scripts.ai_common import remaining_run_budget
+from scripts.ai_metrics import Metrics, use_metrics
+
+
+def test_run_budget_belongs_to_each_run():
+    retry_cfg = {"run_deadline_sec": 60}
+    first, second = Metrics(), Metrics()
+
+    with use_metrics(first):
+        assert 59 < remaining_run_budget(retry_cfg) <= 60
+    first.deadline -= 30
+    # A run starting later gets its own full budget and leaves the earlier one's deadline alone.
+    with use_metrics(second):
+        assert 59 < remaining_run_budget(retry_cfg) <= 60
+    with use_metrics(first):
+        assert 29 < remaining_run_budget(retry_cfg) <= 30
+
+    first.reset()
+    with use_metrics(first):
+        assert 59 < remaining_run_budget(retry_cfg) <= 60
+
+
+def test_run_budget_disabled():
+    with use_metrics(Metrics()) as metrics:
+        assert remaining_run_budget({}) is None
+        assert remaining_run_budget({"run_deadline_sec": 0}) is None
+    assert metrics.deadline is None
@@ -0,0 +1,170 @@
+import pytest
+
+from scripts.ai_diff import (
+    compact_diff,
+    is_whitespace_only,
+    iter_file_diffs,
+    parse_unified_diff,
+    remap_line,
+    render_file_diff,
+    trim_context,
+)
+
+DIFF = """diff --git a/app.py b/app.py
+index 1111111..2222222 100644
+--- a/app.py
++++ b/app.py
+@@ -1,4 +1,5 @@
+ import os
+-import sys
++import json
++import re
+
+ def main():
+@@ -10,3 +11,2 @@ def main():
+     a = 1
+-    b = 2
+     return a
+diff --git a/old name.txt b/new name.txt
+similarity index 90%
+rename from old name.txt
+rename to new name.txt
+--- a/old name.txt
++++ b/new name.txt
+@@ -1 +1 @@
+-hello
++hello world
+\\ No newline at end of file
+diff --git a/gone.md b/gone.md
+deleted file mode 100644
+--- a/gone.md
++++ /dev/null
+@@ -1,2 +0,0 @@
+-# Title
+-text
+diff --git a/new.py b/new.py
+new file mode 100644
+--- /dev/null
++++ b/new.py
+@@ -0,0 +1 @@
++print("hi")"""
+
+
+def hunk_of(body: str, header: str = "@@ -1,9 +1,9 @@"):
+    return parse_unified_diff(f"--- a/f.txt\n+++ b/f.txt\n{header}\n{body}")[0].hunks[0]
+
+
+def test_parser_reads_paths_ranges_and_line_numbers():
+    files = parse_unified_diff(DIFF)
+
+    assert [(f.old_path, f.path, f.changed_path) for f in files] == [
+        ("app.py", "app.py", "app.py"),
+        ("old name.txt", "new name.txt", "new name.txt"),
+        ("gone.md", "/dev/null", "gone.md"),
+        ("/dev/null", "new.py", "new.py"),
+    ]
+    assert [f.is_deleted for f in files] == [False, False, True, False]
+    assert [f.is_new for f in files] == [False, False, False, True]
+    first, second = files[0].hunks
+    assert (first.old_start, first.old_count, first.new_start, first.new_count) == (1, 4, 1, 5)
+    assert list(first.added) == [2, 3] and list(first.removed) == [2]
+    assert list(second.added) == [] and list(second.removed) == [11]
+    assert files[1].hunks[0].lines[-1] == "\\ No newline at end of file"
+    # The blank context line (trailing space stripped by an editor) comes back as " ".
+    assert render_file_diff(files[0]) == DIFF.split("\ndiff --git a/old")[0].replace("\n\n", "\n \n")
+
+
+def test_parser_without_lines_keeps_numbers():
+    files = list(iter_file_diffs(DIFF.split("\n"), keep_lines=False))
+
+    assert [h.lines for f in files for h in f.hunks] == [[], [], [], [], []]
+    assert list(files[0].hunks[0].added) == [2, 3]
+    assert list(files[2].hunks[0].removed) == [1, 2]
+
+
+def test_parser_absorbs_undercounted_hunks():
+    # Hand-written patch: the header claims one line on each side but the body has more.
+    files = parse_unified_diff("--- a/f.py\n+++ b/f.py\n@@ -1 +1 @@\n-a\n+b\n+c\n d")
+    hunk = files[0].hunks[0]
+
+    assert (hunk.old_count, hunk.new_count) == (2, 3)
+    assert list(hunk.added) == [1, 2] and list(hunk.removed) == [1]
+
+
+def test_remap_line():
+    hunks = parse_unified_diff(DIFF)[0].hunks
+
+    # Before, inside and after the first hunk, then inside and after the second.
+    assert remap_line(hunks, 1) == 1
+    assert remap_line(hunks, 2) is None
+    assert remap_line(hunks, 3) == 4
+    assert remap_line(hunks, 4) == 5
+    assert remap_line(hunks, 9) == 10
+    assert remap_line(hunks, 10) == 11
+    assert remap_line(hunks, 11) is None
+    assert remap_line(hunks, 12) == 12
+    assert remap_line(hunks, 40) == 40
+
+
+def test_remap_line_across_pure_insertion():
+    hunks = parse_unified_diff("--- a/f\n+++ b/f\n@@ -3,0 +4,2 @@\n+x\n+y")[0].hunks
+
+    assert remap_line(hunks, 3) == 3
+    assert remap_line(hunks, 4) == 6
+
+
+@pytest.mark.parametrize(
+    "body, indent_sensitive, expected",
+    [
+        ("-a  =  1\n+a = 1", False, True),
+        ("-call(a,\n-     b)\n+call(a, b)", False, True),
+        ("-a b\n+ab", False, False),
+        ("-a b\n+a c", False, False),
+        ("-x = 1  \n+x = 1\n+", True, True),
+        ("-    x = 1\n+x = 1", True, False),
+        (" context only", False, False),
+    ],
+)
+def test_is_whitespace_only(body, indent_sensitive, expected):
+    assert is_whitespace_only(hunk_of(body), indent_sensitive) is expected
+
+
+def test_trim_context():
+    body = " 1\n 2\n 3\n 4\n-5\n+five\n 6\n 7\n 8\n 9"
+    hunk, trimmed = trim_context(hunk_of(body, "@@ -1,9 +1,9 @@"), 1)
+
+    assert trimmed == 6
+    assert hunk.lines == ["@@ -4,3 +4,3 @@", " 4", "-5", "+five", " 6"]
+    assert list(hunk.added) == [5] and list(hunk.removed) == [5]
+
+
+def test_trim_context_keeps_enough_and_no_newline_marker():
+    hunk = hunk_of(" 1\n-2\n+two\n 3", "@@ -1,3 +1,3 @@")
+    assert trim_context(hunk, 3) == (hunk, 0)
+
+    marked = hunk_of(" 1\n 2\n-3\n+three\n 4\n\\ No newline at end of file", "@@ -1,4 +1,4 @@")
+    trimmed, count = trim_context(marked, 0)
+    assert count == 2
+    assert trimmed.lines[0] == "@@ -3,2 +3,2 @@" and trimmed.lines[-1] == "\\ No newline at end of file"
+
+
+def test_trim_context_of_pure_deletion():
+    hunk, trimmed = trim_context(hunk_of(" 1\n 2\n-3\n 4", "@@ -1,4 +1,3 @@"), 0)
+
+    assert trimmed == 3
+    assert hunk.lines == ["@@ -3,1 +2,0 @@", "-3"]
+
+
+def test_compact_diff_drops_excluded_files_and_whitespace_hunks():
+    diff = (
+        "--- a/yarn.lock\n+++ b/yarn.lock\n@@ -1 +1 @@\n-a\n+b\n"
+        "--- a/style.css\n+++ b/style.css\n@@ -1 +1 @@\n-a{color:red}\n+a{color: red}\n"
+        "--- a/main.js\n+++ b/main.js\n@@ -1 +1 @@\n-a  =  1\n+a = 1\n@@ -9 +9 @@\n-b\n+c"
+    )
+
+    text, stats = compact_diff(diff, ["*.lock"], 3)
+
+    assert stats == {"files_dropped": ["yarn.lock"], "whitespace_hunks_dropped": 1, "context_lines_trimmed": 0}
+    assert text == "--- a/style.css\n+++ b/style.css\n@@ -1 +1 @@\n-a{color:red}\n+a{color: red}\n" + (
+        "--- a/main.js\n+++ b/main.js\n@@ -9 +9 @@\n-b\n+c"
+    )
@@ -0,0 +1,169 @@
+from pathlib import Path
+
+import pytest
+
+from scripts.ai_patch import apply_patch, check_patch, parse_patch
+
+SOURCE = "".join(f"line {n}\n" for n in range(1, 11))
+
+
+def write(root: Path, files: dict[str, bytes]) -> None:
+    for path, data in files.items():
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+
+def snapshot(root: Path) -> dict[str, bytes]:
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in sorted(root.rglob("*")) if path.is_file()}
+
+
+def edit_patch(path: str, start: int, before: list[str], removed: str, added: str, after: list[str]) -> str:
+    old = [f" {line}" for line in before] + [f"-{removed}"] + [f" {line}" for line in after]
+    new_count = len(before) + 1 + len(after)
+    body = "\n".join(old[: len(before) + 1] + [f"+{added}"] + old[len(before) + 1 :])
+    return f"--- a/{path}\n+++ b/{path}\n@@ -{start},{new_count} +{start},{new_count} @@\n{body}\n"
+
+
+def test_exact_apply(tmp_path):
+    write(tmp_path, {"a.py": SOURCE.encode()})
+    patch = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"])
+
+    outcome = apply_patch(parse_patch(patch), tmp_path)
+
+    assert outcome.ok and outcome.files == ["a.py"]
+    assert (tmp_path / "a.py").read_text() == SOURCE.replace("line 6\n", "LINE 6\n")
+
+
+def test_offset_apply(tmp_path):
+    # Three lines were added above the hunk since the patch was made.
+    write(tmp_path, {"a.py": ("x\ny\nz\n" + SOURCE).encode()})
+    patch = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"])
+
+    outcome = apply_patch(parse_patch(patch), tmp_path)
+
+    assert outcome.ok
+    assert (tmp_path / "a.py").read_text() == "x\ny\nz\n" + SOURCE.replace("line 6\n", "LINE 6\n")
+
+
+def test_fuzz_apply(tmp_path):
+    # The outermost context lines no longer match; fuzz 2 drops them and applies on the inner context.
+    write(tmp_path, {"a.py": SOURCE.replace("line 4\n", "line four\n").replace("line 8\n", "line eight\n").encode()})
+    patch = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"])
+
+    assert not apply_patch(parse_patch(patch), tmp_path, fuzz=0).ok
+    outcome = apply_patch(parse_patch(patch), tmp_path, fuzz=2)
+
+    assert outcome.ok
+    assert "LINE 6\n" in (tmp_path / "a.py").read_text()
+    assert "line four\n" in (tmp_path / "a.py").read_text()
+
+
+def test_mismatched_hunk_is_rejected_without_partial_write(tmp_path):
+    write(tmp_path, {"a.py": SOURCE.encode(), "b.py": SOURCE.encode()})
+    good = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"])
+    bad = edit_patch("b.py", 4, ["line 4", "line 5"], "not in the file", "LINE 6", ["line 7", "line 8"])
+    before = snapshot(tmp_path)
+
+    outcome = apply_patch(parse_patch(good + bad), tmp_path)
+
+    assert not outcome.ok
+    assert any(error.startswith("b.py: hunk 1") for error in outcome.errors)
+    assert snapshot(tmp_path) == before
+
+
+def test_failed_write_leaves_the_tree_untouched(tmp_path, monkeypatch):
+    write(tmp_path, {"a.py": SOURCE.encode(), "b.py": SOURCE.encode()})
+    patch = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"]) + edit_patch(
+        "b.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"]
+    )
+    before = snapshot(tmp_path)
+    write_bytes = Path.write_bytes
+
+    def failing_write(self, data):
+        if self.name.startswith(".b.py."):
+            raise OSError("disk full")
+        return write_bytes(self, data)
+
+    monkeypatch.setattr(Path, "write_bytes", failing_write)
+    outcome = apply_patch(parse_patch(patch), tmp_path)
+    monkeypatch.undo()
+
+    assert not outcome.ok and outcome.errors == ["write failed: disk full"]
+    assert snapshot(tmp_path) == before
+
+
+def test_crlf_and_bom_are_kept(tmp_path):
+    original = b"\xef\xbb\xbf" + SOURCE.replace("\n", "\r\n").encode()
+    write(tmp_path, {"a.py": original})
+    patch = edit_patch("a.py", 1, [], "line 1", "LINE 1", ["line 2", "line 3"])
+
+    outcome = apply_patch(parse_patch(patch), tmp_path)
+
+    assert outcome.ok
+    assert (tmp_path / "a.py").read_bytes() == original.replace(b"line 1\r\n", b"LINE 1\r\n")
+
+
+def test_crlf_patch_on_lf_file_keeps_lf(tmp_path):
+    write(tmp_path, {"a.py": SOURCE.encode()})
+    patch = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"]).replace("\n", "\r\n")
+
+    assert apply_patch(parse_patch(patch), tmp_path).ok
+    assert (tmp_path / "a.py").read_bytes() == SOURCE.replace("line 6\n", "LINE 6\n").encode()
+
+
+def test_new_deleted_and_renamed_files(tmp_path):
+    write(tmp_path, {"old.py": SOURCE.encode(), "gone.py": b"bye\n"})
+    patch = (
+        "diff --git a/new.py b/new.py\nnew file mode 100644\n--- /dev/null\n+++ b/new.py\n@@ -0,0 +1,2 @@\n+one\n+two\n"
+        "diff --git a/gone.py b/gone.py\ndeleted file mode 100644\n--- a/gone.py\n+++ /dev/null\n@@ -1 +0,0 @@\n-bye\n"
+        "diff --git a/old.py b/moved.py\nsimilarity index 90%\nrename from old.py\nrename to moved.py\n"
+        "--- a/old.py\n+++ b/moved.py\n@@ -1,3 +1,3 @@\n-line 1\n+LINE 1\n line 2\n line 3\n"
+    )
+
+    outcome = apply_patch(parse_patch(patch), tmp_path)
+
+    assert outcome.ok
+    assert snapshot(tmp_path) == {
+        "moved.py": SOURCE.replace("line 1\n", "LINE 1\n").encode(),
+        "new.py": b"one\ntwo\n",
+    }
+
+
+def test_new_file_that_already_exists_is_refused(tmp_path):
+    write(tmp_path, {"new.py": b"keep\n"})
+    patch = "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1 @@\n+one\n"
+
+    outcome = apply_patch(parse_patch(patch), tmp_path)
+
+    assert not outcome.ok and outcome.errors == ["new.py: file already exists"]
+    assert (tmp_path / "new.py").read_bytes() == b"keep\n"
+
+
+@pytest.mark.parametrize("path", ["../outside.py", "pkg/../../outside.py", "/etc/passwd", ".git/config"])
+def test_paths_outside_the_repository_are_refused(tmp_path, path):
+    root = tmp_path / "repo"
+    write(root, {"a.py": SOURCE.encode()})
+    patch = f"--- /dev/null\n+++ b/{path}\n@@ -0,0 +1 @@\n+owned\n"
+
+    outcome = apply_patch(parse_patch(patch), root)
+
+    assert not outcome.ok
+    assert outcome.errors == [f"{path}: path escapes the repository"]
+    assert snapshot(tmp_path) == {"repo/a.py": SOURCE.encode()}
+
+
+def test_check_patch_leaves_the_tree_untouched(tmp_path):
+    write(tmp_path, {"a.py": SOURCE.encode(), "gone.py": b"bye\n"})
+    patch = edit_patch("a.py", 4, ["line 4", "line 5"], "line 6", "LINE 6", ["line 7", "line 8"]) + (
+        "--- a/gone.py\n+++ /dev/null\n@@ -1 +0,0 @@\n-bye\n--- /dev/null\n+++ b/new.py\n@@ -0,0 +1 @@\n+one\n"
+    )
+    before = snapshot(tmp_path)
+
+    planned, errors = check_patch(parse_patch(patch), tmp_path)
+
+    assert errors == []
+    assert planned == {"a.py": SOURCE.replace("line 6\n", "LINE 6\n"), "gone.py": None, "new.py": "one\n"}
+    assert snapshot(tmp_path) == before
+    assert apply_patch(parse_patch(patch), tmp_path, dry_run=True).ok
+    assert snapshot(tmp_path) == before
@@ -0,0 +1,86 @@
+import shutil
+
+import pytest
+
+from benchmarks.fake_responses import FakeResponses, auto_reply
+from scripts.ai_diff import parse_unified_diff
+from scripts.ai_metrics import Metrics, use_metrics
+from scripts.ai_review import load_review_config, run_agents_ai, run_review
+from tests.conftest import ROOT_DIR
+
+MOD = 'def area(w, h):\n    """Area of a box."""\n    return w * h\n'
+OTHER = 'def perimeter(w, h):\n    """Perimeter of a box."""\n    return 2 * (w + h)\n'
+
+
+@pytest.fixture
+def fake_api(monkeypatch, tmp_path):
+    prompts: list[str] = []
+
+    def reply(request: dict) -> dict:
+        prompts.append(request["input"])
+        return auto_reply(request)
+
+    fake = FakeResponses(reply)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", fake.start())
+    monkeypatch.setenv("AI_CACHE_DISABLE", "1")
+    monkeypatch.setenv("AI_REVIEW_STATE_DIR", str(tmp_path / "state"))
+    yield prompts
+    fake.stop()
+
+
+def review(base: str, head: str) -> dict:
+    with use_metrics(Metrics()):
+        return run_review(base, head, pr_number="7")
+
+
+def test_incremental_files_reviewed_excludes_triaged_files(commit_files, fake_api):
+    # Policy, prompts and rules are read from the working directory.
+    shutil.copytree(ROOT_DIR / "config", "config")
+    base = commit_files({".gitignore": b".ai_cache/\n", "mod.py": MOD.encode(), "other.py": OTHER.encode()})
+    first = commit_files({"mod.py": MOD.replace("w * h", "w * h * 1").encode(), "other.py": (OTHER + "\n").encode()})
+    assert review(base, first)["review_mode"] == "full"
+
+    # The next push edits code in mod.py but only the docstring in other.py.
+    second = commit_files(
+        {
+            "mod.py": MOD.replace("w * h", "h * w").encode(),
+            "other.py": (OTHER.replace("Perimeter", "Outline") + "\n").encode(),
+        }
+    )
+    fake_api.clear()
+    result = review(base, second)
+
+    assert result["review_mode"] == "incremental"
+    assert result["incremental"]["previous_head"] == first
+    assert result["incremental"]["files_reviewed"] == ["mod.py"]
+    assert fake_api and all('"other.py"' not in prompt for prompt in fake_api if "[AGENT TASK]" in prompt)
+
+
+@pytest.mark.parametrize(
+    "order, stopped",
+    [
+        # SecurityAgent reports a blocking finding; run one call at a time, the agents after it are skipped.
+        (["SecurityAgent", "PerformanceAgent", "StyleAgent"], True),
+        # As the last call there is nothing left to stop.
+        (["PerformanceAgent", "StyleAgent", "SecurityAgent"], False),
+    ],
+)
+def test_early_stop_details_only_when_calls_were_cut_short(git_repo, fake_api, order, stopped):
+    shutil.copytree(ROOT_DIR / "config", "config")
+    policy, agent_prompts, routing = load_review_config()
+    review_cfg = {**policy["review"], "agents_order": order, "max_concurrency": 1}
+    policy = {**policy, "review": review_cfg}
+    routing = {**routing, "stop_on_blocking": True, "file_routes": {}}
+    diff = "--- a/mod.py\n+++ b/mod.py\n@@ -1 +1 @@\n-x = 1\n+x = 2\n"
+    stats: dict = {}
+
+    with use_metrics(Metrics()):
+        _, details, blocking, _, _ = run_agents_ai(
+            policy, agent_prompts, ["mod.py"], parse_unified_diff(diff), [], stats, routing
+        )
+
+    assert blocking
+    assert stats["early_stop"]["agent"] == "SecurityAgent"
+    assert any(line.startswith("[EarlyStop]") for line in details) is stopped
+    assert len(fake_api) == (1 if stopped else 3)
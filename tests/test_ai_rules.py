@@ -0,0 +1,34 @@
+from scripts.ai_rules import HeuristicRule, RuleEngine
+
+
+def rule(rule_id: str, pattern: str, **kwargs) -> HeuristicRule:
+    return HeuristicRule(id=rule_id, agent="BugRiskAgent", level="warning", message=rule_id, pattern=pattern, **kwargs)
+
+
+def fired(engine: RuleEngine, lines: list[str]) -> list[tuple[str, int]]:
+    return [(r.id, line_no) for r, line_no in engine.scan(lines)]
+
+
+def test_overlapping_matches_fire_every_rule():
+    engine = RuleEngine([rule("eval", r"eval\("), rule("eval-input", r"eval\(input"), rule("input", r"input\(\)")])
+
+    assert fired(engine, ["x = 1", "value = eval(input())"]) == [("eval", 2), ("eval-input", 2), ("input", 2)]
+
+
+def test_backreferences_keep_their_own_groups():
+    engine = RuleEngine([rule("quote", r"(['\"])x"), rule("repeat", r"(\w+) \1")])
+
+    assert fired(engine, ["a = 'x'", "b = foo foo", "c = foo bar"]) == [("quote", 1), ("repeat", 2)]
+
+
+def test_ignore_case_and_global_flags():
+    engine = RuleEngine([rule("todo", "todo", ignore_case=True), rule("fixme", "(?i)fixme")])
+
+    assert fired(engine, ["# TODO later", "# FixMe now", "# done"]) == [("todo", 1), ("fixme", 2)]
+
+
+def test_file_scope_and_max_hits():
+    engine = RuleEngine([rule("license", "Copyright", scope="file"), rule("print", r"print\(", max_hits=2)])
+
+    lines = ["# Copyright", "print(1)", "# Copyright", "print(2)", "print(3)"]
+    assert fired(engine, lines) == [("license", 1), ("print", 2), ("print", 4)]
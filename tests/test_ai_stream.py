@@ -0,0 +1,146 @@
+import json
+
+import pytest
+
+from scripts.ai_common import parse_json_from_text, read_stream
+from scripts.ai_metrics import Metrics, use_metrics
+from scripts.ai_stream import StreamingJSONParser, consume_stream
+
+REVIEW = {
+    "notes": [{"path": "not-a-finding.py"}],
+    "comments": [
+        {
+            "path": 'dir/"quoted".py',
+            "line": 3,
+            "body": 'escapes: \\ and "quotes", brackets } ] { [ and café',
+            "tags": ["a", {"nested": [1, [2, 3]]}],
+            "fix": {"old": "}", "new": "]"},
+        },
+        {"path": "b.py", "line": 1, "body": "ok"},
+    ],
+    "summary": "done",
+    "blocking": False,
+}
+# ensure_ascii turns the accent into a \u escape, so the splits below also land inside one.
+TEXT = json.dumps(REVIEW, ensure_ascii=True)
+
+
+def sse(deltas: list[str], completed: bool = True) -> list[bytes]:
+    events = [{"type": "response.output_text.delta", "delta": delta} for delta in deltas]
+    if completed:
+        events.append({"type": "response.completed", "response": {"usage": {"input_tokens": 10, "output_tokens": 5}}})
+    lines: list[bytes] = []
+    for event in events:
+        lines += [b"data: " + json.dumps(event).encode(), b""]
+    return lines
+
+
+def split(text: str, size: int) -> list[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class FakeResponse:
+    def __init__(self, lines: list[bytes]) -> None:
+        self.lines = lines
+        self.closed = False
+
+    def iter_lines(self, chunk_size=None):
+        return iter(self.lines)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def read(lines: list[bytes]) -> tuple[dict | None, list[dict], bool]:
+    resp = FakeResponse(lines)
+    with use_metrics(Metrics()) as metrics:
+        parsed = read_stream(resp, {}, None, "agent", "model", 0.0, 0, None, None)
+    return parsed, metrics.calls, resp.closed
+
+
+def test_chunk_boundaries_anywhere():
+    # Two-way splits at every offset cover boundaries inside keys, strings and each escape sequence.
+    for cut in range(len(TEXT) + 1):
+        parser = StreamingJSONParser()
+        items = parser.feed(TEXT[:cut]) + parser.feed(TEXT[cut:])
+        assert items == REVIEW["comments"], cut
+        assert parser.result() == REVIEW
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_fixed_size_chunks(size):
+    parser = StreamingJSONParser()
+    items = [item for chunk in split(TEXT, size) for item in parser.feed(chunk)]
+
+    assert items == REVIEW["comments"]
+    assert parser.complete and parser.result() == REVIEW
+
+
+def test_each_finding_is_emitted_when_it_closes():
+    parser = StreamingJSONParser()
+    second = TEXT.index('{"path": "b.py"')
+
+    assert parser.feed(TEXT[:second]) == REVIEW["comments"][:1]
+    assert parser.feed(TEXT[second:]) == REVIEW["comments"][1:]
+
+
+def test_stream_matches_the_non_streaming_parse():
+    outcome = consume_stream(sse(split(TEXT, 9)))
+
+    assert outcome.completed and not outcome.aborted
+    assert outcome.text == TEXT
+    assert outcome.items == REVIEW["comments"]
+    assert outcome.parsed == parse_json_from_text(TEXT)
+    assert outcome.usage == {"input_tokens": 10, "output_tokens": 5}
+
+
+def test_on_item_can_abort_the_stream():
+    outcome = consume_stream(sse(split(TEXT, 9)), on_item=lambda item: item["line"] == 3)
+
+    assert outcome.aborted and not outcome.completed
+    assert outcome.items == REVIEW["comments"][:1]
+
+
+def test_read_stream_returns_the_streamed_review():
+    parsed, calls, closed = read(sse(split(TEXT, 11)))
+
+    assert parsed == REVIEW
+    assert [c["status"] for c in calls] == ["200"] and closed
+
+
+def test_invalid_stream_falls_back_to_the_full_body_parse():
+    # Prose with braces ahead of the JSON: the incremental parser locks onto "{draft}" and fails.
+    text = "Here is the {draft} review:\n```json\n" + TEXT + "\n```"
+    outcome = consume_stream(sse(split(text, 13)))
+
+    assert outcome.completed and outcome.parsed is None
+    parsed, calls, _ = read(sse(split(text, 13)))
+    assert parsed == REVIEW
+    assert [c["status"] for c in calls] == ["200"]
+
+
+def test_stream_without_completion_still_parses_a_closed_object():
+    parsed, calls, _ = read(sse(split(TEXT, 17), completed=False))
+
+    assert parsed == REVIEW
+    assert [c["status"] for c in calls] == ["200"]
+
+
+def test_truncated_stream_is_not_parsed_from_an_inner_object():
+    cut = TEXT.index('{"path": "b.py"') + 10
+    outcome = consume_stream(sse(split(TEXT[:cut], 7), completed=False))
+
+    assert not outcome.completed and outcome.parsed is None
+    assert outcome.items == REVIEW["comments"][:1]
+    parsed, calls, closed = read(sse(split(TEXT[:cut], 7), completed=False))
+    assert parsed is None
+    assert [c["status"] for c in calls] == ["stream_truncated"] and closed
+
+
+def test_failed_stream_returns_nothing():
+    lines = sse(split(TEXT[:40], 7), completed=False) + [b'data: {"type": "response.failed"}', b""]
+
+    assert consume_stream(lines).failed
+    parsed, calls, _ = read(lines)
+    assert parsed is None
+    assert [c["status"] for c in calls] == ["stream_failed"]
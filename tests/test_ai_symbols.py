@@ -0,0 +1,27 @@
+from scripts.ai_symbols import SymbolIndex, symbol_context, symbols_config
+
+BOM = b"\xef\xbb\xbf"
+
+
+def test_index_parses_file_with_bom(commit_files, tmp_path):
+    head = commit_files({"mod.py": BOM + b"import os\n\n\ndef helper():\n    return os.sep\n"})
+
+    entry = SymbolIndex(head, tmp_path / "symbols").load(["mod.py"])["mod.py"]
+
+    assert not entry.get("error")
+    assert [d[1] for d in entry["defs"]] == ["helper"]
+
+
+def test_definition_snippet_from_bom_file(commit_files, tmp_path):
+    head = commit_files(
+        {
+            "mod.py": BOM + b"import os\n\n\ndef helper():\n    return os.sep\n",
+            "caller.py": b"from mod import helper\n\nvalue = helper()\n",
+        },
+    )
+
+    snippets = symbol_context(SymbolIndex(head, tmp_path / "symbols"), {"caller.py": [3]}, symbols_config({}))
+
+    definitions = [s for s in snippets if s["kind"] == "definition"]
+    assert [(s["path"], s["symbol"], s["line"]) for s in definitions] == [("mod.py", "helper", 4)]
+    assert definitions[0]["code"] == "def helper():\n    return os.sep"
@@ -0,0 +1,37 @@
+from scripts.ai_common import stream_git
+from scripts.ai_diff import iter_file_diffs
+from scripts.ai_triage import triage_config, triage_file_diffs
+
+BOM = b"\xef\xbb\xbf"
+SOURCE = 'import os\n\n\ndef helper():\n    """Separator of the platform."""\n    return os.sep\n'
+
+
+def triage_range(base: str, head: str) -> dict[str, str]:
+    file_diffs = iter_file_diffs(stream_git(["diff", base, head]), keep_lines=False)
+    return triage_file_diffs(file_diffs, triage_config({}), base, head).files
+
+
+def test_docstring_change_in_bom_file_is_docs(commit_files):
+    base = commit_files({"mod.py": BOM + SOURCE.encode()})
+    head = commit_files({"mod.py": BOM + SOURCE.replace("platform", "OS").encode()})
+
+    assert triage_range(base, head) == {"mod.py": "docs"}
+
+
+def test_code_change_in_bom_file_is_logic(commit_files):
+    base = commit_files({"mod.py": BOM + SOURCE.encode()})
+    head = commit_files({"mod.py": BOM + SOURCE.replace("os.sep", "os.pathsep").encode()})
+
+    assert triage_range(base, head) == {"mod.py": "logic"}
+
+
+def test_code_under_docs_is_not_documentation(commit_files):
+    files = {
+        "docs/conf.py": "project = 'a'\n",
+        "pkg/docs/gen.py": "def gen():\n    return 'a'\n",
+        "docs/guide.txt": "a\n",
+    }
+    base = commit_files({path: text.encode() for path, text in files.items()})
+    head = commit_files({path: text.replace("a", "b").encode() for path, text in files.items()})
+
+    assert triage_range(base, head) == {"docs/conf.py": "logic", "pkg/docs/gen.py": "logic", "docs/guide.txt": "docs"}
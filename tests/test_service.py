@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.review as review_api
+import app.main as service
+from scripts.ai_common import _limiter
+from scripts.ai_metrics import METRICS, _active
+
+
+@pytest.fixture
+def client(monkeypatch):
+    load = service.load_review_config
+
+    def small_pool():
+        policy, agent_prompts, routing = load()
+        policy = {**policy, "service": {"workers": 1, "queue_size": 1, "max_in_flight_requests": 2}}
+        return policy, agent_prompts, routing
+
+    monkeypatch.setattr(service, "load_review_config", small_pool)
+    monkeypatch.delenv("AI_SERVICE_TOKEN", raising=False)
+    with TestClient(service.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def fake_review(monkeypatch):
+    # Stands in for run_review; each call records what the job was bound to and can be held open.
+    release = threading.Event()
+    release.set()
+    seen: list[dict] = []
+
+    def run_review(base_sha, head_sha, diff, pr_number, config, keep_state=True):
+        seen.append({"limiter": _limiter.get(), "metrics": _active.get()})
+        METRICS.count("fake_calls")
+        release.wait(10)
+        return {"status": "pass", "base_sha": base_sha, "head_sha": head_sha, "comments": []}
+
+    monkeypatch.setattr(review_api, "run_review", run_review)
+    return release, seen
+
+
+def wait_for(client: TestClient, job_id: str, status: str = "done") -> dict:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {status}: {job}")
+
+
+def test_submit_poll_done(client, fake_review):
+    _, seen = fake_review
+
+    first = client.post("/review", json={"base_sha": "a" * 40, "head_sha": "b" * 40})
+    assert first.status_code == 202 and first.json()["status"] == "queued"
+    job = wait_for(client, first.json()["job_id"])
+    assert job["result"]["head_sha"] == "b" * 40
+    second = client.post("/review", json={"diff": "--- a/x\n+++ b/x\n"})
+    wait_for(client, second.json()["job_id"])
+
+    # Both jobs share the limiter built at startup but count into their own metrics.
+    limiter = client.app.state.jobs.limiter
+    assert [s["limiter"] for s in seen] == [limiter, limiter]
+    assert limiter.slots is not None
+    assert seen[0]["metrics"] is not seen[1]["metrics"]
+    assert [s["metrics"].counter("fake_calls") for s in seen] == [1, 1]
+
+
+def test_review_requires_a_range_or_diff(client, fake_review):
+    assert client.post("/review", json={"base_sha": "a" * 40}).status_code == 422
+
+
+def test_wrong_token_is_rejected(client, fake_review, monkeypatch):
+    monkeypatch.setenv("AI_SERVICE_TOKEN", "secret")
+    body = {"base_sha": "a" * 40, "head_sha": "b" * 40}
+
+    assert client.post("/review", json=body, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.post("/review", json=body).status_code == 401
+    assert client.get("/jobs", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.post("/review", json=body, headers={"Authorization": "Bearer secret"}).status_code == 202
+
+
+def test_autofix_of_unfinished_review_is_409(client, fake_review):
+    release, _ = fake_review
+    release.clear()
+    try:
+        job_id = client.post("/review", json={"base_sha": "a" * 40, "head_sha": "b" * 40}).json()["job_id"]
+        wait_for(client, job_id, "running")
+
+        response = client.post("/autofix", json={"review_job_id": job_id})
+
+        assert response.status_code == 409
+        assert client.post("/autofix", json={"review_job_id": "missing"}).status_code == 409
+    finally:
+        release.set()
+
+
+def test_full_queue_is_503(client, fake_review):
+    release, _ = fake_review
+    release.clear()
+    body = {"base_sha": "a" * 40, "head_sha": "b" * 40}
+    try:
+        running = client.post("/review", json=body).json()["job_id"]
+        wait_for(client, running, "running")
+        assert client.post("/review", json=body).status_code == 202
+
+        response = client.post("/review", json=body)
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+    finally:
+        release.set()
+    wait_for(client, running)